@@ -0,0 +1,287 @@
+import argparse
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+import columnar
+import db
+import queries
+from metrics import metrics
+
+# Positions newer than this are left for a later refresh, so reports that
+# arrive a little late still land before the watermark passes them
+LATENESS = timedelta(minutes=2)
+# Positions folded into the rollups per transaction
+BATCH = timedelta(hours=1)
+# A report accounts for the time since the drone's previous one, up to this
+MAX_GAP_SECONDS = 60
+# A drone this close to a restricted area counts as near it
+NEAR_METERS = 200
+# Heatmap grid cell size in degrees (~550 m north-south)
+CELL_DEGREES = 0.005
+M_PER_DEG_LAT = 111320.0
+# Pilots listed in the analytics view
+TOP_PILOTS = 50
+
+WATERMARK = 'positions'
+
+PILOT_COLUMNS = ['pilot_id', 'first_name', 'last_name', 'drones', 'active_hours', 'reports']
+ZONE_COLUMNS = ['zone_key', 'zone_name', 'severity', 'drones', 'dwell_minutes', 'reports']
+HEATMAP_COLUMNS = ['latitude', 'longitude', 'reports']
+HOURLY_COLUMNS = ['hour', 'reports']
+
+# Held for the whole batch, so concurrent refreshes take turns
+LOCK_WATERMARK_QUERY = "SELECT watermark FROM analytics_watermark WHERE name = %(name)s FOR UPDATE;"
+
+ADVANCE_WATERMARK_QUERY = """
+UPDATE analytics_watermark
+SET watermark = %(end)s, updated_at = CURRENT_TIMESTAMP
+WHERE name = %(name)s;
+"""
+
+# Reports without a pilot are attributed to the drone's registered pilot
+PILOT_ROLLUP_QUERY = """
+INSERT INTO pilot_drone_hourly (hour, pilot_id, drone_id, reports)
+SELECT date_trunc('hour', d.created_at), COALESCE(d.pilot_id, f.pilot_id), d.drone_id, COUNT(*)
+FROM drones d
+LEFT JOIN fleet f ON f.drone_id = d.drone_id
+WHERE d.created_at >= %(start)s AND d.created_at < %(end)s
+AND COALESCE(d.pilot_id, f.pilot_id) IS NOT NULL
+GROUP BY 1, 2, 3
+ON CONFLICT (hour, pilot_id, drone_id) DO UPDATE SET
+    reports = pilot_drone_hourly.reports + EXCLUDED.reports;
+"""
+
+# Zones become built-in polygons in a plane where a degree of longitude is
+# scaled to the length of a degree of latitude, so point <-> polygon
+# distances are in degrees of latitude (0 inside). The padded bounding box
+# rules out most reports before the (much slower) distance is computed.
+# Each report accounts for the time since the drone's previous report, up
+# to max_gap. For its first report in the batch the previous one is looked
+# up before `start` (once per drone, within max_gap: anything older gives
+# max_gap anyway), so dwell across batch boundaries adds up the same as in
+# one big batch.
+ZONE_DWELL_ROLLUP_QUERY = """
+WITH zones AS MATERIALIZED (
+    SELECT
+        a.zone_key,
+        a.valid_from,
+        a.valid_until,
+        s.k,
+        ('(' || string_agg(format('(%%s,%%s)', (v.point->>1)::DOUBLE PRECISION * s.k, v.point->>0), ',' ORDER BY v.n) || ')')::POLYGON AS shape,
+        MIN((v.point->>0)::DOUBLE PRECISION) - %(near_degrees)s AS south,
+        MAX((v.point->>0)::DOUBLE PRECISION) + %(near_degrees)s AS north,
+        MIN((v.point->>1)::DOUBLE PRECISION) - %(near_degrees)s / s.k AS west,
+        MAX((v.point->>1)::DOUBLE PRECISION) + %(near_degrees)s / s.k AS east
+    FROM restricted_areas a
+    CROSS JOIN LATERAL (SELECT cos(radians((a.coordinates->0->>0)::DOUBLE PRECISION)) AS k) s
+    CROSS JOIN LATERAL jsonb_array_elements(a.coordinates) WITH ORDINALITY AS v(point, n)
+    GROUP BY a.zone_key, a.valid_from, a.valid_until, s.k
+), positions AS (
+    SELECT
+        drone_id,
+        created_at,
+        latitude,
+        longitude,
+        COALESCE(
+            LEAST(
+                EXTRACT(EPOCH FROM created_at - COALESCE(
+                    LAG(created_at) OVER (PARTITION BY drone_id ORDER BY created_at),
+                    (
+                        SELECT MAX(b.created_at) FROM drones b
+                        WHERE b.drone_id = w.drone_id
+                        AND b.created_at >= %(start)s - make_interval(secs => %(max_gap)s)
+                        AND b.created_at < %(start)s
+                    )
+                )),
+                %(max_gap)s
+            ),
+            %(max_gap)s
+        ) AS gap
+    FROM drones w
+    WHERE created_at >= %(start)s AND created_at < %(end)s
+)
+INSERT INTO zone_dwell_hourly (hour, zone_key, drone_id, seconds, reports)
+SELECT date_trunc('hour', p.created_at), z.zone_key, p.drone_id, SUM(p.gap), COUNT(*)
+FROM positions p
+JOIN zones z
+    ON p.latitude BETWEEN z.south AND z.north
+    AND p.longitude BETWEEN z.west AND z.east
+    AND (z.valid_from IS NULL OR z.valid_from <= p.created_at)
+    AND (z.valid_until IS NULL OR p.created_at < z.valid_until)
+    AND point(p.longitude * z.k, p.latitude) <-> z.shape <= %(near_degrees)s
+GROUP BY 1, 2, 3
+ON CONFLICT (hour, zone_key, drone_id) DO UPDATE SET
+    seconds = zone_dwell_hourly.seconds + EXCLUDED.seconds,
+    reports = zone_dwell_hourly.reports + EXCLUDED.reports;
+"""
+
+ACTIVITY_ROLLUP_QUERY = """
+INSERT INTO activity_hourly (hour, cell_row, cell_col, reports)
+SELECT date_trunc('hour', created_at), floor(latitude / %(cell)s)::INTEGER, floor(longitude / %(cell)s)::INTEGER, COUNT(*)
+FROM drones
+WHERE created_at >= %(start)s AND created_at < %(end)s
+GROUP BY 1, 2, 3
+ON CONFLICT (hour, cell_row, cell_col) DO UPDATE SET
+    reports = activity_hourly.reports + EXCLUDED.reports;
+"""
+
+ROLLUP_QUERIES = (PILOT_ROLLUP_QUERY, ZONE_DWELL_ROLLUP_QUERY, ACTIVITY_ROLLUP_QUERY)
+
+WATERMARK_QUERY = "SELECT watermark FROM analytics_watermark WHERE name = %(name)s;"
+
+RESET_QUERIES = (
+    "TRUNCATE pilot_drone_hourly, zone_dwell_hourly, activity_hourly;",
+    """
+    UPDATE analytics_watermark
+    SET watermark = (SELECT COALESCE(date_trunc('hour', MIN(created_at)), date_trunc('hour', LOCALTIMESTAMP)) FROM drones),
+        updated_at = CURRENT_TIMESTAMP
+    WHERE name = %(name)s;
+    """,
+)
+
+
+def _rollup_batch(until, batch):
+    """Fold the next batch below `until` into the rollups and advance the
+    watermark, in one transaction. Returns the batch end, or None when
+    caught up."""
+    with db.transaction() as cur:
+        cur.execute(LOCK_WATERMARK_QUERY, {'name': WATERMARK})
+        start = cur.fetchone()[0]
+        if start >= until:
+            return None
+        end = min(start + batch, until)
+        params = {
+            'start': start,
+            'end': end,
+            'max_gap': MAX_GAP_SECONDS,
+            'near_degrees': NEAR_METERS / M_PER_DEG_LAT,
+            'cell': CELL_DEGREES,
+        }
+        for query in ROLLUP_QUERIES:
+            cur.execute(query, params)
+        cur.execute(ADVANCE_WATERMARK_QUERY, {'name': WATERMARK, 'end': end})
+        return end
+
+
+def refresh(until=None, batch=BATCH, max_batches=None):
+    """Bring the rollups up to `until` (default: now minus LATENESS).
+
+    Only positions between the watermark and `until` are read, a batch at a
+    time; an interrupted refresh resumes where it stopped. Positions that
+    arrive with a timestamp already below the watermark are not counted
+    until rebuild(). Returns the number of batches folded in.
+    """
+    until = until or datetime.now() - LATENESS
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        started = time.perf_counter()
+        if _rollup_batch(until, batch) is None:
+            break
+        metrics.observe('analytics_batch_seconds', time.perf_counter() - started)
+        batches += 1
+    metrics.count('analytics_batches', batches)
+    return batches
+
+
+def rebuild():
+    """Empty the rollups and move the watermark back to the first position;
+    the next refresh() recomputes everything (e.g. after zones changed)."""
+    with db.transaction() as cur:
+        cur.execute(LOCK_WATERMARK_QUERY, {'name': WATERMARK})
+        for query in RESET_QUERIES:
+            cur.execute(query, {'name': WATERMARK})
+
+
+def watermark():
+    with db.transaction() as cur:
+        cur.execute(WATERMARK_QUERY, {'name': WATERMARK})
+        return cur.fetchone()[0]
+
+
+class Refresher(threading.Thread):
+    """Calls refresh() every `every` seconds, so a dashboard process keeps the
+    rollups current without running a catch-up inside a page view. The
+    watermark row lock keeps it safe next to other processes and cron."""
+
+    def __init__(self, every):
+        super().__init__(daemon=True, name='analytics-refresher')
+        self.every = every
+        self.batches = 0
+        self.errors = 0
+        self._stopping = threading.Event()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self.join(timeout)
+
+    def run(self):
+        while not self._stopping.is_set():
+            try:
+                self.batches += refresh()
+            except Exception as e:
+                self.errors += 1
+                print(f"Error refreshing analytics: {e}", file=sys.stderr)
+            self._stopping.wait(self.every)
+
+
+_refresher = None
+_lock = threading.Lock()
+
+
+def start_refresher(every):
+    """Start the process-wide Refresher on first use; later calls return it."""
+    global _refresher
+    with _lock:
+        if _refresher is None:
+            _refresher = Refresher(every)
+            _refresher.start()
+        return _refresher
+
+
+def pilot_activity(start, end, limit=TOP_PILOTS):
+    """Drones flown, active hours and reports per pilot over [start, end)."""
+    return columnar.fetch_frame(queries.PILOT_ACTIVITY_QUERY, {'start': start, 'end': end, 'limit': limit})
+
+
+def zone_dwell(start, end):
+    """Drones and minutes spent within NEAR_METERS of each zone over [start, end)."""
+    return columnar.fetch_frame(queries.ZONE_DWELL_QUERY, {'start': start, 'end': end})
+
+
+def activity_heatmap(start, end):
+    """Reports per grid cell over [start, end), at the cell centres."""
+    return columnar.fetch_frame(queries.ACTIVITY_HEATMAP_QUERY, {'start': start, 'end': end, 'cell': CELL_DEGREES})
+
+
+def activity_by_hour(start, end):
+    return columnar.fetch_frame(queries.ACTIVITY_BY_HOUR_QUERY, {'start': start, 'end': end})
+
+
+if __name__ == "__main__":
+    # Meant to run from cron (or with --every as a small daemon) next to ingest
+    parser = argparse.ArgumentParser(description="Maintain the analytics rollups")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    refresh_parser = subparsers.add_parser("refresh", help="fold new positions into the rollups")
+    refresh_parser.add_argument("--every", type=float, help="keep running, refreshing every this many seconds")
+    subparsers.add_parser("rebuild", help="recompute the rollups from the whole history")
+    subparsers.add_parser("status", help="print the watermark")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "rebuild":
+            rebuild()
+            print(f"Rebuilt rollups in {refresh()} batches")
+        elif args.command == "status":
+            print(f"Rollups complete up to {watermark()}")
+        else:
+            while True:
+                batches = refresh()
+                print(f"Folded in {batches} batches; rollups complete up to {watermark()}")
+                if args.every is None:
+                    break
+                time.sleep(args.every)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,96 @@
+"""Time to first map in a fresh process, with and without the warm-start file.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_cold_start --repeat 5
+
+Each sample is a new Python process that imports the dashboard modules,
+gets the fleet snapshot and active zones, and renders the map HTML for
+the default viewport. `postgres` starts with no snapshot file and waits
+for the database; `file` starts from one saved by warm_start beforehand
+(and reconciles in the background). Uses the configured database.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+STARTED = time.monotonic()
+
+
+def child(save):
+    import live
+    import map_layers
+    import viewport
+    import warm_start
+    import zones
+
+    imported = time.monotonic()
+    snapshot = live.get_snapshot()
+    version, frame = snapshot.current()
+    active = zones.active_zones()
+    m = map_layers.base_map(active.geojson)
+    m.add_child(map_layers.MarkerSync().layer(viewport.select(frame, viewport.DEFAULT_BOUNDS), version))
+    m.get_root().render()
+    seconds = time.monotonic() - STARTED
+    if save:
+        # Wait for the database state, so the saved file holds it
+        while snapshot.restored_at is not None:
+            snapshot.wait_newer(snapshot.version, 1)
+        zones.get_registry().refresh(force=True)
+        warm_start.save(snapshot.current()[1], *zones.get_registry().compiled())
+    print(json.dumps({
+        'seconds': seconds,
+        'imports': imported - STARTED,
+        'restored': snapshot.restored_at is not None,
+        'drones': len(frame),
+    }))
+
+
+def sample(path, save=False):
+    env = dict(os.environ, SNAPSHOT_FILE=path)
+    command = [sys.executable, '-m', 'benchmarks.bench_cold_start', '--child'] + (['--save'] if save else [])
+    completed = subprocess.run(command, capture_output=True, text=True, env=env, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def run(repeat):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'fleet_snapshot.arrow')
+        missing = os.path.join(directory, 'missing.arrow')
+        cold = [sample(missing) for _ in range(repeat)]
+        sample(path, save=True)
+        warm = [sample(path) for _ in range(repeat)]
+        size = os.path.getsize(path)
+    return {
+        'postgres': float(np.median([r['seconds'] for r in cold])),
+        'file': float(np.median([r['seconds'] for r in warm])),
+        # Everything after the imports: snapshot, zones and map HTML
+        'postgres_data': float(np.median([r['seconds'] - r['imports'] for r in cold])),
+        'file_data': float(np.median([r['seconds'] - r['imports'] for r in warm])),
+        'restored': all(r['restored'] for r in warm),
+        'drones': cold[0]['drones'],
+        'file_bytes': size,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--save", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.save)
+        sys.exit(0)
+    r = run(args.repeat)
+    print(f"{'drones':>8} {'file MB':>8} {'postgres s':>11} {'file s':>8} {'after imports: postgres s':>26} {'file s':>8}")
+    print(f"{r['drones']:>8} {r['file_bytes'] / 1e6:>8.1f} {r['postgres']:>11.3f} {r['file']:>8.3f}"
+          f" {r['postgres_data']:>26.3f} {r['file_data']:>8.3f}"
+          + ("" if r['restored'] else "  (the database load finished first in some runs)"))
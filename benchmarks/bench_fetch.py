@@ -0,0 +1,98 @@
+"""Compare ways of fetching drone positions into a DataFrame.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_fetch --rows 10000 100000 1000000
+
+Rows are generated by the database itself (generate_series), shaped like
+the dashboard's latest-positions query, so no data has to be seeded.
+"""
+import argparse
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import columnar
+import db
+import geofence
+
+# Same columns and types as LATEST_POSITIONS_QUERY; every third drone has
+# no pilot
+SYNTHETIC_POSITIONS_QUERY = """
+SELECT
+    'SIM-' || lpad(i::TEXT, 7, '0') AS drone_id,
+    (51.0 + (i %% 3001) / 10000.0)::DOUBLE PRECISION AS latitude,
+    (71.2 + (i %% 5003) / 10000.0)::DOUBLE PRECISION AS longitude,
+    TIMESTAMP '2024-01-01' + i * INTERVAL '1 millisecond' AS created_at,
+    CASE WHEN i %% 3 = 0 THEN NULL ELSE i %% 1000 END AS pilot_id
+FROM generate_series(1, %(rows)s) AS i;
+"""
+
+
+def read_sql(rows):
+    # The dashboard's original path
+    with db.connection() as conn:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)
+            return pd.read_sql_query(SYNTHETIC_POSITIONS_QUERY, conn, params={'rows': rows})
+
+
+def fetchall(rows):
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(SYNTHETIC_POSITIONS_QUERY, {'rows': rows})
+            columns = [column.name for column in cur.description]
+            return pd.DataFrame(cur.fetchall(), columns=columns)
+
+
+def copy_arrow(rows):
+    return columnar.fetch_frame(SYNTHETIC_POSITIONS_QUERY, {'rows': rows})
+
+
+PATHS = {
+    'read_sql': read_sql,
+    'fetchall': fetchall,
+    'copy_arrow': copy_arrow,
+}
+
+
+def run(count, paths, repeat=3):
+    results = []
+    for name in paths:
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            frame = PATHS[name](count)
+            timings.append(time.perf_counter() - started)
+
+        # What the frame costs downstream: the geofence check reads the
+        # coordinate columns as float arrays
+        started = time.perf_counter()
+        geofence.find_violations(frame)
+        check_seconds = time.perf_counter() - started
+
+        results.append({
+            'path': name,
+            'rows': len(frame),
+            'seconds': float(np.median(timings)),
+            'rows_per_second': len(frame) / float(np.median(timings)),
+            'geofence_seconds': check_seconds,
+            'memory_mb': frame.memory_usage(deep=True).sum() / 2**20,
+        })
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--paths", nargs="+", choices=list(PATHS), default=list(PATHS))
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'path':>12} {'rows':>8} {'seconds':>9} {'rows/s':>10} {'geofence s':>11} {'MB':>8}")
+    for count in args.rows:
+        for r in run(count, args.paths, args.repeat):
+            print(f"{r['path']:>12} {r['rows']:>8} {r['seconds']:>9.3f} {r['rows_per_second']:>10.0f} "
+                  f"{r['geofence_seconds']:>11.3f} {r['memory_mb']:>8.1f}")
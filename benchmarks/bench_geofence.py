@@ -0,0 +1,74 @@
+"""Time the geofence engine on synthetic positions and zones.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_geofence --points 100000 --zones 1000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from geofence import Geofence
+
+# Roughly the Astana area the dashboard shows
+LAT_RANGE = (51.0, 51.3)
+LON_RANGE = (71.2, 71.7)
+
+
+def random_zones(count, rng, vertices=8):
+    # Star-shaped polygons of random size around random centres
+    areas = {}
+    for i in range(count):
+        center_lat = rng.uniform(*LAT_RANGE)
+        center_lon = rng.uniform(*LON_RANGE)
+        angles = np.sort(rng.uniform(0, 2 * np.pi, vertices))
+        radii = rng.uniform(0.001, 0.01, vertices)
+        ring = np.column_stack([center_lat + radii * np.sin(angles), center_lon + radii * np.cos(angles)])
+        areas[f'zone_{i}'] = {
+            'name': f'Zone {i}',
+            'description': '',
+            'coordinates': np.vstack([ring, ring[:1]]).tolist(),
+            'color': 'red' if i % 2 else 'orange',
+        }
+    return areas
+
+
+def run(points, zones, seed=0, repeat=3):
+    rng = np.random.default_rng(seed)
+    latitudes = rng.uniform(*LAT_RANGE, points)
+    longitudes = rng.uniform(*LON_RANGE, points)
+
+    started = time.perf_counter()
+    fence = Geofence(random_zones(zones, rng))
+    build_time = time.perf_counter() - started
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        point_idx, _ = fence.locate(latitudes, longitudes)
+        timings.append(time.perf_counter() - started)
+
+    return {
+        'points': points,
+        'zones': zones,
+        'build_seconds': build_time,
+        'locate_seconds': min(timings),
+        'points_per_second': points / min(timings),
+        'hits': len(point_idx),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--zones", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'points':>8} {'zones':>6} {'build s':>9} {'locate s':>9} {'points/s':>12} {'hits':>7}")
+    for zones in args.zones:
+        for points in args.points:
+            r = run(points, zones, args.seed)
+            print(f"{r['points']:>8} {r['zones']:>6} {r['build_seconds']:>9.4f} {r['locate_seconds']:>9.4f} "
+                  f"{r['points_per_second']:>12.0f} {r['hits']:>7}")
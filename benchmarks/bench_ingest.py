@@ -0,0 +1,93 @@
+"""Compare drone position write paths against the configured database.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_ingest --rows 1000 10000 100000
+
+Rows are written under a BENCH- drone id prefix and removed afterwards.
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import db
+import ingest
+import positions
+
+PER_ROW_INSERT_QUERY = """
+INSERT INTO drones (drone_id, latitude, longitude, created_at, pilot_id)
+VALUES (%s, %s, %s, %s, %s)
+ON CONFLICT (drone_id, created_at) DO NOTHING;
+"""
+
+
+def make_rows(count, prefix, seed=0):
+    rng = np.random.default_rng(seed)
+    now = datetime.now()
+    drones = max(count // 100, 1)
+    latitudes = 51.1694 + rng.uniform(-0.1, 0.1, count)
+    longitudes = 71.4491 + rng.uniform(-0.1, 0.1, count)
+    return [
+        (f'{prefix}{i % drones:05d}', float(latitudes[i]), float(longitudes[i]), now - timedelta(seconds=i), None)
+        for i in range(count)
+    ]
+
+
+def per_row(rows):
+    # The original seed_drones path: one execute per position
+    with db.transaction() as cur:
+        for row in rows:
+            cur.execute(PER_ROW_INSERT_QUERY, row)
+
+
+def execute_values(rows):
+    with db.transaction() as cur:
+        positions.record_positions(cur, rows)
+
+
+def copy(rows, batch_size=10000):
+    for batch in ingest.batches(rows, batch_size):
+        ingest.write_batch(batch)
+
+
+def cleanup(prefix):
+    with db.transaction() as cur:
+        cur.execute("DELETE FROM drones WHERE drone_id LIKE %s;", (prefix + '%',))
+        cur.execute("DELETE FROM drone_latest WHERE drone_id LIKE %s;", (prefix + '%',))
+        cur.execute("DELETE FROM fleet WHERE drone_id LIKE %s;", (prefix + '%',))
+
+
+PATHS = {
+    'per_row': per_row,
+    'execute_values': execute_values,
+    'copy': copy,
+}
+
+
+def run(count, paths):
+    results = []
+    for name in paths:
+        prefix = f'BENCH-{name}-'
+        rows = make_rows(count, prefix)
+        try:
+            started = time.perf_counter()
+            PATHS[name](rows)
+            seconds = time.perf_counter() - started
+        finally:
+            cleanup(prefix)
+        results.append({'path': name, 'rows': count, 'seconds': seconds, 'rows_per_second': count / seconds})
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--paths", nargs="+", choices=list(PATHS), default=list(PATHS))
+    args = parser.parse_args()
+
+    print(f"{'path':>15} {'rows':>8} {'seconds':>9} {'rows/s':>10}")
+    for count in args.rows:
+        for r in run(count, args.paths):
+            print(f"{r['path']:>15} {r['rows']:>8} {r['seconds']:>9.3f} {r['rows_per_second']:>10.0f}")
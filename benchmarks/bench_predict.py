@@ -0,0 +1,120 @@
+"""Time trajectory prediction for synthetic fleets.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_predict --drones 10000 100000
+
+Tracks come from fleet_generator.simulate_tracks (5% of drones fly into a
+restricted area), kept in memory, so no data has to be seeded. --check
+also compares the grid's proximity pairs with a brute-force search.
+--fetch also times prediction.load_recent, the read of the last
+HISTORY_SECONDS of reports that every dashboard cache miss runs, against
+the configured database.
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import prediction
+from fleet_generator import simulate_tracks, track_frame
+from geofence import Geofence
+from restricted_areas import RESTRICTED_AREAS
+
+# Seconds between simulated reports
+INTERVAL = 5
+
+
+def recent_reports(num_drones, seed=42):
+    """The last prediction.SAMPLES reports of every drone, ending now."""
+    rng = np.random.default_rng(seed)
+    hours = prediction.SAMPLES * INTERVAL / 3600
+    drone_ids = np.array([f'SIM-{i:06d}' for i in range(num_drones)])
+    frames = [
+        track_frame(drone_ids, np.zeros(num_drones, dtype=np.int64), timestamps, lat, lon)
+        for timestamps, lat, lon in simulate_tracks(num_drones, hours, INTERVAL, rng)
+    ]
+    return pd.concat(frames, ignore_index=True)[['drone_id', 'latitude', 'longitude', 'created_at']]
+
+
+def brute_force_pairs(x, y, radius):
+    i, j = np.triu_indices(len(x), k=1)
+    close = np.hypot(x[i] - x[j], y[i] - y[j]) <= radius
+    return set(zip(i[close].tolist(), j[close].tolist()))
+
+
+def check(motion, latitudes, radius):
+    # Same projection as prediction.conflicts, at the first step
+    lon_scale = prediction.M_PER_DEG_LAT * np.cos(np.radians(np.mean(latitudes[0])))
+    x = motion['longitude'].to_numpy() * lon_scale
+    y = motion['latitude'].to_numpy() * prediction.M_PER_DEG_LAT
+    i, j, _ = prediction.close_pairs(x, y, radius)
+    return set(zip(i.tolist(), j.tolist())) == brute_force_pairs(x, y, radius)
+
+
+def run(num_drones, fence, repeat=3, verify=False):
+    recent = recent_reports(num_drones)
+    at = recent['created_at'].max() + timedelta(seconds=INTERVAL)
+    stages = {'motion': [], 'extrapolate': [], 'approaches': [], 'conflicts': [], 'total': []}
+    for _ in range(repeat):
+        started = time.perf_counter()
+        motion = prediction.estimate_motion(recent)
+        stages['motion'].append(time.perf_counter() - started)
+
+        mark = time.perf_counter()
+        latitudes, longitudes = prediction.extrapolate(motion, at)
+        stages['extrapolate'].append(time.perf_counter() - mark)
+
+        mark = time.perf_counter()
+        approaches = prediction.zone_approaches(motion, latitudes, longitudes, fence)
+        stages['approaches'].append(time.perf_counter() - mark)
+
+        mark = time.perf_counter()
+        conflicts = prediction.conflicts(motion, latitudes, longitudes)
+        stages['conflicts'].append(time.perf_counter() - mark)
+        stages['total'].append(time.perf_counter() - started)
+
+    result = {
+        'drones': len(motion),
+        'reports': len(recent),
+        'approaches': len(approaches),
+        'conflicts': len(conflicts),
+        **{f'{name}_seconds': float(np.median(samples)) for name, samples in stages.items()},
+    }
+    if verify:
+        result['pairs_match'] = check(motion.head(5000), latitudes[:, :5000], prediction.PROXIMITY_METERS)
+    return result
+
+
+def time_fetch(repeat=3):
+    """(reports, median seconds) of prediction.load_recent ending now."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        recent = prediction.load_recent(datetime.now())
+        samples.append(time.perf_counter() - started)
+    return len(recent), float(np.median(samples))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--drones", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--check", action="store_true", help="verify proximity pairs against brute force (first 5000 drones)")
+    parser.add_argument("--fetch", action="store_true", help="also time the recent-reports read from the configured database")
+    args = parser.parse_args()
+
+    fence = Geofence(RESTRICTED_AREAS)
+    print(f"{'drones':>8} {'motion s':>9} {'extrap s':>9} {'zones s':>9} {'pairs s':>9} {'total s':>9} "
+          f"{'entries':>8} {'conflicts':>10}")
+    for count in args.drones:
+        r = run(count, fence, args.repeat, args.check)
+        print(f"{r['drones']:>8} {r['motion_seconds']:>9.3f} {r['extrapolate_seconds']:>9.3f} "
+              f"{r['approaches_seconds']:>9.3f} {r['conflicts_seconds']:>9.3f} {r['total_seconds']:>9.3f} "
+              f"{r['approaches']:>8} {r['conflicts']:>10}"
+              + (f"  pairs match: {r['pairs_match']}" if args.check else ""))
+    if args.fetch:
+        reports, seconds = time_fetch(args.repeat)
+        print(f"load_recent: {reports} reports of the last {prediction.HISTORY_SECONDS} s in {seconds:.3f} s")
@@ -0,0 +1,99 @@
+"""Measure the dashboard's startup and rerun overhead.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_startup --reruns 20
+
+`imports` is the time a fresh process takes to import everything main.py
+imports at the top level. `first run` and `rerun` run main.py through
+Streamlit's AppTest in a fresh process (live mode, default viewport);
+the first run includes those imports plus the once-per-process work
+(database probe, snapshot load). The database is the configured one.
+"""
+import argparse
+import ast
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+MAIN = Path(__file__).resolve().parent.parent / 'main.py'
+
+
+def top_level_imports(path=MAIN):
+    """Modules main.py imports unconditionally, in order."""
+    modules = []
+    for node in ast.parse(path.read_text()).body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            modules.append(node.module)
+    return modules
+
+
+def child_imports():
+    started = time.perf_counter()
+    for module in top_level_imports():
+        __import__(module)
+    print(json.dumps({'imports': time.perf_counter() - started}))
+
+
+def child_reruns(reruns):
+    started = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+
+    import db
+    from metrics import metrics
+
+    at = AppTest.from_file(str(MAIN), default_timeout=120).run()
+    first = time.perf_counter() - started
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+
+    samples = []
+    checkouts = db.pool_stats()['checkouts']
+    for _ in range(reruns):
+        mark = time.perf_counter()
+        at.run()
+        samples.append(time.perf_counter() - mark)
+    probes = metrics.summary()['series'].get('probe_seconds', {}).get('count', 0)
+    print(json.dumps({
+        'first_run': first,
+        'rerun_p50': float(np.median(samples)),
+        'rerun_max': max(samples),
+        'checkouts_per_rerun': (db.pool_stats()['checkouts'] - checkouts) / reruns,
+        'probes': probes,
+    }))
+
+
+def sample(*args):
+    command = [sys.executable, '-m', 'benchmarks.bench_startup', '--child'] + [str(arg) for arg in args]
+    completed = subprocess.run(command, capture_output=True, text=True, check=True, cwd=MAIN.parent)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reruns", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3, help="fresh processes per measurement")
+    parser.add_argument("--child", nargs="+", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        if args.child[0] == 'imports':
+            child_imports()
+        else:
+            child_reruns(int(args.child[1]))
+        sys.exit(0)
+
+    imports = [sample('imports')['imports'] for _ in range(args.repeat)]
+    runs = [sample('reruns', args.reruns) for _ in range(args.repeat)]
+    print(f"{'imports s':>10} {'first run s':>12} {'rerun p50 ms':>13} {'rerun max ms':>13} "
+          f"{'db checkouts/rerun':>19} {'probes':>7}")
+    print(f"{np.median(imports):>10.3f} {np.median([r['first_run'] for r in runs]):>12.3f} "
+          f"{np.median([r['rerun_p50'] for r in runs]) * 1000:>13.1f} "
+          f"{np.median([r['rerun_max'] for r in runs]) * 1000:>13.1f} "
+          f"{np.median([r['checkouts_per_rerun'] for r in runs]):>19.2f} {max(r['probes'] for r in runs):>7}")
@@ -0,0 +1,220 @@
+"""Stress the write path with concurrent writers, replays and dropped connections.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_write_stress --threads 16 --drones 50 --reports 100
+
+Every report carries an idempotency key and is submitted 1 + --replays
+times, in random order, by --threads writers sharing the connection pool;
+half of the batches go through positions.record_positions, half through
+ingest.write_batch. Some replays carry a later timestamp, like a client
+that re-stamped a retried report. Meanwhile another connection
+terminates the writers' backends every --kill-every seconds, so writes
+fail part-way and are retried (db.retrying, then the client).
+
+Afterwards every key must have exactly one history row, and drone_latest
+must hold each drone's newest row. Uses the configured database; rows are
+written under a STRESS- drone id prefix and removed afterwards. Exits 1
+if a position was lost or duplicated.
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import psycopg2
+
+PREFIX = 'STRESS-'
+APPLICATION_NAME = 'bench_write_stress'
+# Client-side retries of a batch after db.retrying gave up
+CLIENT_ATTEMPTS = 5
+
+# Set before db opens its pool, so the killer can tell the writers' backends apart
+os.environ['PGAPPNAME'] = APPLICATION_NAME
+
+import db  # noqa: E402
+import ingest  # noqa: E402
+import positions  # noqa: E402
+from metrics import metrics  # noqa: E402
+
+TERMINATE_QUERY = """
+SELECT COUNT(pg_terminate_backend(pid))
+FROM pg_stat_activity
+WHERE application_name = %s AND pid <> pg_backend_pid();
+"""
+
+# Keys with other than exactly one history row, and unmatched history rows
+VERIFY_KEYS_QUERY = """
+SELECT
+    (SELECT COUNT(*) FROM position_requests r
+     WHERE r.idempotency_key LIKE %(keys)s
+     AND (SELECT COUNT(*) FROM drones d WHERE d.drone_id = r.drone_id AND d.created_at = r.created_at) <> 1),
+    (SELECT COUNT(*) FROM position_requests WHERE idempotency_key LIKE %(keys)s),
+    (SELECT COUNT(*) FROM drones WHERE drone_id LIKE %(drones)s),
+    (SELECT COUNT(*) FROM (SELECT DISTINCT drone_id, created_at FROM drones WHERE drone_id LIKE %(drones)s) d);
+"""
+
+# Drones whose drone_latest entry isn't their newest history row
+VERIFY_LATEST_QUERY = """
+SELECT COUNT(*)
+FROM (
+    SELECT DISTINCT ON (drone_id) drone_id, latitude, longitude, created_at
+    FROM drones
+    WHERE drone_id LIKE %(drones)s
+    ORDER BY drone_id, created_at DESC
+) newest
+LEFT JOIN drone_latest l USING (drone_id)
+WHERE l.created_at IS DISTINCT FROM newest.created_at
+OR l.latitude IS DISTINCT FROM newest.latitude
+OR l.longitude IS DISTINCT FROM newest.longitude;
+"""
+
+
+def make_submissions(num_drones, reports, replays, run, seed=0):
+    """(unique reports, shuffled submissions); submissions are 6-tuples with the key last."""
+    rng = random.Random(seed)
+    start = datetime.now() - timedelta(seconds=reports)
+    unique = [
+        (f'{PREFIX}{d:04d}', 51.1694 + rng.uniform(-0.1, 0.1), 71.4491 + rng.uniform(-0.1, 0.1),
+         start + timedelta(seconds=i), None, f'{PREFIX}{run}-{d}-{i}')
+        for d in range(num_drones)
+        for i in range(reports)
+    ]
+    submissions = list(unique)
+    for report in unique:
+        for _ in range(replays):
+            # A third of the replays were re-stamped by the client on retry;
+            # still before the drone's next report
+            if rng.random() < 1 / 3:
+                submissions.append(report[:3] + (report[3] + timedelta(milliseconds=rng.randint(1, 999)),) + report[4:])
+            else:
+                submissions.append(report)
+    rng.shuffle(submissions)
+    return unique, submissions
+
+
+def write_with_positions(batch):
+    def work(cur):
+        return positions.record_positions(cur, [row[:5] for row in batch], keys=[row[5] for row in batch])
+    return db.retrying(work)
+
+
+def write_with_ingest(batch):
+    return ingest.write_batch(batch)
+
+
+def writer(batches, errors):
+    for number, batch in enumerate(batches):
+        write = write_with_positions if number % 2 == 0 else write_with_ingest
+        for attempt in range(CLIENT_ATTEMPTS):
+            try:
+                write(batch)
+                break
+            except db.TRANSIENT_ERRORS as e:
+                if attempt == CLIENT_ATTEMPTS - 1:
+                    errors.append(e)
+                metrics.count('client_retries')
+            except Exception as e:
+                errors.append(e)
+                break
+
+
+def killer(stopping, every, killed):
+    conn = psycopg2.connect(db.database_url())
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            while not stopping.wait(every):
+                cur.execute(TERMINATE_QUERY, (APPLICATION_NAME,))
+                killed.append(cur.fetchone()[0])
+    finally:
+        conn.close()
+
+
+def verify(run):
+    params = {'keys': f'{PREFIX}{run}-%', 'drones': PREFIX + '%'}
+    with db.transaction() as cur:
+        cur.execute(VERIFY_KEYS_QUERY, params)
+        bad_keys, keys, rows, distinct_rows = cur.fetchone()
+        cur.execute(VERIFY_LATEST_QUERY, params)
+        stale_latest = cur.fetchone()[0]
+    return {'keys': keys, 'rows': rows, 'bad_keys': bad_keys, 'duplicate_rows': rows - distinct_rows, 'stale_latest': stale_latest}
+
+
+def cleanup():
+    def work(cur):
+        for table in ('drones', 'drone_latest', 'fleet', 'position_requests'):
+            column = 'idempotency_key' if table == 'position_requests' else 'drone_id'
+            cur.execute(f"DELETE FROM {table} WHERE {column} LIKE %s;", (PREFIX + '%',))
+    db.retrying(work)
+
+
+def run(threads, num_drones, reports, replays, batch_size, kill_every):
+    run_id = uuid.uuid4().hex[:8]
+    unique, submissions = make_submissions(num_drones, reports, replays, run_id)
+    shares = [list(ingest.batches(submissions[i::threads], batch_size)) for i in range(threads)]
+    errors, killed = [], []
+    stopping = threading.Event()
+    workers = [threading.Thread(target=writer, args=(share, errors)) for share in shares]
+    kill_thread = threading.Thread(target=killer, args=(stopping, kill_every, killed)) if kill_every else None
+
+    cleanup()
+    try:
+        started = time.perf_counter()
+        if kill_thread:
+            kill_thread.start()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        seconds = time.perf_counter() - started
+        stopping.set()
+        if kill_thread:
+            kill_thread.join()
+        result = verify(run_id)
+    finally:
+        cleanup()
+
+    counters = metrics.summary()['counters']
+    result.update({
+        'reports': len(unique),
+        'submissions': len(submissions),
+        'seconds': seconds,
+        'submissions_per_second': len(submissions) / seconds,
+        'killed': sum(killed),
+        'db_retries': counters.get('db_retries', 0),
+        'client_retries': counters.get('client_retries', 0),
+        'errors': len(errors),
+    })
+    result['ok'] = (
+        result['keys'] == result['reports'] == result['rows']
+        and result['bad_keys'] == 0 and result['duplicate_rows'] == 0 and result['stale_latest'] == 0
+        and not errors
+    )
+    for e in errors[:5]:
+        print(f"Error: {e}", file=sys.stderr)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--drones", type=int, default=50, help="drones shared by all writers")
+    parser.add_argument("--reports", type=int, default=100, help="reports per drone")
+    parser.add_argument("--replays", type=int, default=2, help="extra submissions of every report")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--kill-every", type=float, default=0.2, help="seconds between terminating the writers' connections (0: never)")
+    args = parser.parse_args()
+
+    r = run(args.threads, args.drones, args.reports, args.replays, args.batch_size, args.kill_every)
+    print(f"{r['submissions']} submissions of {r['reports']} reports by {args.threads} threads in {r['seconds']:.2f} s "
+          f"({r['submissions_per_second']:.0f}/s); {r['killed']} connections killed, "
+          f"{r['db_retries']} transaction retries, {r['client_retries']} client retries")
+    print(f"history rows {r['rows']}, keys {r['keys']}, keys without exactly one row {r['bad_keys']}, "
+          f"duplicate rows {r['duplicate_rows']}, stale drone_latest {r['stale_latest']}, errors {r['errors']}")
+    print("OK: no position lost or duplicated" if r['ok'] else "FAILED")
+    sys.exit(0 if r['ok'] else 1)
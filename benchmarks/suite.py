@@ -0,0 +1,245 @@
+"""Benchmark the dashboard's hot paths on a throwaway Postgres.
+
+Run from the repository root:
+
+    python -m benchmarks.suite run --postgres pg_ctl --scales small medium --output new.json
+    python -m benchmarks.suite compare base.json new.json
+
+`run` starts a fresh database (initdb/pg_ctl, or the postgres-bench
+service of docker-compose.yml), migrates it, and for each scale seeds a
+synthetic fleet and times the read, render, write and delete paths.
+Results are written as JSON. `compare` matches two result files by
+(scale, benchmark) and exits non-zero when a p50 got slower than the
+threshold allows.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from benchmarks.postgres import throwaway_postgres
+
+# Fleet sizes; positions = drones * hours * 3600 / interval
+SCALES = {
+    'small': {'pilots': 100, 'drones': 1000, 'hours': 0.25, 'interval': 5},
+    'medium': {'pilots': 1000, 'drones': 10000, 'hours': 0.25, 'interval': 30},
+    'large': {'pilots': 5000, 'drones': 100000, 'hours': 0.1, 'interval': 36},
+}
+
+RESET_QUERY = "TRUNCATE drones, drone_latest, drone_positions_1m, fleet, pilots, pilot_drone_hourly, zone_dwell_hourly, activity_hourly RESTART IDENTITY CASCADE;"
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)] if values else 0.0
+
+
+def timings(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def result(scale, name, samples, rows=None):
+    return {
+        'scale': scale,
+        'name': name,
+        'n': len(samples),
+        'p50': percentile(samples, 0.5),
+        'p95': percentile(samples, 0.95),
+        'mean': float(np.mean(samples)),
+        'rows': rows,
+    }
+
+
+def bench_scale(scale, config, repeat):
+    # Imported here, after the fixture has set DATABASE_URL
+    import analytics
+    import columnar
+    import db
+    import fleet_generator
+    import fleet_registry
+    import geofence
+    import ingest
+    import live
+    import map_layers
+    import positions
+    import queries
+    import viewport
+
+    with db.transaction() as cur:
+        cur.execute(RESET_QUERY)
+
+    results = []
+    started = time.perf_counter()
+    rows = fleet_generator.seed_fleet(config['pilots'], config['drones'], config['hours'], config['interval'])
+    results.append(result(scale, 'seed_fleet', [time.perf_counter() - started], rows))
+    with db.connection() as conn:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("ANALYZE;")
+        conn.autocommit = False
+
+    frame = columnar.fetch_frame(queries.LATEST_POSITIONS_QUERY)
+    results.append(result(scale, 'load_data', timings(
+        lambda: columnar.fetch_frame(queries.LATEST_POSITIONS_QUERY), repeat), len(frame)))
+    results.append(result(scale, 'viewport_select', timings(
+        lambda: viewport.select(frame, viewport.DEFAULT_BOUNDS), repeat)))
+
+    # Marker rows come pre-rendered from the shared snapshot
+    snapshot = live.prepare(frame)
+    results.append(result(scale, 'markers_full', timings(
+        lambda: map_layers.MarkerSync().layer(snapshot), repeat), len(frame)))
+    sync = map_layers.MarkerSync(full_sync_every=repeat + 2)
+    sync.layer(snapshot, 1)
+    moved = snapshot.copy()
+    changed = np.random.default_rng(0).random(len(moved)) < 0.01
+    moved.loc[changed, 'created_at'] += timedelta(seconds=1)
+    changed_ids = set(moved.loc[changed, 'drone_id'])
+    results.append(result(scale, 'markers_delta_1pct', timings(
+        lambda: sync.layer(moved, 2, changed_ids), repeat), int(changed.sum())))
+
+    results.append(result(scale, 'geofence', timings(lambda: geofence.find_violations(frame), repeat), len(frame)))
+
+    # Backfill of the analytics rollups over the seeded history, then the
+    # analytics view's queries
+    analytics.rebuild()
+    started = time.perf_counter()
+    batches = analytics.refresh(until=datetime.now())
+    results.append(result(scale, 'analytics_backfill', [time.perf_counter() - started], batches))
+    window = (datetime.now() - timedelta(days=7), datetime.now() + timedelta(hours=1))
+    for name, query in (('pilots', analytics.pilot_activity), ('zones', analytics.zone_dwell),
+                        ('heatmap', analytics.activity_heatmap)):
+        results.append(result(scale, f'analytics_{name}', timings(lambda: query(*window), repeat)))
+
+    # The sidebar's add path: one position per transaction
+    def add_one():
+        with db.transaction() as cur:
+            positions.record_positions(cur, [('BENCH-ADD', 51.17, 71.45, datetime.now(), None)])
+    results.append(result(scale, 'add_drone', timings(add_one, repeat * 10)))
+
+    batch_size = 10000
+    drone_ids = frame['drone_id'].to_numpy()
+
+    def write_batch():
+        now = datetime.now()
+        ingest.write_batch([
+            (drone_ids[i % len(drone_ids)], 51.17, 71.45, now - timedelta(microseconds=i), None)
+            for i in range(batch_size)
+        ])
+    results.append(result(scale, 'ingest_batch', timings(write_batch, repeat), batch_size))
+
+    victims = iter(drone_ids.tolist())
+    # The sidebar's deactivate path for one drone, then a bulk batch
+    results.append(result(scale, 'deactivate_drone', timings(
+        lambda: fleet_registry.deactivate([next(victims)]), min(repeat * 10, len(drone_ids) // 2))))
+    batch = [next(victims) for _ in range(min(1000, len(drone_ids) // 4))]
+    results.append(result(scale, 'deactivate_batch', timings(
+        lambda: fleet_registry.deactivate(batch), 1), len(batch)))
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def run(postgres, scales, repeat, output, pg_bin=None, database_url=None):
+    with throwaway_postgres(postgres, pg_bin, database_url):
+        import db
+        import migrations
+
+        migrations.migrate()
+        with db.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SHOW server_version;")
+                server_version = cur.fetchone()[0]
+
+        results = []
+        for scale in scales:
+            print(f"Running {scale} ({SCALES[scale]['drones']} drones)...", file=sys.stderr)
+            results.extend(bench_scale(scale, SCALES[scale], repeat))
+        db.close_pool()
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'postgres': server_version,
+            'fixture': postgres,
+            'repeat': repeat,
+            'scales': {scale: SCALES[scale] for scale in scales},
+        },
+        'results': results,
+    }
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def compare(base_path, new_path, threshold):
+    """Print p50 changes between two result files; return the regressions."""
+    with open(base_path) as f:
+        base = {(r['scale'], r['name']): r for r in json.load(f)['results']}
+    with open(new_path) as f:
+        new = {(r['scale'], r['name']): r for r in json.load(f)['results']}
+
+    regressions = []
+    print(f"{'scale':>8} {'benchmark':>20} {'base ms':>10} {'new ms':>10} {'change':>8}")
+    for key in sorted(base.keys() & new.keys()):
+        before, after = base[key]['p50'], new[key]['p50']
+        change = after / before - 1 if before else 0.0
+        flag = ' !' if change > threshold else ''
+        if flag:
+            regressions.append(key)
+        print(f"{key[0]:>8} {key[1]:>20} {before * 1000:>10.2f} {after * 1000:>10.2f} {change:>+8.0%}{flag}")
+    for key in sorted(base.keys() ^ new.keys()):
+        print(f"{key[0]:>8} {key[1]:>20} only in {'base' if key in base else 'new'}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="benchmark against a throwaway database")
+    run_parser.add_argument("--postgres", choices=["pg_ctl", "docker", "url"], default="pg_ctl")
+    run_parser.add_argument("--pg-bin", help="directory with initdb and pg_ctl (default: PATH)")
+    run_parser.add_argument("--database-url", help="existing database for --postgres url; its tables are truncated")
+    run_parser.add_argument("--scales", nargs="+", choices=list(SCALES), default=["small", "medium"])
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--output", default="bench_results.json")
+
+    compare_parser = subparsers.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.2, help="allowed p50 slowdown (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "run":
+            report = run(args.postgres, args.scales, args.repeat, args.output, args.pg_bin, args.database_url)
+            print(f"{'scale':>8} {'benchmark':>20} {'p50 ms':>10} {'p95 ms':>10} {'rows':>9}")
+            for r in report['results']:
+                print(f"{r['scale']:>8} {r['name']:>20} {r['p50'] * 1000:>10.2f} {r['p95'] * 1000:>10.2f} "
+                      f"{r['rows'] if r['rows'] is not None else '':>9}")
+            print(f"Results written to {args.output}")
+        else:
+            regressions = compare(args.base, args.new, args.threshold)
+            if regressions:
+                print(f"{len(regressions)} benchmark(s) slower than the {args.threshold:.0%} threshold")
+                sys.exit(1)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Sentinel for "key not cached"
+MISSING = object()
+
+
+class TaggedCache:
+    """Process-wide cache with TTLs, tags for targeted invalidation, and hit/miss metrics.
+
+    Values are shared between sessions by reference, so callers must treat
+    them as read-only.
+    """
+
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (value, expires_at, tags)
+        self._lock = threading.RLock()
+        self._load_locks = {}
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'invalidations': 0,
+        }
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return MISSING
+        value, expires_at, _ = entry
+        if expires_at is not None and time.monotonic() >= expires_at:
+            del self._entries[key]
+            self._stats['evictions'] += 1
+            return MISSING
+        self._entries.move_to_end(key)
+        return value
+
+    def _set(self, key, value, ttl, tags):
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        self._entries[key] = (value, expires_at, frozenset(tags))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def get_or_load(self, key, loader, ttl=None, tags=()):
+        """Return the cached value for `key`, calling `loader()` on a miss.
+
+        Concurrent misses on the same key run the loader once; the other
+        callers wait for its result. Loader exceptions are not cached.
+        """
+        with self._lock:
+            value = self._get(key)
+            if value is not MISSING:
+                self._stats['hits'] += 1
+                return value
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                value = self._get(key)
+                if value is not MISSING:
+                    self._stats['hits'] += 1
+                    return value
+                self._stats['misses'] += 1
+            value = loader()
+            with self._lock:
+                self._set(key, value, ttl, tags)
+            return value
+
+    def invalidate(self, key=None, tag=None):
+        """Drop one key, or every entry carrying `tag`. Returns the number dropped."""
+        with self._lock:
+            if key is not None:
+                keys = [key] if key in self._entries else []
+            else:
+                keys = [k for k, (_, _, tags) in self._entries.items() if tag in tags]
+            for k in keys:
+                del self._entries[k]
+            self._stats['invalidations'] += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._stats['invalidations'] += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+
+# Shared by every session in the server process
+cache = TaggedCache()
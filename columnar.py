@@ -0,0 +1,81 @@
+import io
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+import db
+from metrics import metrics
+
+# Arrow types of the columns the dashboard queries return. Pinning them
+# keeps e.g. phone numbers as strings and an all-null pilot_id as a number.
+COLUMN_TYPES = {
+    'id': pa.int64(),
+    'drone_id': pa.string(),
+    'latitude': pa.float64(),
+    'longitude': pa.float64(),
+    'created_at': pa.timestamp('us'),
+    'pilot_id': pa.int64(),
+    'first_name': pa.string(),
+    'last_name': pa.string(),
+    'phone_number': pa.string(),
+    'email': pa.string(),
+    'active': pa.bool_(),
+    'registered_at': pa.timestamp('us'),
+    'deactivated_at': pa.timestamp('us'),
+    # Analytics rollups
+    'hour': pa.timestamp('us'),
+    'zone_key': pa.string(),
+    'zone_name': pa.string(),
+    'severity': pa.string(),
+    'drones': pa.int64(),
+    'active_hours': pa.int64(),
+    'reports': pa.int64(),
+    'dwell_minutes': pa.float64(),
+}
+
+# COPY's CSV writes NULL as an unquoted empty field and '' as "", so only
+# the former may become null. Booleans come out as t/f.
+CONVERT_OPTIONS = pa_csv.ConvertOptions(
+    column_types=COLUMN_TYPES,
+    strings_can_be_null=True,
+    quoted_strings_can_be_null=False,
+    true_values=['t'],
+    false_values=['f'],
+)
+
+
+def copy_query(cur, query, params=None):
+    """Run `query` through COPY ... TO STDOUT and return the CSV bytes."""
+    sql = cur.mogrify(query, params).decode().strip().rstrip(';')
+    buffer = io.BytesIO()
+    cur.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER true)", buffer)
+    buffer.seek(0)
+    return buffer
+
+
+def read_table(cur, query, params=None):
+    """Run `query` on an open cursor and return its result as a pyarrow Table.
+
+    Postgres streams the rows as CSV and Arrow parses them column by
+    column in C++, so no Python object is created per row or per value.
+    """
+    buffer = copy_query(cur, query, params)
+    metrics.count('db_bytes_fetched', buffer.getbuffer().nbytes)
+    table = pa_csv.read_csv(buffer, convert_options=CONVERT_OPTIONS)
+    metrics.count('db_rows_fetched', table.num_rows)
+    return table
+
+
+def to_frame(table):
+    # Nanosecond timestamps, like every other frame in the app
+    return table.to_pandas(coerce_temporal_nanoseconds=True)
+
+
+def fetch_table(query, params=None):
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            return read_table(cur, query, params)
+
+
+def fetch_frame(query, params=None):
+    return to_frame(fetch_table(query, params))
@@ -0,0 +1,215 @@
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from dotenv import load_dotenv
+from psycopg2 import pool
+
+from metrics import metrics
+
+# Once per process, before any setting below (and main.py's) is read
+load_dotenv()
+
+# Pool sizing, overridable from the environment
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+# How long a caller may wait for a free connection before giving up
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Connections idle longer than this are pinged before being handed out
+HEALTH_CHECK_INTERVAL = float(os.getenv("DB_HEALTH_CHECK_INTERVAL", "30"))
+# Attempts (and the first backoff delay, doubled after each) for writes
+# run through retrying()
+RETRY_ATTEMPTS = int(os.getenv("DB_RETRY_ATTEMPTS", "5"))
+RETRY_BASE_DELAY = float(os.getenv("DB_RETRY_BASE_DELAY", "0.05"))
+
+# Failures worth retrying the whole transaction for: deadlocks and
+# serialization failures (TransactionRollbackError), dropped connections,
+# and waiting too long for a pooled connection
+TRANSIENT_ERRORS = (psycopg2.OperationalError, pool.PoolError)
+
+_database_url = None
+_pool = None
+_pool_lock = threading.Lock()
+# psycopg2's pool raises instead of blocking when exhausted, so the
+# semaphore is what makes callers queue up for a connection
+_slots = threading.BoundedSemaphore(POOL_MAX_SIZE)
+_last_used = {}
+
+_stats_lock = threading.Lock()
+_stats = {
+    'checkouts': 0,
+    'in_use': 0,
+    'wait_total': 0.0,
+    'wait_max': 0.0,
+    'timeouts': 0,
+    'discarded': 0,
+}
+
+
+def database_url():
+    """DATABASE_URL from the environment (e.g. a throwaway benchmark
+    database), else the Streamlit secret. Resolved on first use, so
+    importing db (CLI tools, benchmarks) doesn't load Streamlit and its
+    secrets, which takes ~0.4 s."""
+    global _database_url
+    if _database_url is None:
+        url = os.getenv("DATABASE_URL")
+        if not url:
+            import streamlit as st
+            url = st.secrets["db_url"]
+        _database_url = url
+    return _database_url
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = pool.ThreadedConnectionPool(POOL_MIN_SIZE, POOL_MAX_SIZE, database_url())
+    return _pool
+
+
+def _is_healthy(conn):
+    if conn.closed:
+        return False
+    if time.monotonic() - _last_used.get(id(conn), 0) < HEALTH_CHECK_INTERVAL:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1;")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _checkout():
+    started = time.monotonic()
+    if not _slots.acquire(timeout=POOL_TIMEOUT):
+        with _stats_lock:
+            _stats['timeouts'] += 1
+        raise pool.PoolError(f"No database connection available after {POOL_TIMEOUT}s")
+
+    try:
+        db_pool = get_pool()
+        conn = db_pool.getconn()
+        while not _is_healthy(conn):
+            _last_used.pop(id(conn), None)
+            db_pool.putconn(conn, close=True)
+            with _stats_lock:
+                _stats['discarded'] += 1
+            conn = db_pool.getconn()
+    except Exception:
+        _slots.release()
+        raise
+
+    waited = time.monotonic() - started
+    metrics.observe('db_checkout_wait_seconds', waited)
+    with _stats_lock:
+        _stats['checkouts'] += 1
+        _stats['in_use'] += 1
+        _stats['wait_total'] += waited
+        _stats['wait_max'] = max(_stats['wait_max'], waited)
+    return conn
+
+
+def _release(conn):
+    broken = conn.closed != 0
+    if broken:
+        _last_used.pop(id(conn), None)
+    else:
+        _last_used[id(conn)] = time.monotonic()
+    try:
+        get_pool().putconn(conn, close=broken)
+    finally:
+        with _stats_lock:
+            _stats['in_use'] -= 1
+            if broken:
+                _stats['discarded'] += 1
+        _slots.release()
+
+
+@contextmanager
+def connection():
+    """Borrow a pooled connection; it is returned to the pool on exit."""
+    conn = _checkout()
+    started = time.perf_counter()
+    try:
+        yield conn
+    finally:
+        try:
+            if not conn.closed:
+                # Never hand a connection back with an open transaction
+                conn.rollback()
+        except psycopg2.Error:
+            # e.g. the server dropped it; closed, so _release discards it
+            conn.close()
+        finally:
+            _release(conn)
+            metrics.observe('db_connection_held_seconds', time.perf_counter() - started)
+
+
+@contextmanager
+def transaction():
+    """Yield a cursor inside a transaction that commits on success and rolls back on error."""
+    with connection() as conn:
+        cur = conn.cursor()
+        try:
+            yield cur
+            conn.commit()
+        except Exception:
+            # A dropped connection has nothing to roll back, and trying
+            # would replace the error with an InterfaceError
+            if not conn.closed:
+                conn.rollback()
+            metrics.count('db_rollbacks')
+            raise
+        finally:
+            cur.close()
+
+
+def retrying(work, attempts=RETRY_ATTEMPTS, base_delay=RETRY_BASE_DELAY):
+    """Run `work(cur)` in a transaction and return its result, retrying the
+    whole transaction on transient errors with exponential backoff and
+    jitter, at most `attempts` times in total.
+
+    A retry may follow a commit whose outcome was lost with the
+    connection, so `work` must be safe to repeat (idempotent upserts).
+    """
+    for attempt in range(attempts):
+        try:
+            with transaction() as cur:
+                return work(cur)
+        except TRANSIENT_ERRORS:
+            if attempt == attempts - 1:
+                raise
+            metrics.count('db_retries')
+            time.sleep(base_delay * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+def check_connection():
+    with connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1;")
+            return cur.fetchone()[0] == 1
+
+
+def pool_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['max_size'] = POOL_MAX_SIZE
+    stats['wait_avg'] = stats['wait_total'] / stats['checkouts'] if stats['checkouts'] else 0.0
+    return stats
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _last_used.clear()
@@ -0,0 +1,262 @@
+import argparse
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from psycopg2.extras import execute_values
+
+import db
+import ingest
+import queries
+from metrics import metrics
+from restricted_areas import RESTRICTED_AREAS
+from seed_drones import BASE_LAT, BASE_LON
+from seed_pilots import FIRST_NAMES, LAST_NAMES
+
+# Metres per degree around Astana's latitude
+M_PER_DEG_LAT = 111320.0
+M_PER_DEG_LON = 111320.0 * np.cos(np.radians(BASE_LAT))
+
+# Drones wander within this many degrees of the base point
+AREA_RADIUS = 0.1
+
+INSERT_PILOTS_QUERY = """
+INSERT INTO pilots (first_name, last_name, phone_number, email)
+VALUES %s
+ON CONFLICT (email) DO UPDATE SET email = EXCLUDED.email
+RETURNING id;
+"""
+
+
+def generate_pilots(num_pilots, rng):
+    first_names = rng.choice(FIRST_NAMES, num_pilots)
+    last_names = rng.choice(LAST_NAMES, num_pilots)
+    index = np.arange(num_pilots).astype(str)
+    phones = np.char.add('+7700', rng.integers(1000000, 9999999, num_pilots).astype(str))
+    # The index keeps emails (the pilots' unique key) distinct at any scale
+    emails = np.char.add(np.char.add(np.char.add(np.char.lower(first_names.astype(str)), '.'), index), '@sim.example.com')
+    return pd.DataFrame({
+        'first_name': first_names,
+        'last_name': last_names,
+        'phone_number': phones,
+        'email': emails,
+    })
+
+
+def zone_centres():
+    coords = [np.asarray(area['coordinates'], dtype=np.float64) for area in RESTRICTED_AREAS.values()]
+    return np.array([ring.mean(axis=0) for ring in coords])
+
+
+def simulate_tracks(num_drones, hours, interval, rng, intruder_fraction=0.05, start=None, chunk_steps=60):
+    """Yield (timestamps, latitudes, longitudes) chunks of flight tracks.
+
+    Arrays are shaped (steps, drones). Each step advances every drone at
+    once; most drones wander with a random-walk heading, while
+    `intruder_fraction` of them start 1-3 km from a restricted area and
+    fly straight through it.
+    """
+    steps = int(hours * 3600 / interval)
+    start = start or datetime.now() - timedelta(hours=hours)
+
+    lat = BASE_LAT + rng.uniform(-AREA_RADIUS, AREA_RADIUS, num_drones)
+    lon = BASE_LON + rng.uniform(-AREA_RADIUS, AREA_RADIUS, num_drones)
+    heading = rng.uniform(0, 2 * np.pi, num_drones)  # radians clockwise from north
+    speed = rng.uniform(5, 15, num_drones)  # m/s
+
+    intruders = rng.random(num_drones) < intruder_fraction
+    centres = zone_centres()
+    targets = centres[rng.integers(0, len(centres), num_drones)]
+    approach = rng.uniform(1000, 3000, num_drones)
+    bearing = rng.uniform(0, 2 * np.pi, num_drones)
+    lat = np.where(intruders, targets[:, 0] + approach * np.cos(bearing) / M_PER_DEG_LAT, lat)
+    lon = np.where(intruders, targets[:, 1] + approach * np.sin(bearing) / M_PER_DEG_LON, lon)
+    heading = np.where(intruders, bearing + np.pi, heading)
+
+    for chunk_start in range(0, steps, chunk_steps):
+        count = min(chunk_steps, steps - chunk_start)
+        out_lat = np.empty((count, num_drones))
+        out_lon = np.empty((count, num_drones))
+        for step in range(count):
+            heading = heading + np.where(intruders, 0.0, rng.normal(0, 0.2, num_drones))
+            lat = lat + speed * interval * np.cos(heading) / M_PER_DEG_LAT
+            lon = lon + speed * interval * np.sin(heading) / M_PER_DEG_LON
+
+            # Turn back towards the centre when leaving the area
+            outside = (np.abs(lat - BASE_LAT) > AREA_RADIUS) | (np.abs(lon - BASE_LON) > AREA_RADIUS)
+            home = np.arctan2((BASE_LON - lon) * M_PER_DEG_LON, (BASE_LAT - lat) * M_PER_DEG_LAT)
+            heading = np.where(outside, home, heading)
+            intruders = intruders & ~outside
+
+            out_lat[step] = lat
+            out_lon[step] = lon
+
+        offsets = (chunk_start + np.arange(count)) * interval
+        timestamps = pd.Timestamp(start) + pd.to_timedelta(offsets, unit='s')
+        yield timestamps, out_lat, out_lon
+
+
+def track_frame(drone_ids, pilot_ids, timestamps, latitudes, longitudes):
+    steps, drones = latitudes.shape
+    return pd.DataFrame({
+        'drone_id': np.tile(drone_ids, steps),
+        'latitude': latitudes.ravel(),
+        'longitude': longitudes.ravel(),
+        'created_at': np.repeat(timestamps.to_numpy(), drones),
+        'pilot_id': np.tile(pilot_ids, steps),
+    })
+
+
+def seed_pilots(num_pilots, rng):
+    pilots = generate_pilots(num_pilots, rng)
+    with db.transaction() as cur:
+        ids = execute_values(
+            cur, INSERT_PILOTS_QUERY, list(pilots.itertuples(index=False, name=None)), fetch=True, page_size=1000
+        )
+    return np.array([row[0] for row in ids])
+
+
+def seed_fleet(num_pilots, num_drones, hours, interval=5, seed=42, intruder_fraction=0.05, batch_rows=50000):
+    rng = np.random.default_rng(seed)
+    pilot_ids = seed_pilots(num_pilots, rng)
+    drone_ids = np.array([f'SIM-{i:06d}' for i in range(num_drones)])
+    drone_pilots = rng.choice(pilot_ids, num_drones)
+
+    # Stream chunks of the tracks straight into the COPY ingest path
+    chunk_steps = max(batch_rows // num_drones, 1)
+    total = 0
+    for timestamps, lat, lon in simulate_tracks(num_drones, hours, interval, rng, intruder_fraction,
+                                                chunk_steps=chunk_steps):
+        total += ingest.write_frame(track_frame(drone_ids, drone_pilots, timestamps, lat, lon))
+    return total
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)] if values else 0.0
+
+
+# The queries behind a dashboard rerun: the live snapshot's fetch of the
+# drones a change notification names (the map itself is filtered in memory),
+# and the pilot lookups on a cache miss
+PROBE_QUERIES = ('load_changed', 'search_pilots', 'load_pilots_by_id')
+
+
+def measure_queries(stop, interval, latencies, errors):
+    # Times the dashboard's queries the way a cache miss would run them
+    try:
+        while not stop.is_set():
+            started = time.perf_counter()
+            with db.connection() as conn:
+                with conn.cursor() as cur:
+                    for name in PROBE_QUERIES:
+                        cur.execute(*queries.DASHBOARD_QUERIES[name])
+                        cur.fetchall()
+            latencies.append(time.perf_counter() - started)
+            metrics.observe('loadtest_query_seconds', latencies[-1])
+            stop.wait(interval)
+    except Exception as e:
+        errors.append(e)
+
+
+def load_test(num_drones, rate, duration, interval=1, seed=42, query_interval=1.0, prefix='SIM-'):
+    """Replay simulated tracks at `rate` positions/sec while timing dashboard queries.
+
+    Raises if the query probe failed, rather than reporting no samples.
+    """
+    rng = np.random.default_rng(seed)
+    with db.transaction() as cur:
+        cur.execute("SELECT id FROM pilots;")
+        pilot_ids = np.array([row[0] for row in cur.fetchall()] or [None], dtype=object)
+    drone_ids = np.array([f'{prefix}{i:06d}' for i in range(num_drones)])
+    drone_pilots = rng.choice(pilot_ids, num_drones)
+
+    latencies, errors = [], []
+    stop = threading.Event()
+    probe = threading.Thread(target=measure_queries, args=(stop, query_interval, latencies, errors), daemon=True)
+    probe.start()
+
+    written = 0
+    started = time.monotonic()
+    steps = duration * rate / num_drones + 1
+    try:
+        for _, lat, lon in simulate_tracks(num_drones, steps * interval / 3600, interval, rng, chunk_steps=1):
+            if time.monotonic() - started >= duration:
+                break
+            frame = track_frame(drone_ids, drone_pilots, pd.DatetimeIndex([datetime.now()]), lat, lon)
+            for offset in range(0, len(frame), rate):
+                if time.monotonic() - started >= duration:
+                    break
+                # Pace writes so that `rate` positions land per second
+                wait = started + written / rate - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                batch = frame.iloc[offset:offset + rate].copy()
+                batch['created_at'] = pd.Timestamp(datetime.now())
+                ingest.write_frame(batch)
+                written += len(batch)
+    finally:
+        stop.set()
+        probe.join()
+    if errors:
+        raise RuntimeError(f"dashboard query probe failed: {errors[0]!r}")
+
+    elapsed = time.monotonic() - started
+    summary = ingest.stats.snapshot()
+    return {
+        'positions': written,
+        'achieved_rate': written / elapsed,
+        'batch_p95': summary['batch_p95'],
+        'query_samples': len(latencies),
+        'query_p50': percentile(latencies, 0.5),
+        'query_p95': percentile(latencies, 0.95),
+        'query_max': max(latencies, default=0.0),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic drone fleet or load-test the dashboard queries")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = subparsers.add_parser("seed", help="write pilots and flight tracks to the database")
+    seed_parser.add_argument("--pilots", type=int, default=1000)
+    seed_parser.add_argument("--drones", type=int, default=10000)
+    seed_parser.add_argument("--hours", type=float, default=1.0)
+    seed_parser.add_argument("--interval", type=float, default=5, help="seconds between positions")
+    seed_parser.add_argument("--intruders", type=float, default=0.05, help="fraction of drones crossing restricted areas")
+    seed_parser.add_argument("--seed", type=int, default=42)
+    seed_parser.add_argument("--metrics", help="write timings to this file (.prom for Prometheus text, else JSON)")
+
+    load_parser = subparsers.add_parser("loadtest", help="replay tracks in real time and time dashboard queries")
+    load_parser.add_argument("--drones", type=int, default=10000)
+    load_parser.add_argument("--rate", type=int, default=2000, help="positions per second")
+    load_parser.add_argument("--duration", type=float, default=60, help="seconds")
+    load_parser.add_argument("--query-interval", type=float, default=1.0)
+    load_parser.add_argument("--seed", type=int, default=42)
+    load_parser.add_argument("--metrics", help="write timings to this file (.prom for Prometheus text, else JSON)")
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == "seed":
+            started = time.perf_counter()
+            total = seed_fleet(args.pilots, args.drones, args.hours, args.interval, args.seed, args.intruders)
+            elapsed = time.perf_counter() - started
+            print(f"Seeded {args.pilots} pilots and {total} positions for {args.drones} drones "
+                  f"in {elapsed:.1f}s ({total / elapsed:.0f} rows/sec)")
+        else:
+            result = load_test(args.drones, args.rate, args.duration, seed=args.seed,
+                               query_interval=args.query_interval)
+            print(f"Wrote {result['positions']} positions at {result['achieved_rate']:.0f}/sec "
+                  f"(batch p95 {result['batch_p95'] * 1000:.1f} ms)")
+            print(f"Dashboard queries: {result['query_samples']} samples, "
+                  f"p50 {result['query_p50'] * 1000:.1f} ms, p95 {result['query_p95'] * 1000:.1f} ms, "
+                  f"max {result['query_max'] * 1000:.1f} ms")
+        if args.metrics:
+            metrics.write(args.metrics)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,132 @@
+import argparse
+import csv
+import sys
+
+import columnar
+import db
+import queries
+
+# Drone ids per statement; a bulk operation on more runs one statement per
+# batch in a single transaction
+BATCH_SIZE = 10000
+
+
+def _batches(items, batch_size=BATCH_SIZE):
+    for i in range(0, len(items), batch_size):
+        yield items[i:i + batch_size]
+
+
+def _run_batched(query, drone_ids, **params):
+    drone_ids = sorted(set(drone_ids))
+    changed = 0
+    with db.transaction() as cur:
+        for batch in _batches(drone_ids):
+            cur.execute(query, dict(params, drone_ids=batch))
+            changed += cur.fetchone()[0]
+    return changed
+
+
+def deactivate(drone_ids):
+    """Take drones off the map, keeping their fleet entry and history.
+    Returns how many were active."""
+    return _run_batched(queries.DEACTIVATE_DRONES_QUERY, drone_ids)
+
+
+def activate(drone_ids):
+    """Reactivate drones, putting them back at their last recorded position."""
+    return _run_batched(queries.ACTIVATE_DRONES_QUERY, drone_ids)
+
+
+def reassign(drone_ids, pilot_id):
+    """Assign the drones to `pilot_id` (None to unassign)."""
+    return _run_batched(queries.REASSIGN_DRONES_QUERY, drone_ids, pilot_id=pilot_id)
+
+
+def import_drones(rows, activate=False, cur=None):
+    """Register (drone_id, pilot_id) rows, updating the pilot of known drones.
+
+    With `activate`, deactivated drones among them become active again.
+    Runs in `cur`'s transaction if given.
+    """
+    if cur is None:
+        with db.transaction() as cur:
+            return _import(cur, rows, activate)
+    return _import(cur, rows, activate)
+
+
+def _import(cur, rows, activate):
+    # ON CONFLICT may touch each drone once per statement; the last row wins
+    assignments = dict(rows)
+    drone_ids = sorted(assignments)
+    imported = 0
+    for batch in _batches(drone_ids):
+        cur.execute(queries.IMPORT_DRONES_QUERY, {
+            'drone_ids': batch,
+            'pilot_ids': [assignments[drone_id] for drone_id in batch],
+            'activate': activate,
+        })
+        imported += cur.fetchone()[0]
+    return imported
+
+
+def load_fleet():
+    """Every registered drone, active or not."""
+    return columnar.fetch_frame(queries.FLEET_QUERY)
+
+
+def read_rows(stream):
+    """Yield (drone_id, pilot_id) from CSV text, skipping a header row if present."""
+    for record in csv.reader(stream):
+        if not record or record[0] == 'drone_id':
+            continue
+        pilot_id = int(record[1]) if len(record) > 1 and record[1] != '' else None
+        yield record[0], pilot_id
+
+
+def _read_ids(args):
+    drone_ids = list(args.drone_ids)
+    if args.file:
+        with open(args.file) as f:
+            drone_ids.extend(line.strip() for line in f if line.strip())
+    return drone_ids
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk fleet operations")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("list", help="print the fleet as CSV")
+
+    for command, help_text in (("deactivate", "take drones off the map"),
+                               ("activate", "put deactivated drones back"),
+                               ("reassign", "assign drones to a pilot")):
+        command_parser = subparsers.add_parser(command, help=help_text)
+        command_parser.add_argument("drone_ids", nargs="*")
+        command_parser.add_argument("--file", help="file with one drone id per line")
+        if command == "reassign":
+            command_parser.add_argument("--pilot-id", type=int, help="omit to unassign")
+
+    import_parser = subparsers.add_parser("import", help="register drones from CSV (drone_id,pilot_id)")
+    import_parser.add_argument("file", nargs="?", help="CSV file (default: stdin)")
+    import_parser.add_argument("--activate", action="store_true", help="also reactivate deactivated drones")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "list":
+            load_fleet().to_csv(sys.stdout, index=False)
+        elif args.command == "deactivate":
+            print(f"Deactivated {deactivate(_read_ids(args))} drones")
+        elif args.command == "activate":
+            print(f"Activated {activate(_read_ids(args))} drones")
+        elif args.command == "reassign":
+            print(f"Reassigned {reassign(_read_ids(args), args.pilot_id)} drones")
+        else:
+            if args.file:
+                with open(args.file, newline='') as f:
+                    rows = list(read_rows(f))
+            else:
+                rows = list(read_rows(sys.stdin))
+            print(f"Imported {import_drones(rows, args.activate)} drones")
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,193 @@
+import json
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Points are tested in chunks to bound the memory of the edge-crossing arrays
+CHUNK_SIZE = 16384
+# Upper bound on grid resolution along each axis of the zones' extent
+MAX_GRID_CELLS = 1024
+
+VIOLATION_COLUMNS = ['drone_id', 'latitude', 'longitude', 'zone_id', 'zone_name', 'severity']
+
+
+class Geofence:
+    """Restricted zones packed into NumPy arrays for vectorized point-in-polygon tests."""
+
+    def __init__(self, areas):
+        self.zone_ids = np.array(list(areas.keys()), dtype=object)
+        self.names = np.array([area['name'] for area in areas.values()], dtype=object)
+        self.severities = np.array([area['color'] for area in areas.values()], dtype=object)
+
+        rings = []
+        for area in areas.values():
+            ring = np.asarray(area['coordinates'], dtype=np.float64)
+            if not np.array_equal(ring[0], ring[-1]):
+                ring = np.vstack([ring, ring[:1]])
+            rings.append(ring)
+
+        # Pad every ring to the same length by repeating its closing vertex.
+        # The padding forms zero-length edges, which never count as crossings.
+        max_vertices = max((len(ring) for ring in rings), default=1)
+        self.vertices = np.empty((len(rings), max_vertices, 2), dtype=np.float64)
+        for i, ring in enumerate(rings):
+            self.vertices[i, :len(ring)] = ring
+            self.vertices[i, len(ring):] = ring[-1]
+
+        # Bounding boxes as (min_lat, min_lon, max_lat, max_lon)
+        self.bboxes = np.concatenate([self.vertices.min(axis=1), self.vertices.max(axis=1)], axis=1)
+        self._build_grid()
+
+    def __len__(self):
+        return len(self.zone_ids)
+
+    def _build_grid(self):
+        # Sparse uniform grid over the zones' bounding boxes: each occupied
+        # cell lists the zones overlapping it, stored CSR-style sorted by cell
+        if len(self) == 0:
+            self.cell_keys = np.empty(0, dtype=np.int64)
+            return
+
+        self.origin = self.bboxes[:, :2].min(axis=0)
+        extent = self.bboxes[:, 2:].max(axis=0) - self.origin
+        typical = np.median(self.bboxes[:, 2:] - self.bboxes[:, :2], axis=0)
+        self.cell_size = np.maximum(np.maximum(typical, extent / MAX_GRID_CELLS), 1e-9)
+        self.grid_shape = np.floor(extent / self.cell_size).astype(np.int64) + 1
+
+        low = np.floor((self.bboxes[:, :2] - self.origin) / self.cell_size).astype(np.int64)
+        high = np.floor((self.bboxes[:, 2:] - self.origin) / self.cell_size).astype(np.int64)
+        high = np.minimum(high, self.grid_shape - 1)
+
+        cells = []
+        zones = []
+        for zone, ((r0, c0), (r1, c1)) in enumerate(zip(low, high)):
+            rows, cols = np.meshgrid(np.arange(r0, r1 + 1), np.arange(c0, c1 + 1), indexing='ij')
+            keys = (rows * self.grid_shape[1] + cols).ravel()
+            cells.append(keys)
+            zones.append(np.full(len(keys), zone, dtype=np.intp))
+        cells = np.concatenate(cells)
+        zones = np.concatenate(zones)
+
+        order = np.argsort(cells, kind='stable')
+        cells = cells[order]
+        self.cell_zones = zones[order]
+        self.cell_keys, self.cell_starts, self.cell_counts = np.unique(cells, return_index=True, return_counts=True)
+
+    def _candidates(self, lat, lon):
+        # (point, zone) pairs whose grid cell matches and whose bbox contains the point
+        rows = np.floor((lat - self.origin[0]) / self.cell_size[0]).astype(np.int64)
+        cols = np.floor((lon - self.origin[1]) / self.cell_size[1]).astype(np.int64)
+        on_grid = (rows >= 0) & (rows < self.grid_shape[0]) & (cols >= 0) & (cols < self.grid_shape[1])
+        points = np.flatnonzero(on_grid)
+        keys = rows[points] * self.grid_shape[1] + cols[points]
+
+        slot = np.searchsorted(self.cell_keys, keys)
+        slot = np.minimum(slot, len(self.cell_keys) - 1)
+        occupied = self.cell_keys[slot] == keys
+        points = points[occupied]
+        slot = slot[occupied]
+
+        counts = self.cell_counts[slot]
+        point_idx = np.repeat(points, counts)
+        # Position of each pair within its cell's zone list
+        offsets = np.arange(len(point_idx)) - np.repeat(np.cumsum(counts) - counts, counts)
+        zone_idx = self.cell_zones[np.repeat(self.cell_starts[slot], counts) + offsets]
+
+        plat = lat[point_idx]
+        plon = lon[point_idx]
+        bbox = self.bboxes[zone_idx]
+        in_bbox = (plat >= bbox[:, 0]) & (plat <= bbox[:, 2]) & (plon >= bbox[:, 1]) & (plon <= bbox[:, 3])
+        return point_idx[in_bbox], zone_idx[in_bbox]
+
+    def _contains_pairs(self, lat, lon, zone_idx):
+        # Even-odd ray casting for each (point, zone) pair, all edges at once
+        y1 = self.vertices[zone_idx, :-1, 0]
+        x1 = self.vertices[zone_idx, :-1, 1]
+        y2 = self.vertices[zone_idx, 1:, 0]
+        x2 = self.vertices[zone_idx, 1:, 1]
+        y = lat[:, None]
+        x = lon[:, None]
+
+        straddles = (y1 > y) != (y2 > y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_cross = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+        crossings = straddles & (x < x_cross)
+        return np.count_nonzero(crossings, axis=1) % 2 == 1
+
+    def locate(self, latitudes, longitudes):
+        """Return (point_index, zone_index) arrays for every point inside a zone."""
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        if len(self) == 0 or len(latitudes) == 0:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+        point_hits = []
+        zone_hits = []
+        for start in range(0, len(latitudes), CHUNK_SIZE):
+            lat = latitudes[start:start + CHUNK_SIZE]
+            lon = longitudes[start:start + CHUNK_SIZE]
+
+            # Grid lookup plus bounding-box check narrows the exact test
+            # to zones near each point
+            point_idx, zone_idx = self._candidates(lat, lon)
+            if len(point_idx) == 0:
+                continue
+
+            inside = self._contains_pairs(lat[point_idx], lon[point_idx], zone_idx)
+            point_hits.append(point_idx[inside] + start)
+            zone_hits.append(zone_idx[inside])
+
+        if not point_hits:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+        return np.concatenate(point_hits), np.concatenate(zone_hits)
+
+    def violations(self, data):
+        """Return one row per (drone, zone) pair where the drone is inside the zone."""
+        if data.empty:
+            return pd.DataFrame(columns=VIOLATION_COLUMNS)
+
+        point_idx, zone_idx = self.locate(data['latitude'].to_numpy(), data['longitude'].to_numpy())
+        return pd.DataFrame({
+            'drone_id': data['drone_id'].to_numpy()[point_idx],
+            'latitude': data['latitude'].to_numpy()[point_idx],
+            'longitude': data['longitude'].to_numpy()[point_idx],
+            'zone_id': self.zone_ids[zone_idx],
+            'zone_name': self.names[zone_idx],
+            'severity': self.severities[zone_idx],
+        }, columns=VIOLATION_COLUMNS)
+
+
+def get_geofence():
+    # The zones active now, compiled once per version of the
+    # restricted_areas table (see zones.ZoneRegistry)
+    import zones
+    return zones.active_zones().geofence
+
+
+def find_violations(data, fence=None):
+    return (fence if fence is not None else get_geofence()).violations(data)
+
+
+def violation_summary(violations):
+    """Count violations per severity, always including red and orange."""
+    counts = violations['severity'].value_counts()
+    return {severity: int(counts.get(severity, 0)) for severity in ('red', 'orange')}
+
+
+if __name__ == "__main__":
+    # Print current violations as JSON for other services to consume
+    import columnar
+    import queries
+
+    try:
+        data = columnar.fetch_frame(queries.LATEST_POSITIONS_QUERY)
+        violations = find_violations(data)
+        json.dump({
+            'summary': violation_summary(violations),
+            'violations': violations.to_dict(orient='records'),
+        }, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
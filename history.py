@@ -0,0 +1,75 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+import columnar
+import db
+import queries
+
+# Each drone's track is downsampled to at most this many points
+MAX_TRACK_POINTS = 500
+# Buckets per drone fetched by one query, so a page holds at most
+# PAGE_BUCKETS rows per selected drone however long the window is
+PAGE_BUCKETS = 100
+# Selected drones per history view
+MAX_TRACK_DRONES = 20
+
+TRACK_COLUMNS = ['drone_id', 'latitude', 'longitude', 'created_at']
+
+
+def bucket_seconds(start, end, max_points=MAX_TRACK_POINTS):
+    """Bucket width that keeps a track over [start, end) within max_points."""
+    return max(math.ceil((pd.Timestamp(end) - pd.Timestamp(start)).total_seconds() / max_points), 1)
+
+
+def align(timestamp, step):
+    # Bucket boundaries are multiples of `step` seconds since the epoch,
+    # matching floor(extract(epoch FROM created_at) / step) in SQL
+    seconds = pd.Timestamp(timestamp).value // 10**9
+    return pd.Timestamp((seconds // step) * step, unit='s')
+
+
+def window_pages(start, end, step, page_buckets=PAGE_BUCKETS):
+    """Split [start, end) into bucket-aligned (page_start, page_end) windows."""
+    span = pd.Timedelta(seconds=step * page_buckets)
+    page_start = align(start, step)
+    end = pd.Timestamp(end)
+    while page_start < end:
+        page_end = min(page_start + span, end)
+        yield max(page_start, pd.Timestamp(start)), page_end
+        page_start += span
+
+
+def track_pages(drone_ids, start, end, step, page_buckets=PAGE_BUCKETS):
+    """Yield downsampled track frames for the drones, one time window at a time."""
+    with db.connection() as conn:
+        for page_start, page_end in window_pages(start, end, step, page_buckets):
+            with conn.cursor() as cur:
+                page = columnar.read_table(cur, queries.TRACK_PAGE_QUERY, {
+                    'drone_ids': list(drone_ids),
+                    'step': step,
+                    'start': page_start.to_pydatetime(),
+                    'end': page_end.to_pydatetime(),
+                })
+            if page.num_rows:
+                yield columnar.to_frame(page.select(TRACK_COLUMNS))
+
+
+def load_tracks(drone_ids, start, end, max_points=MAX_TRACK_POINTS):
+    """Tracks of the drones over [start, end), at most max_points per drone.
+
+    Returns a frame sorted by drone and time, and the bucket width used.
+    """
+    step = bucket_seconds(start, end, max_points)
+    pages = list(track_pages(drone_ids, start, end, step)) if len(drone_ids) else []
+    if not pages:
+        return pd.DataFrame(columns=TRACK_COLUMNS), step
+    tracks = pd.concat(pages, ignore_index=True)
+    return tracks.sort_values(['drone_id', 'created_at'], ignore_index=True), step
+
+
+def positions_at(tracks, at):
+    """Last known point of every drone at or before `at`."""
+    seen = tracks[tracks['created_at'].to_numpy() <= np.datetime64(pd.Timestamp(at))]
+    return seen.groupby('drone_id', sort=False).tail(1)
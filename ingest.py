@@ -0,0 +1,331 @@
+import argparse
+import csv
+import io
+import queue
+import sys
+import threading
+import time
+
+import psycopg2
+
+import db
+from metrics import metrics
+
+STAGING_COLUMNS = ['drone_id', 'latitude', 'longitude', 'created_at', 'pilot_id', 'idempotency_key']
+
+# Session-local staging table, emptied at every commit. Pooled connections
+# are reused, so it is created once per connection.
+CREATE_STAGING_QUERY = """
+CREATE TEMP TABLE IF NOT EXISTS drones_staging (
+    drone_id VARCHAR(50) NOT NULL,
+    latitude DOUBLE PRECISION NOT NULL,
+    longitude DOUBLE PRECISION NOT NULL,
+    created_at TIMESTAMP NOT NULL,
+    pilot_id INTEGER,
+    idempotency_key VARCHAR(100)
+) ON COMMIT DELETE ROWS;
+"""
+
+COPY_STAGING_QUERY = """
+COPY drones_staging (drone_id, latitude, longitude, created_at, pilot_id, idempotency_key)
+FROM STDIN WITH (FORMAT csv)
+"""
+
+# A report naming a pilot that doesn't exist keeps its position but loses
+# the pilot, instead of failing the batch's foreign keys
+RESOLVE_PILOTS_QUERY = """
+UPDATE drones_staging s
+SET pilot_id = NULL
+WHERE s.pilot_id IS NOT NULL
+AND NOT EXISTS (SELECT 1 FROM pilots p WHERE p.id = s.pilot_id);
+"""
+
+# Claim the staged reports' idempotency keys, as positions.CLAIM_REQUESTS_QUERY,
+# and drop every keyed report but the one that claimed its key: replays of
+# keys accepted before (client retries), and repeats within the batch
+CLAIM_STAGED_QUERY = """
+WITH claimed AS (
+    INSERT INTO position_requests (idempotency_key, drone_id, created_at)
+    SELECT DISTINCT ON (idempotency_key) idempotency_key, drone_id, created_at
+    FROM drones_staging
+    WHERE idempotency_key IS NOT NULL
+    ORDER BY idempotency_key
+    ON CONFLICT (idempotency_key) DO NOTHING
+    RETURNING idempotency_key, drone_id, created_at
+)
+DELETE FROM drones_staging s
+WHERE s.idempotency_key IS NOT NULL
+AND NOT EXISTS (
+    SELECT 1 FROM claimed c
+    WHERE c.idempotency_key = s.idempotency_key AND c.drone_id = s.drone_id AND c.created_at = s.created_at
+);
+"""
+
+# Same conflict rule as every other writer: a (drone_id, created_at) pair
+# is stored once. Inserted in key order, so concurrent batches lock
+# overlapping rows in the same order instead of deadlocking.
+MERGE_HISTORY_QUERY = """
+INSERT INTO drones (drone_id, latitude, longitude, created_at, pilot_id)
+SELECT drone_id, latitude, longitude, created_at, pilot_id
+FROM drones_staging
+ORDER BY drone_id, created_at
+ON CONFLICT (drone_id, created_at) DO NOTHING;
+"""
+
+# Register drones the first time they report
+MERGE_FLEET_QUERY = """
+INSERT INTO fleet (drone_id, pilot_id)
+SELECT DISTINCT ON (drone_id) drone_id, pilot_id
+FROM drones_staging
+ORDER BY drone_id, created_at DESC
+ON CONFLICT (drone_id) DO NOTHING;
+"""
+
+# Only active drones are kept in drone_latest, with the fleet's pilot
+# assignment taking precedence over the reported one
+MERGE_LATEST_QUERY = """
+INSERT INTO drone_latest (drone_id, latitude, longitude, created_at, pilot_id)
+SELECT DISTINCT ON (s.drone_id)
+    s.drone_id, s.latitude, s.longitude, s.created_at, COALESCE(f.pilot_id, s.pilot_id)
+FROM drones_staging s
+JOIN fleet f ON f.drone_id = s.drone_id
+WHERE f.active
+ORDER BY s.drone_id, s.created_at DESC
+ON CONFLICT (drone_id) DO UPDATE SET
+    latitude = EXCLUDED.latitude,
+    longitude = EXCLUDED.longitude,
+    created_at = EXCLUDED.created_at,
+    pilot_id = EXCLUDED.pilot_id
+WHERE drone_latest.created_at <= EXCLUDED.created_at;
+"""
+
+
+def _to_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for drone_id, latitude, longitude, created_at, pilot_id, *key in rows:
+        writer.writerow([
+            drone_id,
+            latitude,
+            longitude,
+            created_at.isoformat() if hasattr(created_at, 'isoformat') else created_at,
+            '' if pilot_id is None else pilot_id,
+            key[0] if key and key[0] is not None else '',
+        ])
+    buffer.seek(0)
+    return buffer
+
+
+class IngestStats:
+    """Running totals plus recent batch latencies for rows/sec and percentiles."""
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.batches = 0
+        self.rows = 0
+        self.inserted = 0
+        self.seconds = 0.0
+        self.latencies = []
+        self._lock = threading.Lock()
+
+    def record(self, rows, inserted, seconds):
+        with self._lock:
+            self.batches += 1
+            self.rows += rows
+            self.inserted += inserted
+            self.seconds += seconds
+            self.latencies.append(seconds)
+            del self.latencies[:-self.window]
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            snapshot = {
+                'batches': self.batches,
+                'rows': self.rows,
+                'inserted': self.inserted,
+                'duplicates': self.rows - self.inserted,
+                'rows_per_second': self.rows / self.seconds if self.seconds else 0.0,
+            }
+        for name, q in (('batch_p50', 0.5), ('batch_p95', 0.95), ('batch_max', 1.0)):
+            snapshot[name] = latencies[min(int(q * len(latencies)), len(latencies) - 1)] if latencies else 0.0
+        return snapshot
+
+
+stats = IngestStats()
+
+
+def _merge(cur, buffer):
+    # Rewound for every attempt of db.retrying
+    buffer.seek(0)
+    cur.execute(CREATE_STAGING_QUERY)
+    cur.copy_expert(COPY_STAGING_QUERY, buffer)
+    cur.execute(RESOLVE_PILOTS_QUERY)
+    if cur.rowcount:
+        metrics.count('ingest_unknown_pilots', cur.rowcount)
+    cur.execute(CLAIM_STAGED_QUERY)
+    cur.execute(MERGE_FLEET_QUERY)
+    cur.execute(MERGE_HISTORY_QUERY)
+    inserted = cur.rowcount
+    cur.execute(MERGE_LATEST_QUERY)
+    return inserted
+
+
+def _copy_and_merge(buffer, count):
+    started = time.perf_counter()
+    inserted = db.retrying(lambda cur: _merge(cur, buffer))
+    seconds = time.perf_counter() - started
+    stats.record(count, inserted, seconds)
+    metrics.observe('ingest_batch_seconds', seconds)
+    metrics.count('ingest_rows', count)
+    return inserted
+
+
+def write_batch(rows):
+    """COPY (drone_id, latitude, longitude, created_at, pilot_id) rows into
+    staging and merge them into fleet, drones and drone_latest in one transaction.
+
+    A row may carry an idempotency key as a sixth element; rows whose key
+    was accepted before are dropped. The transaction is retried on
+    transient errors. Returns the number of history rows actually inserted.
+    """
+    if not rows:
+        return 0
+    return _copy_and_merge(_to_csv(rows), len(rows))
+
+
+def write_batch_isolated(rows, offset=0):
+    """write_batch, except that a batch rejected for its data (a malformed
+    row, a constraint) is split in halves and retried until the offending
+    rows are found, so they don't take the rest of the batch with them.
+
+    Returns (inserted, rejected) with rejected a list of (index, error) of
+    the rows that couldn't be written. Transient errors still failing
+    after db.retrying are raised.
+    """
+    try:
+        return write_batch(rows), []
+    except psycopg2.Error as e:
+        if isinstance(e, db.TRANSIENT_ERRORS):
+            raise
+        if len(rows) == 1:
+            metrics.count('ingest_rejected_rows')
+            return 0, [(offset, str(e).strip().splitlines()[0])]
+    middle = len(rows) // 2
+    inserted, rejected = write_batch_isolated(rows[:middle], offset)
+    more, also = write_batch_isolated(rows[middle:], offset + middle)
+    return inserted + more, rejected + also
+
+
+def write_frame(frame):
+    """Same as write_batch for a DataFrame with the staging columns; the CSV
+    is produced column-wise by pandas instead of row by row."""
+    if frame.empty:
+        return 0
+    frame = frame.reindex(columns=STAGING_COLUMNS).astype({'pilot_id': 'Int64'})
+    buffer = io.StringIO()
+    frame.to_csv(buffer, header=False, index=False, date_format='%Y-%m-%dT%H:%M:%S.%f')
+    buffer.seek(0)
+    return _copy_and_merge(buffer, len(frame))
+
+
+def batches(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def read_csv(stream):
+    """Yield position tuples from CSV text, skipping a header row if present."""
+    for record in csv.reader(stream):
+        if not record or record[0] == 'drone_id':
+            continue
+        drone_id, latitude, longitude, created_at = record[:4]
+        pilot_id = record[4] if len(record) > 4 and record[4] != '' else None
+        yield (drone_id, float(latitude), float(longitude), created_at, pilot_id)
+
+
+def ingest_stream(stream, batch_size=5000):
+    inserted = 0
+    for batch in batches(read_csv(stream), batch_size):
+        inserted += write_batch(batch)
+    return inserted
+
+
+class QueueIngestor(threading.Thread):
+    """Background writer draining an in-process queue of position tuples.
+
+    A batch is flushed when it reaches `batch_size` rows or when
+    `flush_interval` seconds have passed since its first row.
+    """
+
+    def __init__(self, source=None, batch_size=5000, flush_interval=1.0):
+        super().__init__(daemon=True, name='queue-ingestor')
+        self.queue = source if source is not None else queue.Queue(maxsize=batch_size * 10)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.errors = 0
+        self._stopping = threading.Event()
+
+    def put(self, position, timeout=None):
+        # Blocks when the queue is full, pushing back on producers
+        self.queue.put(position, timeout=timeout)
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self.join(timeout)
+
+    def run(self):
+        batch = []
+        deadline = None
+        while not (self._stopping.is_set() and self.queue.empty() and not batch):
+            timeout = self.flush_interval if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            except queue.Empty:
+                pass
+
+            draining = self._stopping.is_set() and self.queue.empty()
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline or draining):
+                try:
+                    _, rejected = write_batch_isolated(batch)
+                    for index, error in rejected:
+                        self.errors += 1
+                        print(f"Error writing position {batch[index]}: {error}", file=sys.stderr)
+                except Exception as e:
+                    self.errors += 1
+                    print(f"Error writing batch of {len(batch)} positions: {e}", file=sys.stderr)
+                batch = []
+                deadline = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-load drone telemetry CSV (drone_id,latitude,longitude,created_at[,pilot_id])")
+    parser.add_argument("file", nargs="?", default="-", help="CSV file to load, or - for stdin")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--metrics", help="write timings to this file (.prom for Prometheus text, else JSON)")
+    args = parser.parse_args()
+
+    try:
+        if args.file == "-":
+            inserted = ingest_stream(sys.stdin, args.batch_size)
+        else:
+            with open(args.file, newline='') as f:
+                inserted = ingest_stream(f, args.batch_size)
+
+        summary = stats.snapshot()
+        print(f"Ingested {summary['rows']} rows ({inserted} new) in {summary['batches']} batches, "
+              f"{summary['rows_per_second']:.0f} rows/sec, "
+              f"batch p50 {summary['batch_p50'] * 1000:.1f} ms, p95 {summary['batch_p95'] * 1000:.1f} ms")
+        if args.metrics:
+            metrics.write(args.metrics)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,332 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import tornado.web
+import tornado.websocket
+
+import ingest
+from metrics import metrics
+
+
+class ReportError(ValueError):
+    pass
+
+
+def parse_timestamp(value):
+    """Device timestamp (ISO 8601 or Unix seconds) as naive local time, like the rest of the tables."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return datetime.fromtimestamp(value)
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            raise ReportError(f"bad timestamp: {value!r}")
+        return parsed.astimezone().replace(tzinfo=None) if parsed.tzinfo else parsed
+    raise ReportError("missing timestamp")
+
+
+def parse_report(report):
+    """Turn one JSON position report into an ingest tuple."""
+    if not isinstance(report, dict):
+        raise ReportError("report must be an object")
+    try:
+        drone_id = str(report['drone_id'])
+        latitude = float(report['latitude'])
+        longitude = float(report['longitude'])
+    except (KeyError, TypeError, ValueError):
+        raise ReportError("drone_id, latitude and longitude are required")
+    if not drone_id or len(drone_id) > 50:
+        raise ReportError("drone_id must be 1-50 characters")
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ReportError("coordinates out of range")
+    pilot_id = report.get('pilot_id')
+    if pilot_id is not None and (isinstance(pilot_id, bool) or not isinstance(pilot_id, int)):
+        raise ReportError("pilot_id must be an integer")
+    # Optional; a report sent again with the same key is written once
+    key = report.get('idempotency_key')
+    if key is not None and not (isinstance(key, str) and 0 < len(key) <= 100):
+        raise ReportError("idempotency_key must be a string of 1-100 characters")
+    return (drone_id, latitude, longitude, parse_timestamp(report.get('timestamp')), pilot_id, key)
+
+
+def parse_body(body):
+    """Parse a JSON report or list of reports into ingest tuples."""
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise ReportError("body is not valid JSON")
+    reports = payload if isinstance(payload, list) else [payload]
+    return [parse_report(report) for report in reports]
+
+
+class BatchWriter:
+    """Coalesces queued reports into batches written through
+    ingest.write_batch_isolated, so a bad report fails alone.
+
+    The queue is bounded; producers awaiting put() are what slows clients
+    down when the database falls behind. Batches go to a small thread
+    pool since the write path (psycopg2 COPY) is blocking.
+    """
+
+    def __init__(self, batch_size=5000, flush_interval=0.5, max_queue=50000, writers=1):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.executor = ThreadPoolExecutor(max_workers=writers, thread_name_prefix='ingest-writer')
+        self.writers = writers
+        self.errors = 0
+        self.rejected = 0
+        # Reports the database refused (e.g. malformed), written by nobody
+        self.failed = 0
+        self._tasks = []
+
+    async def put(self, positions, timeout=None, results=None):
+        """Queue positions, waiting up to `timeout` seconds for space.
+
+        Returns False on timeout. Retrying is safe: anything already queued
+        is deduplicated on its idempotency key, or on (drone_id, created_at),
+        when written. `results`, if given, holds one future per position,
+        resolved once its batch is written (see write()).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for i, position in enumerate(positions):
+            item = (position, results[i] if results is not None else None)
+            try:
+                if deadline is None:
+                    await self.queue.put(item)
+                else:
+                    await asyncio.wait_for(self.queue.put(item), max(deadline - time.monotonic(), 0.001))
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                for future in (results or [])[i:]:
+                    future.cancel()
+                return False
+        return True
+
+    async def write(self, positions, timeout=None):
+        """Queue positions and wait until they are written.
+
+        Returns one entry per position: None once it is stored (or was a
+        replay of one already stored), else the database's reason for
+        refusing it. Returns False if the queue stayed full, and raises
+        if the batch couldn't be written (transient errors outlasting
+        db.retrying); resending with the same keys is safe either way.
+        """
+        loop = asyncio.get_running_loop()
+        results = [loop.create_future() for _ in positions]
+        if not await self.put(positions, timeout, results):
+            # Ones already queued are still written
+            await asyncio.gather(*results, return_exceptions=True)
+            return False
+        return await asyncio.gather(*results)
+
+    async def _next_batch(self):
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            positions = [position for position, _ in batch]
+            try:
+                _, rejected = await loop.run_in_executor(self.executor, ingest.write_batch_isolated, positions)
+                self.failed += len(rejected)
+                errors = dict(rejected)
+                for index, error in rejected:
+                    print(f"Error writing position {positions[index]}: {error}", file=sys.stderr)
+                for i, (_, result) in enumerate(batch):
+                    if result is not None and not result.done():
+                        result.set_result(errors.get(i))
+            except Exception as e:
+                self.errors += 1
+                print(f"Error writing batch of {len(batch)} positions: {e}", file=sys.stderr)
+                for _, result in batch:
+                    if result is not None and not result.done():
+                        result.set_exception(e)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.writers)]
+
+    async def stop(self):
+        # Flush what is already queued, then stop the writer tasks
+        await self.queue.join()
+        for task in self._tasks:
+            task.cancel()
+        self.executor.shutdown(wait=True)
+
+    def status(self):
+        return {
+            'queued': self.queue.qsize(),
+            'max_queue': self.queue.maxsize,
+            'rejected': self.rejected,
+            'failed': self.failed,
+            'errors': self.errors,
+            'ingest': ingest.stats.snapshot(),
+        }
+
+
+def waits(handler):
+    """Whether the request asked (?wait=1) for results after the write."""
+    return handler.get_argument('wait', '') not in ('', '0', 'false')
+
+
+def write_summary(results):
+    """JSON answer for the results of BatchWriter.write()."""
+    failed = [{'index': i, 'error': error} for i, error in enumerate(results) if error is not None]
+    return {'written': len(results) - len(failed), 'failed': failed}
+
+
+class PositionsHandler(tornado.web.RequestHandler):
+    """POST one report or a JSON list of reports.
+
+    Answers 202 once they are queued, or with ?wait=1 after they are
+    written: 200 listing the reports the database refused, or 503 if the
+    write failed and the request should be sent again.
+    """
+
+    def initialize(self, writer, put_timeout):
+        self.writer = writer
+        self.put_timeout = put_timeout
+
+    async def post(self):
+        try:
+            positions = parse_body(self.request.body)
+        except ReportError as e:
+            self.set_status(400)
+            self.finish({'error': str(e)})
+            return
+        if waits(self):
+            await self._write(positions)
+            return
+        if not await self.writer.put(positions, self.put_timeout):
+            self._unavailable('ingest queue is full')
+            return
+        self.set_status(202)
+        self.finish({'accepted': len(positions)})
+
+    async def _write(self, positions):
+        try:
+            results = await self.writer.write(positions, self.put_timeout)
+        except Exception as e:
+            self._unavailable(f"write failed: {e}")
+            return
+        if results is False:
+            self._unavailable('ingest queue is full')
+            return
+        self.finish(write_summary(results))
+
+    def _unavailable(self, error):
+        self.set_status(503)
+        self.set_header('Retry-After', '1')
+        self.finish({'error': error})
+
+
+class PositionsSocket(tornado.websocket.WebSocketHandler):
+    """Each message is a report or a list of reports; each gets an ack.
+
+    The ack is {'accepted': n} once they are queued, or, on a socket
+    opened with ?wait=1, {'written', 'failed'} after they are written (as
+    for POST /positions?wait=1), or {'error'} if the write failed and the
+    message should be sent again. Tornado reads the next message only
+    after on_message returns, so a full queue stops reading from the
+    socket and TCP pushes back on the client.
+    """
+
+    def initialize(self, writer):
+        self.writer = writer
+
+    def open(self):
+        self.wait = waits(self)
+
+    def check_origin(self, origin):
+        return True
+
+    async def on_message(self, message):
+        try:
+            positions = parse_body(message)
+        except ReportError as e:
+            await self.write_message({'error': str(e)})
+            return
+        if not self.wait:
+            await self.writer.put(positions)
+            await self.write_message({'accepted': len(positions)})
+            return
+        try:
+            results = await self.writer.write(positions)
+        except Exception as e:
+            await self.write_message({'error': f"write failed: {e}"})
+            return
+        await self.write_message(write_summary(results))
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header('Content-Type', 'text/plain; version=0.0.4')
+        self.finish(metrics.prometheus())
+
+
+class StatusHandler(tornado.web.RequestHandler):
+    def initialize(self, writer):
+        self.writer = writer
+
+    def get(self):
+        self.finish(self.writer.status())
+
+
+def make_app(writer, put_timeout=5.0):
+    return tornado.web.Application([
+        (r'/positions', PositionsHandler, {'writer': writer, 'put_timeout': put_timeout}),
+        (r'/ws', PositionsSocket, {'writer': writer}),
+        (r'/status', StatusHandler, {'writer': writer}),
+        (r'/metrics', MetricsHandler),
+    ])
+
+
+async def serve(port, batch_size, flush_interval, max_queue, writers, put_timeout):
+    writer = BatchWriter(batch_size, flush_interval, max_queue, writers)
+    writer.start()
+    server = make_app(writer, put_timeout).listen(port)
+    print(f"Ingest service listening on :{port} (POST /positions, WebSocket /ws, GET /status, GET /metrics)")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        server.stop()
+        await writer.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP/WebSocket telemetry ingest service")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--flush-interval", type=float, default=0.5, help="seconds a batch may wait to fill")
+    parser.add_argument("--max-queue", type=int, default=50000, help="queued reports before clients are slowed down")
+    parser.add_argument("--writers", type=int, default=1, help="concurrent batch writers")
+    parser.add_argument("--put-timeout", type=float, default=5.0, help="seconds an HTTP request waits for queue space")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.port, args.batch_size, args.flush_interval, args.max_queue, args.writers,
+                          args.put_timeout))
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
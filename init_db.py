@@ -1,60 +1,47 @@
-import os
-import psycopg2
-from psycopg2 import sql
-import streamlit as st
+import sys
 
-DATABASE_URL = st.secrets["db_url"]
+import db
+import migrations
+import positions
 
-def create_database():
+def migrate_database():
     try:
-        # Connect to PostgreSQL
-        conn = psycopg2.connect(DATABASE_URL)
-        
-        # Create a cursor
-        cur = conn.cursor()
-        
-        # Create pilots table first (parent table)
-        create_pilots_table = """
-        CREATE TABLE IF NOT EXISTS pilots (
-            id SERIAL PRIMARY KEY,
-            first_name VARCHAR(50) NOT NULL,
-            last_name VARCHAR(50) NOT NULL,
-            phone_number VARCHAR(20) NOT NULL,
-            email VARCHAR(100) NOT NULL,
-            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(email)
-        );
-        """
-        
-        # Create drones table with pilot_id foreign key
-        create_drones_table = """
-        CREATE TABLE IF NOT EXISTS drones (
-            id SERIAL PRIMARY KEY,
-            drone_id VARCHAR(50) NOT NULL,
-            latitude DOUBLE PRECISION NOT NULL,
-            longitude DOUBLE PRECISION NOT NULL,
-            created_at TIMESTAMP NOT NULL,
-            pilot_id INTEGER REFERENCES pilots(id),
-            UNIQUE(drone_id, created_at)
-        );
-        """
-        
-        # Execute the create table queries
-        cur.execute(create_pilots_table)
-        cur.execute(create_drones_table)
-        
-        # Commit the changes
-        conn.commit()
-        
-        print("Database and tables created successfully!")
-        
+        before = migrations.current_version()
+        applied = migrations.migrate()
+
+        for version, description in applied:
+            print(f"Applied migration {version}: {description}")
+
+        print(f"Schema is at version {migrations.current_version()} (was {before})")
+
+    except Exception as e:
+        print(f"Error: {e}")
+
+def backfill_drone_latest():
+    try:
+        # Populate drone_latest from existing history; safe to re-run
+        with db.transaction() as cur:
+            count = positions.backfill_latest(cur)
+
+        print(f"Backfilled latest positions for {count} drones!")
+
+    except Exception as e:
+        print(f"Error: {e}")
+
+def explain_queries(analyze=False):
+    try:
+        for name, plan in migrations.explain(analyze=analyze).items():
+            print(f"=== {name} ===")
+            print(plan)
+            print()
+
     except Exception as e:
         print(f"Error: {e}")
-    finally:
-        if 'cur' in locals():
-            cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 if __name__ == "__main__":
-    create_database() 
\ No newline at end of file
+    if "--explain" in sys.argv:
+        explain_queries(analyze="--analyze" in sys.argv)
+    elif "--backfill" in sys.argv:
+        backfill_drone_latest()
+    else:
+        migrate_database()
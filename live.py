@@ -0,0 +1,238 @@
+import select
+import sys
+import threading
+import time
+from collections import deque
+
+import pandas as pd
+import psycopg2
+
+import columnar
+import db
+import map_layers
+import positions
+import queries
+import warm_start
+import zones
+from metrics import metrics
+
+CHANNEL = 'drone_latest_changed'
+
+# Notifications arriving within this many seconds are applied together
+COALESCE_SECONDS = 0.1
+# Seconds between reconnect attempts after the listener connection fails
+RECONNECT_SECONDS = 5
+# Drone ids per refetch query
+FETCH_CHUNK = 10000
+
+# Snapshot versions whose changed drone ids are kept for changed_since()
+CHANGELOG_VERSIONS = 200
+
+# `marker` is the drone's pre-rendered marker row (map_layers.marker_prefixes)
+SNAPSHOT_COLUMNS = ['drone_id', 'latitude', 'longitude', 'created_at', 'pilot_id', 'marker']
+
+
+def prepare(frame):
+    """Typed snapshot rows for freshly fetched positions: nullable 32-bit
+    pilot ids instead of float64, and the marker row rendered once here
+    rather than in every session."""
+    frame = frame.astype({'pilot_id': 'Int32'})
+    frame['marker'] = map_layers.marker_prefixes(frame)
+    return frame
+
+
+class FleetSnapshot:
+    """Latest position of every drone, shared by all sessions in the process.
+
+    The frame is replaced, never modified, so readers can keep using the
+    one they got. `version` increases with every change, and the drones
+    each recent version changed are kept so a session can ask what changed
+    since the version it last rendered.
+    """
+
+    def __init__(self):
+        self._state = (0, prepare(pd.DataFrame(columns=SNAPSHOT_COLUMNS[:-1])), None)  # (version, frame, updated_at)
+        # When the file the current frame was restored from was saved; None
+        # once the frame comes from Postgres
+        self.restored_at = None
+        # (version, ids of the drones it changed, or None for a full reload)
+        self._changes = deque(maxlen=CHANGELOG_VERSIONS)
+        self._changed = threading.Condition()
+        # Serializes reload() and apply(), reads included, which both
+        # derive a new frame
+        self._write_lock = threading.Lock()
+
+    def current(self):
+        """Return (version, frame) as one consistent pair."""
+        version, frame, _ = self._state
+        return version, frame
+
+    @property
+    def version(self):
+        return self._state[0]
+
+    @property
+    def updated_at(self):
+        return self._state[2]
+
+    def changed_since(self, version):
+        """Ids of the drones changed after `version`, or None if that is no
+        longer known (too old, or a full reload happened since)."""
+        if version is None:
+            return None
+        with self._changed:
+            current = self._state[0]
+            changes = list(self._changes)
+        if version >= current:
+            return set()
+        if not changes or changes[0][0] > version + 1:
+            return None
+        drone_ids = set()
+        for changed_version, changed_ids in changes:
+            if changed_version <= version:
+                continue
+            if changed_ids is None:
+                return None
+            drone_ids.update(changed_ids)
+        return drone_ids
+
+    def _publish(self, frame, drone_ids=None, updated_at=None):
+        with self._changed:
+            version = self._state[0] + 1
+            self._state = (version, frame, updated_at or time.time())
+            self._changes.append((version, drone_ids))
+            self._changed.notify_all()
+
+    def reload(self):
+        with self._write_lock, metrics.timed('snapshot_reload_seconds'):
+            frame = prepare(columnar.fetch_frame(queries.LATEST_POSITIONS_QUERY))
+            self.restored_at = None
+            self._publish(frame)
+
+    def restore(self, frame, saved_at):
+        """Publish a frame saved by an earlier process (warm_start), unless
+        Postgres has been read already."""
+        with self._write_lock:
+            if self.version > 0:
+                return
+            self.restored_at = saved_at
+            self._publish(frame, updated_at=saved_at)
+
+    def apply(self, drone_ids):
+        """Refetch the given drones; ones no longer in drone_latest are dropped."""
+        started = time.perf_counter()
+        drone_ids = sorted(drone_ids)
+        # Fetched under the lock too: rows read before a concurrent
+        # reload() must not replace the newer ones it published
+        with self._write_lock:
+            fetched = [
+                prepare(columnar.fetch_frame(queries.LATEST_POSITIONS_BY_ID_QUERY, {'drone_ids': drone_ids[i:i + FETCH_CHUNK]}))
+                for i in range(0, len(drone_ids), FETCH_CHUNK)
+            ]
+            _, frame = self.current()
+            rest = positions.drop_from_frame(frame, drone_ids)
+            rows = [part for part in fetched + [rest] if not part.empty]
+            merged = pd.concat(rows, ignore_index=True) if rows else rest
+            self._publish(merged.sort_values('created_at', ascending=False, kind='stable', ignore_index=True),
+                          frozenset(drone_ids))
+        metrics.observe('snapshot_apply_seconds', time.perf_counter() - started)
+        metrics.count('snapshot_changed_drones', len(drone_ids))
+
+    def wait_newer(self, version, timeout):
+        """Block until the snapshot is newer than `version`; False on timeout."""
+        with self._changed:
+            return self._changed.wait_for(lambda: self._state[0] > version, timeout)
+
+
+class SnapshotListener(threading.Thread):
+    """LISTENs for drone_latest changes on its own connection and applies them to the snapshot."""
+
+    def __init__(self, snapshot):
+        super().__init__(daemon=True, name='snapshot-listener')
+        self.snapshot = snapshot
+        self.notifications = 0
+        self.errors = 0
+        self._stopping = threading.Event()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self.join(timeout)
+
+    def _collect(self, conn, drone_ids):
+        conn.poll()
+        while conn.notifies:
+            drone_ids.update(conn.notifies.pop(0).payload.split(','))
+            self.notifications += 1
+
+    def _listen(self, conn):
+        while not self._stopping.is_set():
+            if select.select([conn], [], [], 1.0) == ([], [], []):
+                continue
+            drone_ids = set()
+            self._collect(conn, drone_ids)
+            # Let a burst of commits pile up, then refetch them together
+            time.sleep(COALESCE_SECONDS)
+            self._collect(conn, drone_ids)
+            drone_ids.discard('')
+            if drone_ids:
+                self.snapshot.apply(drone_ids)
+
+    def run(self):
+        while not self._stopping.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(db.database_url())
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CHANNEL};")
+                # Changes made while we weren't listening have no notification
+                self.snapshot.reload()
+                self._listen(conn)
+            except Exception as e:
+                self.errors += 1
+                print(f"Error in snapshot listener: {e}", file=sys.stderr)
+                self._stopping.wait(RECONNECT_SECONDS)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+
+_snapshot = None
+_listener = None
+_writer = None
+_lock = threading.Lock()
+
+
+def get_snapshot(timeout=30):
+    """The process-wide snapshot, subscribed on first use.
+
+    It starts from the file warm_start saved last, if any, and the
+    listener's first reload replaces that with Postgres' state. Without a
+    file the first caller waits up to `timeout` seconds for that load.
+    """
+    global _snapshot, _listener, _writer
+    with _lock:
+        if _snapshot is None:
+            _snapshot = FleetSnapshot()
+            warm_start.restore(_snapshot, zones.get_registry())
+            _listener = SnapshotListener(_snapshot)
+            _listener.start()
+            _writer = warm_start.SnapshotWriter(_snapshot, zones.get_registry())
+            _writer.start()
+            _snapshot.wait_newer(0, timeout)
+        return _snapshot
+
+
+def listener_stats():
+    if _listener is None:
+        return {}
+    return {
+        'alive': _listener.is_alive(),
+        'notifications': _listener.notifications,
+        'errors': _listener.errors,
+        'version': _snapshot.version,
+        'updated_at': _snapshot.updated_at,
+        'restored_at': _snapshot.restored_at,
+        'saved_version': _writer.saved_version,
+        'save_errors': _writer.errors,
+    }
@@ -1,271 +1,410 @@
 import os
+import uuid
+import time
 import streamlit as st
 import pandas as pd
-import folium
 from streamlit_folium import st_folium
-from folium.plugins import MarkerCluster
-import psycopg2
-from datetime import datetime
-from dotenv import load_dotenv
-load_dotenv()
+from datetime import datetime, timedelta
 
-# Debug database connection
+# db loads .env once per process. history and fleet_registry are imported
+# where they're used, so a live-only rerun never touches them.
+import db
+from cache import cache
+import geofence
+import live
+import map_layers
+from metrics import metrics
+import pilots
+import positions
+import prediction
+import viewport
+import warm_start
+import zones
+
+# Set page to wide mode
+st.set_page_config(layout="wide")
+
+# Stage timings for the performance panel (DASHBOARD_ADMIN=1) and, when
+# METRICS_FILE is set, for an exported file
+ADMIN_PANEL = os.getenv("DASHBOARD_ADMIN") == "1"
+METRICS_FILE = os.getenv("METRICS_FILE")
+metrics.count('reruns')
+
+# Debug database connection, checked once per process; a failure isn't
+# cached, so the next rerun tries again
+PROBE_KEY = 'db:probe'
 try:
-    conn = psycopg2.connect(st.secrets["db_url"])
+    cache.get_or_load(PROBE_KEY, metrics.timed('probe_seconds')(db.check_connection))
     st.success("Database connection successful!")
-    conn.close()
 except Exception as e:
     st.error(f"Database connection failed: {str(e)}")
 
-# Set page to wide mode
-st.set_page_config(layout="wide")
-
 st.header('Карта активных дронов')
 
-# Database connection string
-DATABASE_URL = st.secrets["db_url"]
-
-# Define restricted areas
-RESTRICTED_AREAS = {
-    'akorda': {
-        'name': 'Акорда',
-        'description': 'Президентский дворец Казахстана',
-        'coordinates': [
-            [51.1255, 71.4305],  # Northwest
-            [51.1255, 71.4355],  # Northeast
-            [51.1225, 71.4355],  # Southeast
-            [51.1225, 71.4305],  # Southwest
-            [51.1255, 71.4305]   # Close the polygon
-        ],
-        'color': 'red'
-    },
-    'parliament': {
-        'name': 'Парламент',
-        'description': 'Здание Парламента Республики Казахстан',
-        'coordinates': [
-            [51.1275, 71.4455],
-            [51.1275, 71.4505],
-            [51.1245, 71.4505],
-            [51.1245, 71.4455],
-            [51.1275, 71.4455]
-        ],
-        'color': 'red'
-    },
-    'khan_shater': {
-        'name': 'Хан Шатыр',
-        'description': 'Торгово-развлекательный центр',
-        'coordinates': [
-            [51.1305, 71.4055],
-            [51.1305, 71.4105],
-            [51.1275, 71.4105],
-            [51.1275, 71.4055],
-            [51.1305, 71.4055]
-        ],
-        'color': 'orange'
-    },
-    'bayterek': {
-        'name': 'Байтерек',
-        'description': 'Национальный символ Казахстана',
-        'coordinates': [
-            [51.1285, 71.4305],
-            [51.1285, 71.4355],
-            [51.1255, 71.4355],
-            [51.1255, 71.4305],
-            [51.1285, 71.4305]
-        ],
-        'color': 'orange'
-    },
-    'nazarbayev_center': {
-        'name': 'Центр Назарбаева',
-        'description': 'Музей и культурный центр',
-        'coordinates': [
-            [51.1325, 71.4255],
-            [51.1325, 71.4305],
-            [51.1295, 71.4305],
-            [51.1295, 71.4255],
-            [51.1325, 71.4255]
-        ],
-        'color': 'orange'
-    },
-    'military_base': {
-        'name': 'Военная база',
-        'description': 'Военное подразделение',
-        'coordinates': [
-            [51.1355, 71.4155],
-            [51.1355, 71.4205],
-            [51.1325, 71.4205],
-            [51.1325, 71.4155],
-            [51.1355, 71.4155]
-        ],
-        'color': 'red'
-    },
-    'airport': {
-        'name': 'Международный аэропорт',
-        'description': 'Аэропорт Нурсултан Назарбаев',
-        'coordinates': [
-            [51.0225, 71.4655],
-            [51.0225, 71.4755],
-            [51.0175, 71.4755],
-            [51.0175, 71.4655],
-            [51.0225, 71.4655]
-        ],
-        'color': 'red'
-    },
-    'train_station': {
-        'name': 'Железнодорожный вокзал',
-        'description': 'Главный железнодорожный вокзал',
-        'coordinates': [
-            [51.1825, 71.4155],
-            [51.1825, 71.4205],
-            [51.1795, 71.4205],
-            [51.1795, 71.4155],
-            [51.1825, 71.4155]
-        ],
-        'color': 'orange'
-    },
-    'power_plant': {
-        'name': 'ТЭЦ-2',
-        'description': 'Теплоэлектроцентраль',
-        'coordinates': [
-            [51.1925, 71.4255],
-            [51.1925, 71.4305],
-            [51.1895, 71.4305],
-            [51.1895, 71.4255],
-            [51.1925, 71.4255]
-        ],
-        'color': 'red'
-    },
-    'water_reservoir': {
-        'name': 'Водохранилище',
-        'description': 'Главное водохранилище города',
-        'coordinates': [
-            [51.1425, 71.3955],
-            [51.1425, 71.4005],
-            [51.1395, 71.4005],
-            [51.1395, 71.3955],
-            [51.1425, 71.3955]
-        ],
-        'color': 'orange'
-    }
-}
-
-def remove_drone(drone_id):
+# Process-wide cache entries. Drone positions come from the live snapshot
+# (kept current by LISTEN/NOTIFY); these are derived from it or rarely change.
+TRACKS_KEY = 'drones:tracks'
+VIOLATIONS_KEY = 'drones:violations'
+PREDICTIONS_KEY = 'drones:predictions'
+PILOT_SEARCH_KEY = 'pilots:search'
+PILOT_DETAILS_KEY = 'pilots:details'
+FLEET_KEY = 'fleet:all'
+ANALYTICS_WATERMARK_KEY = 'analytics:watermark'
+ANALYTICS_KEY = 'analytics:view'
+CACHE_TTL = 30  # seconds
+
+# Once analytics has been viewed, a background thread folds new positions
+# into the rollups this often; the page itself only reads the watermark.
+# Rollups further behind than ANALYTICS_STALE_SECONDS are flagged.
+ANALYTICS_REFRESH_SECONDS = 60
+ANALYTICS_STALE_SECONDS = 15 * 60
+
+# How often the map checks the snapshot for changes, and how long a write
+# waits for the snapshot to pick it up before rerunning
+LIVE_REFRESH_SECONDS = 2
+WRITE_VISIBLE_TIMEOUT = 2
+
+DRONE_COLUMNS = ['drone_id', 'latitude', 'longitude', 'created_at', 'pilot_id']
+GRID_COLUMNS = ['cell_row', 'cell_col', 'drones', 'latitude', 'longitude']
+PILOT_DETAIL_COLUMNS = ['first_name', 'last_name', 'phone_number']
+
+def deactivate_drones(drone_ids):
+    import fleet_registry
     try:
-        conn = psycopg2.connect(DATABASE_URL)
-        cur = conn.cursor()
-        
-        delete_query = """
-        DELETE FROM drones
-        WHERE drone_id = %s;
-        """
-        
-        cur.execute(delete_query, (drone_id,))
-        
-        conn.commit()
-        return True
+        version = live.get_snapshot().version
+        # One statement: the drones stay in the fleet and keep their history
+        count = fleet_registry.deactivate(drone_ids)
+        cache.invalidate(tag='fleet')
+        # Predictions outlive snapshot versions; drop the deactivated drones now
+        cache.invalidate(tag='drones')
+
+        # The delete's notification updates the snapshot; wait for it so
+        # the rerun already shows the change
+        if count:
+            live.get_snapshot().wait_newer(version, WRITE_VISIBLE_TIMEOUT)
+        return count
     except Exception as e:
-        st.error(f"Error removing drone: {str(e)}")
-        return False
-    finally:
-        if 'cur' in locals():
-            cur.close()
-        if 'conn' in locals():
-            conn.close()
+        st.error(f"Error deactivating drones: {str(e)}")
+        return None
 
-def add_new_drone(drone_id, latitude, longitude, pilot_id=None):
+def reassign_drones(drone_ids, pilot_id):
+    import fleet_registry
     try:
-        conn = psycopg2.connect(DATABASE_URL)
-        cur = conn.cursor()
-        
-        insert_query = """
-        INSERT INTO drones (drone_id, latitude, longitude, created_at, pilot_id)
-        VALUES (%s, %s, %s, %s, %s)
-        """
+        version = live.get_snapshot().version
+        count = fleet_registry.reassign(drone_ids, pilot_id)
+        if count:
+            live.get_snapshot().wait_newer(version, WRITE_VISIBLE_TIMEOUT)
+        return count
+    except Exception as e:
+        st.error(f"Error reassigning drones: {str(e)}")
+        return None
+
+def add_new_drone(drone_id, latitude, longitude, pilot_id, idempotency_key, created_at):
+    """`idempotency_key` and `created_at` are fixed when the form is first
+    submitted, so submitting it again (or a retry) writes the report once."""
+    import fleet_registry
+    try:
+        version = live.get_snapshot().version
         
-        cur.execute(insert_query, (
-            drone_id,
-            latitude,
-            longitude,
-            datetime.now(),
-            pilot_id
-        ))
+        # Registers (or reactivates) the drone, then writes both the
+        # history row and the drone_latest entry; retried as a whole on
+        # deadlocks and dropped connections
+        def write(cur):
+            fleet_registry.import_drones([(drone_id, pilot_id)], activate=True, cur=cur)
+            positions.record_positions(cur, [(
+                drone_id,
+                latitude,
+                longitude,
+                created_at,
+                pilot_id
+            )], keys=[idempotency_key])
+        db.retrying(write)
         
-        conn.commit()
+        cache.invalidate(tag='fleet')
+        live.get_snapshot().wait_newer(version, WRITE_VISIBLE_TIMEOUT)
         return True
     except Exception as e:
         st.error(f"Error adding drone: {str(e)}")
         return False
-    finally:
-        if 'cur' in locals():
-            cur.close()
-        if 'conn' in locals():
-            conn.close()
-
-@st.cache_data(ttl=30)  # Cache for 30 seconds
-def load_data():
+
+def timed_call(name, function, *args):
+    with metrics.timed(name):
+        return function(*args)
+
+def load_fleet():
+    # (version, latest positions of every drone), shared by all sessions
+    with metrics.timed('snapshot_read_seconds'):
+        return live.get_snapshot().current()
+
+def load_zones():
     try:
-        # Connect to PostgreSQL
-        conn = psycopg2.connect(DATABASE_URL)
-        
-        # Query to get the most recent position for each drone with pilot details
-        query = """
-        WITH latest_positions AS (
-            SELECT DISTINCT ON (drone_id)
-                d.drone_id,
-                d.latitude,
-                d.longitude,
-                d.created_at,
-                d.pilot_id,
-                p.first_name,
-                p.last_name,
-                p.phone_number
-            FROM drones d
-            LEFT JOIN pilots p ON d.pilot_id = p.id
-            ORDER BY drone_id, created_at DESC
+        # Restricted areas active now, compiled once per version of the table
+        with metrics.timed('zones_seconds'):
+            return zones.active_zones()
+    except Exception as e:
+        st.error(f"Error loading restricted areas: {str(e)}")
+        return zones.NO_ZONES
+
+def load_violations(version, fleet, active_zones):
+    try:
+        # Computed once per snapshot version and set of zones for every session
+        return cache.get_or_load(
+            (VIOLATIONS_KEY, version, active_zones.key),
+            lambda: timed_call('violations_seconds', geofence.find_violations, fleet, active_zones.geofence),
+            ttl=CACHE_TTL,
+            tags=('drones',)
+        )
+    except Exception as e:
+        st.error(f"Error checking restricted areas: {str(e)}")
+        return pd.DataFrame(columns=geofence.VIOLATION_COLUMNS)
+
+def load_predictions(fleet, active_zones):
+    try:
+        # Extrapolated from recent reports once per prediction step for every
+        # session, not per snapshot version: the version moves with nearly
+        # every notification, and each miss reads the last HISTORY_SECONDS
+        # of reports from the database
+        bucket = int(time.time() // prediction.STEP_SECONDS)
+        at = datetime.fromtimestamp(bucket * prediction.STEP_SECONDS)
+        return cache.get_or_load(
+            (PREDICTIONS_KEY, bucket, active_zones.key),
+            lambda: timed_call('prediction_seconds', prediction.predict_fleet, fleet['drone_id'], active_zones.geofence, at),
+            ttl=CACHE_TTL,
+            tags=('drones',)
         )
-        SELECT * FROM latest_positions
-        ORDER BY created_at DESC;
-        """
-        
-        # Read the query results into a pandas DataFrame
-        data = pd.read_sql_query(query, conn)
-        
-        # Close the connection
-        conn.close()
-        
-        return data
     except Exception as e:
-        st.error(f"Error loading drone data from database: {str(e)}")
-        return pd.DataFrame(columns=['drone_id', 'latitude', 'longitude', 'created_at', 'pilot_id', 'first_name', 'last_name', 'phone_number'])
+        st.error(f"Error predicting trajectories: {str(e)}")
+        return prediction.empty_prediction()
     
-@st.cache_data(ttl=30)  # Cache for 30 seconds
-def load_pilots():
+def search_pilots(text, page):
     try:
-        conn = psycopg2.connect(DATABASE_URL)
-        
-        query = """
-        SELECT id, first_name, last_name, phone_number
-        FROM pilots
-        ORDER BY first_name, last_name;
-        """
-        
-        pilots = pd.read_sql_query(query, conn)
-        conn.close()
-        return pilots
+        return cache.get_or_load(
+            (PILOT_SEARCH_KEY, text.strip().lower(), page),
+            lambda: pilots.search(text, page),
+            ttl=CACHE_TTL,
+            tags=('pilots',)
+        )
+    except Exception as e:
+        st.error(f"Error searching pilots: {str(e)}")
+        return pd.DataFrame(columns=pilots.PILOT_COLUMNS), False
+
+def with_pilots(data):
+    # Pilot details only for the drones on screen, in one batch query
+    pilot_ids = tuple(sorted(data['pilot_id'].dropna().astype(int).unique().tolist()))
+    try:
+        details = cache.get_or_load(
+            (PILOT_DETAILS_KEY, pilot_ids),
+            lambda: pilots.by_id(pilot_ids),
+            ttl=CACHE_TTL,
+            tags=('pilots',)
+        )
     except Exception as e:
         st.error(f"Error loading pilots: {str(e)}")
-        return pd.DataFrame(columns=['id', 'first_name', 'last_name', 'phone_number'])
+        details = pd.DataFrame(columns=pilots.PILOT_COLUMNS)
+    details = details.set_index('id')
+    data = data.copy()
+    for column in PILOT_DETAIL_COLUMNS:
+        data[column] = data['pilot_id'].map(details[column]).astype(object)
+    return data
 
-data = load_data()
+def load_registry():
+    import fleet_registry
+    try:
+        # Every registered drone, including deactivated ones, whose
+        # history stays viewable
+        return cache.get_or_load(
+            FLEET_KEY,
+            lambda: timed_call('db_fleet_seconds', fleet_registry.load_fleet),
+            ttl=CACHE_TTL,
+            tags=('fleet',)
+        )
+    except Exception as e:
+        st.error(f"Error loading fleet: {str(e)}")
+        return pd.DataFrame(columns=['drone_id', 'pilot_id', 'active'])
+
+def load_tracks(drone_ids, start, end):
+    import history
+    try:
+        # Downsampled on the server and fetched page by page
+        return cache.get_or_load(
+            (TRACKS_KEY, tuple(drone_ids), start, end),
+            lambda: timed_call('db_tracks_seconds', history.load_tracks, drone_ids, start, end),
+            ttl=CACHE_TTL,
+            tags=('drones', TRACKS_KEY)
+        )
+    except Exception as e:
+        st.error(f"Error loading track history: {str(e)}")
+        return pd.DataFrame(columns=history.TRACK_COLUMNS), 1
+
+def analytics_watermark():
+    import analytics
+    # The catch-up runs in the background, never inside a page view
+    analytics.start_refresher(ANALYTICS_REFRESH_SECONDS)
+    try:
+        # Returns how far the rollups are complete
+        return cache.get_or_load(
+            ANALYTICS_WATERMARK_KEY,
+            lambda: timed_call('analytics_watermark_seconds', analytics.watermark),
+            ttl=ANALYTICS_REFRESH_SECONDS,
+            tags=('analytics',)
+        )
+    except Exception as e:
+        st.error(f"Error loading analytics: {str(e)}")
+        return None
+
+def load_analytics(name, start, end, watermark):
+    import analytics
+    loader, columns = {
+        'pilots': (analytics.pilot_activity, analytics.PILOT_COLUMNS),
+        'zones': (analytics.zone_dwell, analytics.ZONE_COLUMNS),
+        'heatmap': (analytics.activity_heatmap, analytics.HEATMAP_COLUMNS),
+        'hourly': (analytics.activity_by_hour, analytics.HOURLY_COLUMNS),
+    }[name]
+    try:
+        # Small aggregates over the rollups, shared until the watermark moves
+        return cache.get_or_load(
+            (ANALYTICS_KEY, name, start, end, watermark),
+            lambda: timed_call(f'db_analytics_{name}_seconds', loader, start, end),
+            ttl=CACHE_TTL,
+            tags=('analytics',)
+        )
+    except Exception as e:
+        st.error(f"Error loading analytics: {str(e)}")
+        return pd.DataFrame(columns=columns)
+
+mode = st.radio("Режим", ["Онлайн", "История", "Аналитика"], horizontal=True, label_visibility="collapsed")
+
+# Analytics mode: per-pilot, per-zone and hourly activity from the rollup
+# tables, so it costs the same however long the history is
+if mode == "Аналитика":
+    days = st.selectbox("Период", [1, 7, 30], index=1, format_func=lambda days: f"{days} дн.")
+    # Whole hours, like the rollups
+    end = datetime.now().replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    start = end - timedelta(days=days)
+    watermark = analytics_watermark()
+    if watermark is not None:
+        st.caption(f"Данные учтены по {watermark:%d.%m %H:%M}")
+        if datetime.now() - watermark > timedelta(seconds=ANALYTICS_STALE_SECONDS):
+            st.warning("Аналитика отстаёт от телеметрии и обновляется в фоне; последние часы ещё не учтены.")
+
+    st.subheader("Пилоты")
+    pilot_activity = load_analytics('pilots', start, end, watermark)
+    if not pilot_activity.empty:
+        # Drones per pilot, busiest first
+        names = pilot_activity['first_name'].fillna('') + ' ' + pilot_activity['last_name'].fillna('') + ' #' + pilot_activity['pilot_id'].astype(str)
+        st.bar_chart(pd.Series(pilot_activity['drones'].to_numpy(), index=names).head(20))
+    st.dataframe(pilot_activity, hide_index=True, use_container_width=True)
+
+    st.subheader("Ограниченные зоны: дроны рядом")
+    st.dataframe(load_analytics('zones', start, end, watermark), hide_index=True, use_container_width=True)
+
+    st.subheader("Активность по часам")
+    hourly = load_analytics('hourly', start, end, watermark)
+    if not hourly.empty:
+        st.bar_chart(hourly.set_index('hour')['reports'])
+    st_folium(
+        map_layers.base_map(load_zones().geojson),
+        width="100%",
+        key="analytics_map",
+        feature_group_to_add=map_layers.heatmap_layer(load_analytics('heatmap', start, end, watermark)),
+        returned_objects=[]
+    )
+    st.stop()
+
+# History mode: tracks of the selected drones with a playback slider
+if mode == "История":
+    import history
+    registry = load_registry()
+    inactive = set(registry.loc[~registry['active'].astype(bool), 'drone_id'])
+    selected_ids = st.multiselect(
+        "Дроны",
+        options=registry['drone_id'].tolist(),
+        format_func=lambda drone_id: f"{drone_id} (списан)" if drone_id in inactive else drone_id,
+        max_selections=history.MAX_TRACK_DRONES
+    )
+    hours = st.slider("Окно (часов)", min_value=1, max_value=24, value=1)
+
+    # The window ends on a whole minute, so reruns within the minute
+    # (e.g. moving the playback slider) reuse the cached tracks
+    end = pd.Timestamp(datetime.now()).ceil('min')
+    start = end - pd.Timedelta(hours=hours)
+    tracks, step = load_tracks(sorted(selected_ids), start, end)
+
+    if tracks.empty:
+        st.info("Выберите дроны с историей полётов в этом окне.")
+        st.stop()
+
+    first = tracks['created_at'].min().to_pydatetime()
+    last = tracks['created_at'].max().to_pydatetime()
+    playback_at = last
+    if first < last:
+        playback_at = st.slider(
+            "Время",
+            min_value=first,
+            max_value=last,
+            value=last,
+            step=timedelta(seconds=step),
+            format="HH:mm:ss"
+        )
+
+    current = history.positions_at(tracks, playback_at)
+    st_folium(
+        map_layers.base_map(load_zones().geojson),
+        width="100%",
+        key="history_map",
+        feature_group_to_add=map_layers.track_layer(tracks, current),
+        returned_objects=[]
+    )
+    st.caption(f"Точек: {len(tracks)}, шаг: {step} с")
+    st.stop()
+
+# Only the area the browser showed on the previous rerun (padded and
+# snapped) is sent to it: markers when zoomed in, per-cell counts when
+# zoomed out
+def visible_drones(fleet):
+    bounds, zoom = viewport.from_map_state(st.session_state.get("drone_map"))
+    bounds = viewport.snap(bounds, zoom)
+    if zoom >= viewport.MARKER_MIN_ZOOM:
+        return viewport.select(fleet, bounds), pd.DataFrame(columns=GRID_COLUMNS)
+    return pd.DataFrame(columns=DRONE_COLUMNS), viewport.grid(fleet, bounds, zoom)
 
 # Sidebar form for adding new drones
 with st.sidebar:
     st.header("Add New Drone")
     
-    # Load pilots for the dropdown
-    pilots_df = load_pilots()
-    pilot_options = {f"{row['first_name']} {row['last_name']}": row['id'] 
-                    for _, row in pilots_df.iterrows()}
+    # Pilot picker: searched on the server one page at a time. Options are
+    # pilot ids, so pilots with the same name stay distinct.
+    pilot_query = st.text_input("Search Pilot", placeholder="Имя, фамилия или телефон")
+    if st.session_state.get('pilot_page_query') != pilot_query:
+        st.session_state.pilot_page_query = pilot_query
+        st.session_state.pilot_page = 0
+    page = st.session_state.pilot_page
+    results, has_more = search_pilots(pilot_query, page)
+
+    # Labels of every pilot seen, so the selection survives a new search
+    pilot_labels = st.session_state.setdefault('pilot_labels', {})
+    pilot_labels.update({int(row['id']): pilots.label(row) for row in results.to_dict('records')})
+    # The widget is recreated whenever its options change, so the choice
+    # is kept in session state and passed back in as the index
+    chosen = st.session_state.get('selected_pilot')
+    pilot_options = [None] + [int(pilot_id) for pilot_id in results['id']]
+    if chosen not in pilot_options:
+        pilot_options.insert(1, chosen)
+    selected_pilot = st.selectbox(
+        "Select Pilot",
+        options=pilot_options,
+        index=pilot_options.index(chosen),
+        format_func=lambda pilot_id: "No Pilot" if pilot_id is None else pilot_labels[pilot_id]
+    )
+    st.session_state.selected_pilot = selected_pilot
+    prev_col, page_col, next_col = st.columns([1, 2, 1])
+    if prev_col.button("←", disabled=page == 0, key="pilot_prev"):
+        st.session_state.pilot_page -= 1
+        st.rerun()
+    page_col.caption(f"Страница {page + 1}")
+    if next_col.button("→", disabled=not has_more, key="pilot_next"):
+        st.session_state.pilot_page += 1
+        st.rerun()
     
     # Form for new drone entry
     with st.form("new_drone_form"):
@@ -273,121 +412,156 @@ with st.sidebar:
         latitude = st.number_input("Latitude", value=51.1694, format="%.6f")
         longitude = st.number_input("Longitude", value=71.4491, format="%.6f")
         
-        # Add pilot selection dropdown
-        selected_pilot = st.selectbox(
-            "Select Pilot",
-            options=["No Pilot"] + list(pilot_options.keys()),
-            index=0
-        )
-        
         submitted = st.form_submit_button("Add Drone")
         
         if submitted:
             if not drone_id:
                 st.error("Please enter a Drone ID")
             else:
-                # Get pilot_id if a pilot was selected
-                pilot_id = None if selected_pilot == "No Pilot" else pilot_options[selected_pilot]
-                
-                if add_new_drone(drone_id, latitude, longitude, pilot_id):
+                # Kept until the write succeeds, so a failed submit can be
+                # retried without risking a second report
+                request = (drone_id, latitude, longitude, selected_pilot)
+                if st.session_state.get('new_drone_request', (None,))[0] != request:
+                    st.session_state.new_drone_request = (request, str(uuid.uuid4()), datetime.now())
+                _, idempotency_key, created_at = st.session_state.new_drone_request
+                if add_new_drone(drone_id, latitude, longitude, selected_pilot, idempotency_key, created_at):
+                    del st.session_state.new_drone_request
                     st.success(f"Successfully added {drone_id}")
-                    st.cache_data.clear()  # Clear cache to refresh the map
                     st.rerun()
     
     st.divider()
     
-    # Add drone removal section
-    st.header("Remove Drone")
-    with st.form("remove_drone_form"):
-        drone_to_remove = st.selectbox(
-            "Select drone to remove",
-            options=data['drone_id'].tolist(),
+    # Bulk fleet operations on the drones in view, one statement each
+    st.header("Manage Drones")
+    with st.form("fleet_form"):
+        selected_drones = st.multiselect(
+            "Select drones",
+            options=visible_drones(load_fleet()[1])[0]['drone_id'].tolist(),
             key="drone_selector"
         )
-        remove_submitted = st.form_submit_button("Remove Selected Drone")
-        
-        if remove_submitted:
-            if remove_drone(drone_to_remove):
-                st.success(f"Successfully removed {drone_to_remove}")
-                st.cache_data.clear()
+        deactivate_col, reassign_col = st.columns(2)
+        deactivate_submitted = deactivate_col.form_submit_button("Deactivate")
+        reassign_submitted = reassign_col.form_submit_button("Assign Pilot")
+        st.caption("Assign Pilot uses the pilot chosen above; \"No Pilot\" unassigns.")
+
+        if not selected_drones and (deactivate_submitted or reassign_submitted):
+            st.error("Please select drones")
+        elif deactivate_submitted:
+            count = deactivate_drones(selected_drones)
+            if count is not None:
+                st.success(f"Deactivated {count} drones")
+                st.rerun()
+        elif reassign_submitted:
+            count = reassign_drones(selected_drones, selected_pilot)
+            if count is not None:
+                st.success(f"Reassigned {count} drones")
                 st.rerun()
 
 
-# Create a map centered on Astana
-m = folium.Map(location=[51.1694, 71.4491], zoom_start=12)  # Adjusted zoom level to show more areas
-marker_cluster = MarkerCluster().add_to(m)
-
-# Add restricted areas
-for area_id, area in RESTRICTED_AREAS.items():
-    # Create polygon for restricted area
-    folium.Polygon(
-        locations=area['coordinates'],
-        color=area['color'],
-        fill=True,
-        fill_color=area['color'],
-        fill_opacity=0.2,
-        popup=folium.Popup(
-            f"""
-            <div style='width: 200px'>
-                <h4>{area['name']}</h4>
-                <p>{area['description']}</p>
-                <p style='color: {area['color']}; font-weight: bold;'>Ограниченная зона</p>
-            </div>
-            """,
-            max_width=300
-        ),
-        tooltip=f"Ограниченная зона: {area['name']}"
-    ).add_to(m)
-
-# Add markers for each drone
-for _, drone in data.iterrows():
-    # Create popup content with drone and pilot details
-    pilot_info = ""
-    if pd.notna(drone['pilot_id']):
-        pilot_info = f"""
-        <div style='margin-top: 10px; padding-top: 10px; border-top: 1px solid #ccc;'>
-            <h4 style='margin: 0 0 5px 0;'>Пилот</h4>
-            <p style='margin: 2px 0;'><strong>Имя:</strong> {drone['first_name']} {drone['last_name']}</p>
-            <p style='margin: 2px 0;'><strong>Телефон:</strong> {drone['phone_number']}</p>
-        </div>
-        """
-    
-    popup_content = f"""
-    <div style='width: 200px'>
-        <h4>{drone['drone_id']}</h4>
-        <p>Latitude: {drone['latitude']:.6f}</p>
-        <p>Longitude: {drone['longitude']:.6f}</p>
-        <p>Last Update: {drone['created_at'].strftime('%H:%M:%S')}</p>
-        {pilot_info}
-        <a href="https://www.youtube.com/watch?v=82x5c6JyD4U" target="_blank" 
-           style='display: inline-block; background-color: #4CAF50; color: white; padding: 8px 16px; 
-           border: none; border-radius: 4px; cursor: pointer; text-decoration: none; text-align: center; width: 100%; margin-top: 10px;'>
-           Stream Video
-        </a>
-    </div>
-    """
-    
-    folium.Marker(
-        location=[drone['latitude'], drone['longitude']],
-        popup=folium.Popup(popup_content, max_width=300),
-        tooltip=drone['drone_id']
-    ).add_to(marker_cluster)
+# The map reruns on its own every few seconds and when the operator pans
+# or zooms; with an unchanged snapshot that sends nothing to the browser.
+# The base map and restricted areas are the same on every rerun (until a
+# zone is edited or its validity period starts or ends), so the browser
+# keeps them; only drones that changed since this session's last
+# render are sent
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+@metrics.timed('live_map_seconds')
+def live_map():
+    version, fleet = load_fleet()
+    with metrics.timed('viewport_seconds'):
+        data, grid = visible_drones(fleet)
+    with metrics.timed('pilot_details_seconds'):
+        data = with_pilots(data)
+    active_zones = load_zones()
+    violations = load_violations(version, fleet, active_zones)
+    predicted = load_predictions(fleet, active_zones)
+
+    with metrics.timed('markers_seconds'):
+        m = map_layers.base_map(active_zones.geojson)
+        if 'marker_sync' not in st.session_state:
+            st.session_state.marker_sync = map_layers.MarkerSync()
+        sync = st.session_state.marker_sync
+        # Only the drones the shared snapshot changed since this session's
+        # last render are compared and sent
+        drone_layer = sync.layer(data, version, live.get_snapshot().changed_since(sync.version))
+        grid_layer = map_layers.grid_layer(grid)
+    metrics.observe('render_rows', sync.sent_rows + len(grid))
+    metrics.observe('render_bytes', sync.payload_bytes)
+
+    # Display the map; panning or zooming reruns with the new bounds
+    with st.container(), metrics.timed('map_render_seconds'):
+        map_state = st_folium(
+            m,
+            width="100%",
+            key="drone_map",
+            feature_group_to_add=[drone_layer, grid_layer],
+            returned_objects=["last_object_clicked_tooltip", "bounds", "zoom"]
+        )
+    warm_start.first_map_rendered()
+    restored_at = live.get_snapshot().restored_at
+    if restored_at is not None:
+        st.caption(f"Показан снимок от {datetime.fromtimestamp(restored_at):%H:%M:%S}, сохранённый до перезапуска; идёт синхронизация с базой данных.")
+    if len(data) >= viewport.MAX_MARKERS:
+        st.caption(f"Показаны последние {viewport.MAX_MARKERS} дронов в этой области; приблизьте карту, чтобы увидеть остальные.")
+
+    selected_drone_id = (map_state or {}).get("last_object_clicked_tooltip")
+    selected = data[data['drone_id'] == selected_drone_id]
+    if not selected.empty:
+        drone = selected.iloc[0]
+        st.subheader(f"Дрон {drone['drone_id']}")
+        st.write(f"Последнее обновление: {drone['created_at'].strftime('%H:%M:%S')}")
+        if pd.notna(drone['pilot_id']):
+            st.write(f"**Пилот:** {drone['first_name']} {drone['last_name']}")
+            st.write(f"**Телефон:** {drone['phone_number']}")
 
-# Display the map
-with st.container():
-    st_folium(m, width="100%")
+    # Show drones currently inside restricted areas
+    st.subheader('Нарушения ограниченных зон')
+    violation_counts = geofence.violation_summary(violations)
+    high_col, medium_col = st.columns(2)
+    high_col.metric("Высокая опасность", violation_counts['red'])
+    medium_col.metric("Средняя опасность", violation_counts['orange'])
+    if not violations.empty:
+        # 'red' sorts after 'orange', so descending puts high severity first
+        st.dataframe(
+            violations.sort_values(['severity', 'zone_name'], ascending=[False, True]),
+            hide_index=True,
+            use_container_width=True
+        )
+
+    # Zone entries and close approaches expected within the prediction horizon
+    st.subheader(f'Прогноз на {prediction.HORIZON_SECONDS} секунд')
+    entries_col, conflicts_col = st.columns(2)
+    entries_col.metric("Входы в зоны", len(predicted.approaches))
+    conflicts_col.metric(f"Сближения < {prediction.PROXIMITY_METERS:.0f} м", len(predicted.conflicts))
+    if not predicted.approaches.empty:
+        st.dataframe(predicted.approaches.head(viewport.MAX_MARKERS), hide_index=True, use_container_width=True)
+    if not predicted.conflicts.empty:
+        st.dataframe(predicted.conflicts.head(viewport.MAX_MARKERS), hide_index=True, use_container_width=True)
+
+live_map()
 
-# Add a refresh button
+# Drone positions refresh themselves; this reloads pilots and resyncs the snapshot
 if st.button('Refresh Data'):
-    st.cache_data.clear()
+    cache.invalidate(tag='pilots')
+    live.get_snapshot().reload()
     st.rerun()
 
-# Add a legend
-legend_html = """
-<div style="position: fixed; bottom: 50px; left: 50px; z-index: 1000; background-color: white; padding: 10px; border: 2px solid grey; border-radius: 5px;">
-    <p><strong>Ограниченные зоны:</strong></p>
-    <p><span style="color: red;">■</span> Высокая опасность</p>
-    <p><span style="color: orange;">■</span> Средняя опасность</p>
-</div>
-"""
-m.get_root().html.add_child(folium.Element(legend_html))
\ No newline at end of file
+with st.expander("Статистика кэша"):
+    st.json(cache.stats())
+    st.json(live.listener_stats())
+
+# p50/p95 of every timed stage in this server process, plus what was sent
+# to browsers; series ending in _seconds are shown in milliseconds
+if ADMIN_PANEL:
+    with st.sidebar.expander("Производительность"):
+        summary = metrics.summary()
+        stages = pd.DataFrame.from_dict(summary['series'], orient='index')
+        if not stages.empty:
+            in_seconds = stages.index.str.endswith('_seconds')
+            stages.loc[in_seconds, ['sum', 'p50', 'p95', 'max']] *= 1000
+            st.dataframe(stages[['count', 'p50', 'p95', 'max']].round(2), use_container_width=True)
+        st.json(summary['counters'])
+        st.json(db.pool_stats())
+
+if METRICS_FILE:
+    metrics.write(METRICS_FILE)
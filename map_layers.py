@@ -0,0 +1,312 @@
+import json
+import math
+import uuid
+from collections import deque
+
+import folium
+import pandas as pd
+from branca.element import MacroElement
+from folium.elements import JSCSSMixin
+from folium.plugins import HeatMap, MarkerCluster
+from folium.template import Template
+
+MAP_CENTER = [51.1694, 71.4491]  # Astana
+MAP_ZOOM = 12
+
+# Column order of the marker rows sent to the browser; the JS below reads
+# them by index
+MARKER_COLUMNS = ['latitude', 'longitude', 'drone_id', 'last_update', 'pilot']
+
+# Each session's browser keeps one marker cluster alive across reruns
+# (window.__droneLayer) and applies these entries to it in order. An entry
+# is [seq, upserted rows, removed drone ids]. A new epoch starts from an
+# empty cluster with a full snapshot as its first entry. The payload is
+# assembled from pre-rendered JSON, so it is inserted as is.
+DRONE_DELTA_TEMPLATE = """
+{% macro script(this, kwargs) %}
+(function () {
+    var escapeHtml = function (value) {
+        var div = document.createElement('div');
+        div.textContent = value;
+        return div.innerHTML;
+    };
+    var popupHtml = function (layer) {
+        var row = layer.row;
+        return "<div style='width: 200px'>" +
+            "<h4>" + escapeHtml(row[2]) + "</h4>" +
+            "<p>Latitude: " + row[0].toFixed(6) + "</p>" +
+            "<p>Longitude: " + row[1].toFixed(6) + "</p>" +
+            "<p>Last Update: " + row[3] + "</p>" +
+            (row[4] ? "<p>Pilot: " + escapeHtml(row[4]) + "</p>" : "") +
+            "<a href='https://www.youtube.com/watch?v=82x5c6JyD4U' target='_blank' " +
+            "style='display: inline-block; background-color: #4CAF50; color: white; padding: 8px 16px; " +
+            "border: none; border-radius: 4px; cursor: pointer; text-decoration: none; text-align: center; width: 100%; margin-top: 10px;'>" +
+            "Stream Video</a>" +
+            "</div>";
+    };
+
+    var payload = {{ this.payload }};
+    var store = window.__droneLayer;
+    if (!store) {
+        store = window.__droneLayer = {cluster: L.markerClusterGroup(), markers: {}, epoch: null, seq: -1};
+    }
+    if (store.epoch !== payload.epoch) {
+        store.cluster.clearLayers();
+        store.markers = {};
+        store.epoch = payload.epoch;
+        store.seq = -1;
+    }
+
+    for (var i = 0; i < payload.entries.length; i++) {
+        var entry = payload.entries[i];
+        if (entry[0] <= store.seq) {
+            continue;
+        }
+        if (entry[0] !== store.seq + 1) {
+            // Missed updates: drop everything and wait for the next epoch's snapshot
+            store.cluster.clearLayers();
+            store.markers = {};
+            store.epoch = null;
+            break;
+        }
+
+        var removed = entry[2].concat(entry[1].map(function (row) { return row[2]; }));
+        var stale = [];
+        removed.forEach(function (droneId) {
+            if (store.markers[droneId]) {
+                stale.push(store.markers[droneId]);
+                delete store.markers[droneId];
+            }
+        });
+        store.cluster.removeLayers(stale);
+
+        var added = entry[1].map(function (row) {
+            var marker = L.marker(new L.LatLng(row[0], row[1]));
+            marker.row = row;
+            marker.bindTooltip(row[2]);
+            marker.bindPopup(popupHtml, {maxWidth: 300});
+            store.markers[row[2]] = marker;
+            return marker;
+        });
+        store.cluster.addLayers(added);
+        store.seq = entry[0];
+    }
+
+    store.cluster.addTo({{ this._parent.get_name() }});
+})();
+{% endmacro %}
+"""
+
+
+class DroneDeltaLayer(JSCSSMixin, MacroElement):
+    """Applies a marker delta payload (JSON text) to the browser's persistent drone cluster."""
+
+    _template = Template(DRONE_DELTA_TEMPLATE)
+    default_js = MarkerCluster.default_js
+    default_css = MarkerCluster.default_css
+
+    def __init__(self, payload):
+        super().__init__()
+        self._name = 'DroneDeltaLayer'
+        self.payload = payload
+
+
+def script_json(value):
+    """JSON that is safe inside a <script> block, escaped like Jinja's tojson."""
+    return (json.dumps(value, ensure_ascii=False)
+            .replace('<', '\\u003c').replace('>', '\\u003e')
+            .replace('&', '\\u0026').replace("'", '\\u0027'))
+
+
+def marker_prefixes(data):
+    """Each drone's marker row as JSON text, open before the pilot column.
+
+    live.FleetSnapshot renders these once per changed drone, so sessions
+    only append the pilot and join strings.
+    """
+    if data.empty:
+        return pd.Series([], index=data.index, dtype=object)
+    return ('[' + data['latitude'].astype(str) + ',' + data['longitude'].astype(str)
+            + ',' + data['drone_id'].map(script_json)
+            + ',"' + pd.to_datetime(data['created_at']).dt.strftime('%H:%M:%S') + '"')
+
+
+def drone_marker_rows(data):
+    """JSON text of the rows the marker JS expects, one per drone."""
+    prefixes = data['marker'] if 'marker' in data else marker_prefixes(data)
+    # Filled in for the drones on screen by main.with_pilots
+    if 'first_name' in data:
+        pilots = (data['first_name'].astype(object) + ' ' + data['last_name'].astype(object)).fillna('')
+        return (prefixes + ',' + pilots.map(script_json) + ']').tolist()
+    return (prefixes + ',""]').tolist()
+
+
+def diff_markers(shown, data):
+    """Compare the shown drone -> created_at series with the current frame.
+
+    Returns the rows that are new or moved, the ids that disappeared, and
+    the series to remember as shown.
+    """
+    current = pd.Series(data['created_at'].to_numpy(), index=data['drone_id'].to_numpy())
+    previous = shown.reindex(current.index)
+    changed = (previous.isna() | (previous != current)).to_numpy()
+    removed = shown.index.difference(current.index)
+    return data[changed], removed.tolist(), current
+
+
+def diff_changed(shown, data, changed_ids):
+    """Like diff_markers, but with the drones the snapshot reports as changed
+    since the last render instead of comparing timestamps."""
+    ids = data['drone_id']
+    changed = (ids.isin(changed_ids) | ~ids.isin(shown.index)).to_numpy()
+    current = pd.Series(data['created_at'].to_numpy(), index=ids.to_numpy())
+    removed = shown.index.difference(current.index)
+    return data[changed], removed.tolist(), current
+
+
+class MarkerSync:
+    """Per-session record of what the browser map holds, used to send only changes.
+
+    Given the snapshot version the session last rendered, a delta holds the
+    visible drones the snapshot changed since then, plus those that scrolled
+    into view; otherwise drones are compared on created_at. The last few
+    entries are resent every time, so a browser that skipped a rerun can
+    catch up. A full snapshot is sent every `full_sync_every` refreshes, or
+    after reset(), to recover from anything else.
+    """
+
+    def __init__(self, full_sync_every=50, history=5):
+        self.full_sync_every = full_sync_every
+        self.log = deque(maxlen=history)
+        self.reset()
+
+    def reset(self):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.seq = -1
+        self.version = None
+        self.shown = pd.Series(dtype='datetime64[ns]')
+        self.log.clear()
+        # Size of the last layer() output, for instrumentation
+        self.sent_rows = 0
+        self.payload_bytes = 0
+
+    def layer(self, data, version=None, changed_ids=None):
+        """Return a FeatureGroup holding the changes since the previous call.
+
+        `changed_ids` are the drones changed between the version last
+        rendered and `version`, or None when that isn't known.
+        """
+        if self.seq + 1 >= self.full_sync_every:
+            self.reset()
+
+        if changed_ids is None or self.version is None:
+            changed, removed, self.shown = diff_markers(self.shown, data)
+        else:
+            changed, removed, self.shown = diff_changed(self.shown, data, changed_ids)
+        self.version = version
+        self.seq += 1
+        self.log.append((self.seq, drone_marker_rows(changed), script_json(removed)))
+
+        entries = ','.join(f"[{seq},[{','.join(rows)}],{gone}]" for seq, rows, gone in self.log)
+        payload = f'{{"epoch":"{self.epoch}","entries":[{entries}]}}'
+        self.sent_rows = sum(len(rows) for _, rows, _ in self.log)
+        self.payload_bytes = len(payload)
+
+        group = folium.FeatureGroup(name='Дроны', control=False)
+        DroneDeltaLayer(payload).add_to(group)
+        return group
+
+
+def grid_layer(grid):
+    """FeatureGroup with one count bubble per grid cell, for zoomed-out views."""
+    group = folium.FeatureGroup(name='Плотность дронов', control=False)
+    for cell in grid.itertuples(index=False):
+        folium.CircleMarker(
+            location=[cell.latitude, cell.longitude],
+            radius=6 + 3 * math.log10(cell.drones),
+            color='#3388ff',
+            fill=True,
+            fill_opacity=0.6,
+            tooltip=f"Дронов: {cell.drones}"
+        ).add_to(group)
+    return group
+
+
+def heatmap_layer(cells):
+    """FeatureGroup with a heatmap of report counts per grid cell."""
+    group = folium.FeatureGroup(name='Активность', control=False)
+    if not cells.empty:
+        weights = cells['reports'].to_numpy() / cells['reports'].max()
+        points = cells[['latitude', 'longitude']].assign(weight=weights).to_numpy().tolist()
+        HeatMap(points, radius=15, blur=20, min_opacity=0.3).add_to(group)
+    return group
+
+
+# Colours cycled over the drones shown in history mode
+TRACK_COLORS = ['#1f77b4', '#2ca02c', '#9467bd', '#8c564b', '#e377c2', '#17becf', '#bcbd22', '#7f7f7f']
+
+
+def track_layer(tracks, current):
+    """FeatureGroup with each drone's full track (faint), the part flown
+    so far (solid), and a marker at its `current` position."""
+    group = folium.FeatureGroup(name='Треки', control=False)
+    reached = current.set_index('drone_id')['created_at']
+    colors = {}
+    for i, (drone_id, track) in enumerate(tracks.groupby('drone_id', sort=True)):
+        color = colors[drone_id] = TRACK_COLORS[i % len(TRACK_COLORS)]
+        if len(track) > 1:
+            folium.PolyLine(track[['latitude', 'longitude']].to_numpy().tolist(),
+                            color=color, weight=2, opacity=0.3).add_to(group)
+        if drone_id not in reached.index:
+            continue
+        flown = track[track['created_at'] <= reached[drone_id]]
+        if len(flown) > 1:
+            folium.PolyLine(flown[['latitude', 'longitude']].to_numpy().tolist(), color=color, weight=4).add_to(group)
+
+    for position in current.itertuples(index=False):
+        folium.CircleMarker(
+            location=[position.latitude, position.longitude],
+            radius=7,
+            color=colors.get(position.drone_id, TRACK_COLORS[0]),
+            fill=True,
+            fill_opacity=0.9,
+            tooltip=f"{position.drone_id} {position.created_at.strftime('%H:%M:%S')}"
+        ).add_to(group)
+    return group
+
+
+LEGEND_HTML = """
+<div style="position: fixed; bottom: 50px; left: 50px; z-index: 1000; background-color: white; padding: 10px; border: 2px solid grey; border-radius: 5px;">
+    <p><strong>Ограниченные зоны:</strong></p>
+    <p><span style="color: red;">■</span> Высокая опасность</p>
+    <p><span style="color: orange;">■</span> Средняя опасность</p>
+</div>
+"""
+
+
+def zone_style(feature):
+    color = feature['properties']['color']
+    return {'color': color, 'fillColor': color, 'fillOpacity': 0.2, 'weight': 3}
+
+
+def base_map(zone_geojson):
+    """Map with the static layers only. Its script is identical on every rerun,
+    so st_folium keeps the same browser map and just swaps the drone layer.
+
+    `zone_geojson` is a FeatureCollection from zones.ZoneRegistry, with the
+    popup and tooltip HTML already rendered into each feature.
+    """
+    m = folium.Map(location=MAP_CENTER, zoom_start=MAP_ZOOM)
+
+    # GeoJsonTooltip/GeoJsonPopup reject a collection without features
+    if zone_geojson['features']:
+        folium.GeoJson(
+            zone_geojson,
+            name='restricted_areas',
+            style_function=zone_style,
+            popup=folium.GeoJsonPopup(fields=['popup'], labels=False, max_width=300),
+            tooltip=folium.GeoJsonTooltip(fields=['tooltip'], labels=False),
+        ).add_to(m)
+
+    m.get_root().html.add_child(folium.Element(LEGEND_HTML))
+    return m
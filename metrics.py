@@ -0,0 +1,112 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Samples kept per series for percentiles
+WINDOW = 1000
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)] if values else 0.0
+
+
+class Metrics:
+    """Process-wide timers, value series and counters.
+
+    A series keeps its last WINDOW samples for percentiles plus a running
+    count and sum. Series names carry their unit (e.g. `db_pilots_seconds`,
+    `render_rows`) and are valid Prometheus metric names.
+    """
+
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self._series = {}  # name -> [samples deque, count, sum]
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, value):
+        with self._lock:
+            series = self._series.get(name)
+            if series is None:
+                series = self._series[name] = [deque(maxlen=self.window), 0, 0.0]
+            series[0].append(value)
+            series[1] += 1
+            series[2] += value
+
+    def count(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    @contextmanager
+    def timed(self, name):
+        """Observe the seconds spent in the block under `name`, even if it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def summary(self):
+        with self._lock:
+            series = {name: (list(samples), count, total) for name, (samples, count, total) in self._series.items()}
+            counters = dict(self._counters)
+        return {
+            'series': {
+                name: {
+                    'count': count,
+                    'sum': total,
+                    'p50': percentile(samples, 0.5),
+                    'p95': percentile(samples, 0.95),
+                    'max': max(samples, default=0.0),
+                }
+                for name, (samples, count, total) in sorted(series.items())
+            },
+            'counters': dict(sorted(counters.items())),
+        }
+
+    def prometheus(self, prefix='drone_dashboard'):
+        """Prometheus text exposition: series as summaries, counters as counters."""
+        lines = []
+        summary = self.summary()
+        for name, s in summary['series'].items():
+            metric = _metric_name(prefix, name)
+            lines.append(f"# TYPE {metric} summary")
+            lines.append(f'{metric}{{quantile="0.5"}} {s["p50"]}')
+            lines.append(f'{metric}{{quantile="0.95"}} {s["p95"]}')
+            lines.append(f"{metric}_sum {s['sum']}")
+            lines.append(f"{metric}_count {s['count']}")
+        for name, value in summary['counters'].items():
+            metric = _metric_name(prefix, name) + '_total'
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Write the metrics to `path`: Prometheus text for .prom/.txt, JSON otherwise."""
+        if path.endswith(('.prom', '.txt')):
+            content = self.prometheus()
+        else:
+            content = json.dumps(self.summary(), indent=2)
+        # Write then rename, so a scraper never reads half a file
+        temporary = f"{path}.tmp"
+        with open(temporary, 'w') as f:
+            f.write(content)
+        os.replace(temporary, path)
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+            self._counters.clear()
+
+
+def _metric_name(prefix, name):
+    return re.sub(r'[^a-zA-Z0-9_]', '_', f"{prefix}_{name}")
+
+
+# Shared by everything in the process
+metrics = Metrics()
@@ -0,0 +1,446 @@
+import json
+
+import db
+import queries
+from restricted_areas import RESTRICTED_AREAS
+
+# Ordered schema migrations as (version, description, statements).
+# A statement is SQL or a (SQL, params) pair.
+# Every statement must be idempotent so databases created before the
+# runner existed (by the old init_db.create_database) upgrade cleanly.
+MIGRATIONS = [
+    (1, 'create pilots, drones and drone_latest tables', [
+        """
+        CREATE TABLE IF NOT EXISTS pilots (
+            id SERIAL PRIMARY KEY,
+            first_name VARCHAR(50) NOT NULL,
+            last_name VARCHAR(50) NOT NULL,
+            phone_number VARCHAR(20) NOT NULL,
+            email VARCHAR(100) NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(email)
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS drones (
+            id SERIAL PRIMARY KEY,
+            drone_id VARCHAR(50) NOT NULL,
+            latitude DOUBLE PRECISION NOT NULL,
+            longitude DOUBLE PRECISION NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            pilot_id INTEGER REFERENCES pilots(id),
+            UNIQUE(drone_id, created_at)
+        );
+        """,
+        # Current position of every drone, maintained on write so the
+        # dashboard doesn't have to scan the full history
+        """
+        CREATE TABLE IF NOT EXISTS drone_latest (
+            drone_id VARCHAR(50) PRIMARY KEY,
+            latitude DOUBLE PRECISION NOT NULL,
+            longitude DOUBLE PRECISION NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            pilot_id INTEGER REFERENCES pilots(id)
+        );
+        """,
+    ]),
+    # Spelled out rather than positions.BACKFILL_LATEST_QUERY, which now
+    # needs the fleet table of migration 9
+    (2, 'backfill drone_latest from drones history', [
+        """
+        INSERT INTO drone_latest (drone_id, latitude, longitude, created_at, pilot_id)
+        SELECT DISTINCT ON (drone_id)
+            drone_id, latitude, longitude, created_at, pilot_id
+        FROM drones
+        ORDER BY drone_id, created_at DESC
+        ON CONFLICT (drone_id) DO UPDATE SET
+            latitude = EXCLUDED.latitude,
+            longitude = EXCLUDED.longitude,
+            created_at = EXCLUDED.created_at,
+            pilot_id = EXCLUDED.pilot_id
+        WHERE drone_latest.created_at <= EXCLUDED.created_at;
+        """,
+    ]),
+    # Latest-per-drone lookups on history are already served by the
+    # UNIQUE(drone_id, created_at) index, scanned backwards.
+    (3, 'indexes for dashboard queries', [
+        # Time-window scans; drones is append-only in created_at order,
+        # so a BRIN index stays tiny and still prunes most blocks
+        "CREATE INDEX IF NOT EXISTS idx_drones_created_at ON drones USING brin (created_at);",
+        # Pilot joins
+        "CREATE INDEX IF NOT EXISTS idx_drones_pilot_id ON drones (pilot_id);",
+        "CREATE INDEX IF NOT EXISTS idx_drone_latest_pilot_id ON drone_latest (pilot_id);",
+        # Dashboard ordering by last update
+        "CREATE INDEX IF NOT EXISTS idx_drone_latest_created_at ON drone_latest (created_at DESC);",
+        # Bounding-box lookups: point(longitude, latitude) <@ box(...)
+        "CREATE INDEX IF NOT EXISTS idx_drone_latest_position ON drone_latest USING gist (point(longitude, latitude));",
+        # Pilot dropdown ordering
+        "CREATE INDEX IF NOT EXISTS idx_pilots_name ON pilots (first_name, last_name);",
+    ]),
+    (4, 'partition drones by day on created_at', [
+        # Creates the daily partition holding `day`, moving any rows that
+        # already landed in the default partition for that range
+        """
+        CREATE OR REPLACE FUNCTION ensure_drone_partition(day DATE) RETURNS TEXT AS $$
+        DECLARE
+            part TEXT := 'drones_p' || to_char(day, 'YYYYMMDD');
+        BEGIN
+            IF to_regclass(part) IS NOT NULL THEN
+                RETURN part;
+            END IF;
+            EXECUTE format('CREATE TABLE %I (LIKE drones)', part);
+            EXECUTE format(
+                'WITH moved AS (DELETE FROM drones_default WHERE created_at >= %L AND created_at < %L RETURNING *) '
+                'INSERT INTO %I SELECT * FROM moved',
+                day, day + 1, part
+            );
+            EXECUTE format(
+                'ALTER TABLE drones ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                part, day, day + 1
+            );
+            RETURN part;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        # Swap the plain table for a partitioned one, keeping ids and data.
+        # Partitioned tables need the partition key in every unique
+        # constraint, so the primary key becomes (id, created_at).
+        """
+        DO $$
+        DECLARE
+            day DATE;
+        BEGIN
+            IF (SELECT relkind FROM pg_class WHERE oid = 'drones'::regclass) = 'p' THEN
+                RETURN;
+            END IF;
+
+            ALTER TABLE drones RENAME TO drones_unpartitioned;
+            ALTER INDEX drones_pkey RENAME TO drones_unpartitioned_pkey;
+            ALTER INDEX drones_drone_id_created_at_key RENAME TO drones_unpartitioned_drone_id_created_at_key;
+            DROP INDEX IF EXISTS idx_drones_created_at;
+            DROP INDEX IF EXISTS idx_drones_pilot_id;
+            ALTER SEQUENCE drones_id_seq OWNED BY NONE;
+
+            CREATE TABLE drones (
+                id INTEGER NOT NULL DEFAULT nextval('drones_id_seq'),
+                drone_id VARCHAR(50) NOT NULL,
+                latitude DOUBLE PRECISION NOT NULL,
+                longitude DOUBLE PRECISION NOT NULL,
+                created_at TIMESTAMP NOT NULL,
+                pilot_id INTEGER REFERENCES pilots(id),
+                PRIMARY KEY (id, created_at),
+                UNIQUE(drone_id, created_at)
+            ) PARTITION BY RANGE (created_at);
+            ALTER SEQUENCE drones_id_seq OWNED BY drones.id;
+            CREATE TABLE drones_default PARTITION OF drones DEFAULT;
+
+            CREATE INDEX idx_drones_created_at ON drones USING brin (created_at);
+            CREATE INDEX idx_drones_pilot_id ON drones (pilot_id);
+
+            FOR day IN
+                SELECT generate_series(MIN(created_at)::date, MAX(created_at)::date, '1 day')::date
+                FROM drones_unpartitioned
+                UNION
+                SELECT generate_series(CURRENT_DATE, CURRENT_DATE + 7, '1 day')::date
+            LOOP
+                PERFORM ensure_drone_partition(day);
+            END LOOP;
+
+            INSERT INTO drones SELECT * FROM drones_unpartitioned;
+            DROP TABLE drones_unpartitioned;
+        END;
+        $$;
+        """,
+    ]),
+    (5, 'per-minute rollup of drone positions', [
+        # One point (the last report) per drone per minute, kept after the
+        # raw partitions have been dropped by retention
+        """
+        CREATE TABLE IF NOT EXISTS drone_positions_1m (
+            drone_id VARCHAR(50) NOT NULL,
+            bucket TIMESTAMP NOT NULL,
+            latitude DOUBLE PRECISION NOT NULL,
+            longitude DOUBLE PRECISION NOT NULL,
+            pilot_id INTEGER REFERENCES pilots(id),
+            samples INTEGER NOT NULL,
+            PRIMARY KEY (drone_id, bucket)
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_drone_positions_1m_bucket ON drone_positions_1m USING brin (bucket);",
+    ]),
+    (6, 'notify listeners of drone_latest changes', [
+        # One notification per statement (not per row) listing the changed
+        # drone ids, split into chunks that fit NOTIFY's 8000-byte payload
+        # limit. Delivered only when the writing transaction commits.
+        """
+        CREATE OR REPLACE FUNCTION notify_drone_latest() RETURNS trigger AS $$
+        DECLARE
+            ids TEXT;
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                FOR ids IN
+                    SELECT string_agg(drone_id, ',')
+                    FROM (SELECT drone_id, (row_number() OVER ()) / 150 AS chunk FROM old_rows) changed
+                    GROUP BY chunk
+                LOOP
+                    PERFORM pg_notify('drone_latest_changed', ids);
+                END LOOP;
+            ELSE
+                FOR ids IN
+                    SELECT string_agg(drone_id, ',')
+                    FROM (SELECT drone_id, (row_number() OVER ()) / 150 AS chunk FROM new_rows) changed
+                    GROUP BY chunk
+                LOOP
+                    PERFORM pg_notify('drone_latest_changed', ids);
+                END LOOP;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        "DROP TRIGGER IF EXISTS drone_latest_notify_insert ON drone_latest;",
+        "DROP TRIGGER IF EXISTS drone_latest_notify_update ON drone_latest;",
+        "DROP TRIGGER IF EXISTS drone_latest_notify_delete ON drone_latest;",
+        """
+        CREATE TRIGGER drone_latest_notify_insert
+        AFTER INSERT ON drone_latest
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_drone_latest();
+        """,
+        """
+        CREATE TRIGGER drone_latest_notify_update
+        AFTER UPDATE ON drone_latest
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_drone_latest();
+        """,
+        """
+        CREATE TRIGGER drone_latest_notify_delete
+        AFTER DELETE ON drone_latest
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_drone_latest();
+        """,
+    ]),
+    (7, 'create restricted_areas registry', [
+        # coordinates is a ring of [latitude, longitude] pairs. A zone is
+        # active in [valid_from, valid_until); NULL means unbounded.
+        """
+        CREATE TABLE IF NOT EXISTS restricted_areas (
+            id SERIAL PRIMARY KEY,
+            zone_key VARCHAR(50) NOT NULL UNIQUE,
+            name VARCHAR(100) NOT NULL,
+            description TEXT NOT NULL DEFAULT '',
+            color VARCHAR(10) NOT NULL CHECK (color IN ('red', 'orange')),
+            coordinates JSONB NOT NULL CHECK (jsonb_typeof(coordinates) = 'array' AND jsonb_array_length(coordinates) >= 3),
+            valid_from TIMESTAMP,
+            valid_until TIMESTAMP,
+            updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            CHECK (valid_from IS NULL OR valid_until IS NULL OR valid_from < valid_until)
+        );
+        """,
+        # A single counter bumped by every statement that changes the table,
+        # so caches can tell whether they're stale with one cheap query
+        """
+        CREATE TABLE IF NOT EXISTS restricted_areas_version (
+            singleton BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (singleton),
+            version BIGINT NOT NULL
+        );
+        """,
+        "INSERT INTO restricted_areas_version (singleton, version) VALUES (TRUE, 1) ON CONFLICT DO NOTHING;",
+        """
+        CREATE OR REPLACE FUNCTION bump_restricted_areas_version() RETURNS trigger AS $$
+        BEGIN
+            UPDATE restricted_areas_version SET version = version + 1;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        "DROP TRIGGER IF EXISTS restricted_areas_version_bump ON restricted_areas;",
+        """
+        CREATE TRIGGER restricted_areas_version_bump
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON restricted_areas
+        FOR EACH STATEMENT EXECUTE FUNCTION bump_restricted_areas_version();
+        """,
+        # Seed with the zones that used to be hard-coded
+        (
+            """
+            INSERT INTO restricted_areas (zone_key, name, description, color, coordinates)
+            SELECT key, value->>'name', value->>'description', value->>'color', value->'coordinates'
+            FROM jsonb_each(%s::jsonb)
+            ON CONFLICT (zone_key) DO NOTHING;
+            """,
+            (json.dumps(RESTRICTED_AREAS),)
+        ),
+    ]),
+    (8, 'index pilots for prefix and trigram search', [
+        # text_pattern_ops lets LIKE 'prefix%' use the index whatever the
+        # database collation
+        "CREATE INDEX IF NOT EXISTS idx_pilots_full_name_prefix ON pilots (lower(first_name || ' ' || last_name) text_pattern_ops);",
+        "CREATE INDEX IF NOT EXISTS idx_pilots_last_name_prefix ON pilots (lower(last_name) text_pattern_ops);",
+        "CREATE INDEX IF NOT EXISTS idx_pilots_phone_prefix ON pilots (phone_number text_pattern_ops);",
+        # pg_trgm ships with contrib, which not every server has; without
+        # it search falls back to prefix matches only (see pilots.py)
+        """
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+                CREATE EXTENSION IF NOT EXISTS pg_trgm;
+                CREATE INDEX IF NOT EXISTS idx_pilots_full_name_trgm
+                ON pilots USING gin (lower(first_name || ' ' || last_name) gin_trgm_ops);
+            END IF;
+        END;
+        $$;
+        """,
+    ]),
+    (9, 'create fleet registry', [
+        # Every drone ever seen. Deactivated (decommissioned) drones stay
+        # here and in the history but are kept out of drone_latest.
+        """
+        CREATE TABLE IF NOT EXISTS fleet (
+            drone_id VARCHAR(50) PRIMARY KEY,
+            pilot_id INTEGER REFERENCES pilots(id),
+            active BOOLEAN NOT NULL DEFAULT TRUE,
+            registered_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            deactivated_at TIMESTAMP,
+            updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_fleet_pilot_id ON fleet (pilot_id);",
+        # Drones on the map are active; ones that only have history were
+        # removed with the old hard delete
+        """
+        INSERT INTO fleet (drone_id, pilot_id)
+        SELECT drone_id, pilot_id FROM drone_latest
+        ON CONFLICT (drone_id) DO NOTHING;
+        """,
+        """
+        INSERT INTO fleet (drone_id, active, deactivated_at)
+        SELECT DISTINCT drone_id, FALSE, CURRENT_TIMESTAMP FROM drones
+        ON CONFLICT (drone_id) DO NOTHING;
+        """,
+    ]),
+    (10, 'create analytics rollups', [
+        # Hourly aggregates kept current by analytics.refresh(), which
+        # folds in positions below the watermark one batch at a time
+        """
+        CREATE TABLE IF NOT EXISTS analytics_watermark (
+            name VARCHAR(50) PRIMARY KEY,
+            watermark TIMESTAMP NOT NULL,
+            updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+        # Reports per drone per pilot per hour; distinct drones per pilot
+        # over any period are counted from here
+        """
+        CREATE TABLE IF NOT EXISTS pilot_drone_hourly (
+            hour TIMESTAMP NOT NULL,
+            pilot_id INTEGER NOT NULL,
+            drone_id VARCHAR(50) NOT NULL,
+            reports INTEGER NOT NULL,
+            PRIMARY KEY (hour, pilot_id, drone_id)
+        );
+        """,
+        # Seconds each drone spent in or near each restricted area per hour
+        """
+        CREATE TABLE IF NOT EXISTS zone_dwell_hourly (
+            hour TIMESTAMP NOT NULL,
+            zone_key VARCHAR(50) NOT NULL,
+            drone_id VARCHAR(50) NOT NULL,
+            seconds DOUBLE PRECISION NOT NULL,
+            reports INTEGER NOT NULL,
+            PRIMARY KEY (hour, zone_key, drone_id)
+        );
+        """,
+        # Reports per grid cell per hour, for the activity heatmap
+        """
+        CREATE TABLE IF NOT EXISTS activity_hourly (
+            hour TIMESTAMP NOT NULL,
+            cell_row INTEGER NOT NULL,
+            cell_col INTEGER NOT NULL,
+            reports INTEGER NOT NULL,
+            PRIMARY KEY (hour, cell_row, cell_col)
+        );
+        """,
+        # Start from the beginning of the history; the first refresh backfills
+        """
+        INSERT INTO analytics_watermark (name, watermark)
+        SELECT 'positions', COALESCE(date_trunc('hour', MIN(created_at)), date_trunc('hour', LOCALTIMESTAMP))
+        FROM drones
+        ON CONFLICT (name) DO NOTHING;
+        """,
+    ]),
+    (11, 'create position_requests idempotency keys', [
+        # Keys of accepted client reports. A report sent again with the same
+        # key (a client retry, a resubmitted form) is recognised and not
+        # written twice, even if its first write's outcome was never seen.
+        # A table of its own since a unique index on the partitioned drones
+        # table would have to include created_at.
+        """
+        CREATE TABLE IF NOT EXISTS position_requests (
+            idempotency_key VARCHAR(100) PRIMARY KEY,
+            drone_id VARCHAR(50) NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            received_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+        # Expiring old keys
+        "CREATE INDEX IF NOT EXISTS idx_position_requests_received_at ON position_requests USING brin (received_at);",
+    ]),
+]
+
+CREATE_MIGRATIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    description TEXT NOT NULL,
+    applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# Arbitrary key so concurrent runners (e.g. two app replicas starting up)
+# apply migrations one at a time
+MIGRATION_LOCK_ID = 7301
+
+
+def current_version():
+    with db.transaction() as cur:
+        cur.execute(CREATE_MIGRATIONS_TABLE)
+        cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations;")
+        return cur.fetchone()[0]
+
+
+def migrate(target=None):
+    """Apply pending migrations up to `target` (default: latest), each in its own transaction."""
+    applied = []
+    for version, description, statements in MIGRATIONS:
+        if target is not None and version > target:
+            break
+        with db.transaction() as cur:
+            cur.execute(CREATE_MIGRATIONS_TABLE)
+            cur.execute("SELECT pg_advisory_xact_lock(%s);", (MIGRATION_LOCK_ID,))
+            cur.execute("SELECT 1 FROM schema_migrations WHERE version = %s;", (version,))
+            if cur.fetchone():
+                continue
+            for statement in statements:
+                if isinstance(statement, tuple):
+                    cur.execute(*statement)
+                else:
+                    cur.execute(statement)
+            cur.execute(
+                "INSERT INTO schema_migrations (version, description) VALUES (%s, %s);",
+                (version, description)
+            )
+        applied.append((version, description))
+    return applied
+
+
+def explain(analyze=False):
+    """Return the query plan of every dashboard query, keyed by name."""
+    plans = {}
+    options = "ANALYZE, BUFFERS" if analyze else "COSTS"
+    for name, (query, params) in queries.DASHBOARD_QUERIES.items():
+        # connection() rolls back on exit, so EXPLAIN ANALYZE of a write
+        # doesn't change any data
+        with db.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"EXPLAIN ({options}) {query}", params)
+                plans[name] = "\n".join(row[0] for row in cur.fetchall())
+    return plans
@@ -0,0 +1,145 @@
+import argparse
+import sys
+from datetime import date, datetime, timedelta
+
+import db
+import positions
+
+PARTITION_PREFIX = 'drones_p'
+
+LIST_PARTITIONS_QUERY = """
+SELECT c.relname
+FROM pg_inherits i
+JOIN pg_class c ON c.oid = i.inhrelid
+WHERE i.inhparent = 'drones'::regclass
+AND c.relname LIKE 'drones\\_p%%'
+ORDER BY c.relname;
+"""
+
+# Last report of each drone in every minute of [start, end)
+ROLLUP_QUERY = """
+INSERT INTO drone_positions_1m (drone_id, bucket, latitude, longitude, pilot_id, samples)
+SELECT DISTINCT ON (drone_id, bucket)
+    drone_id,
+    bucket,
+    latitude,
+    longitude,
+    pilot_id,
+    COUNT(*) OVER (PARTITION BY drone_id, bucket)
+FROM (
+    SELECT *, date_trunc('minute', created_at) AS bucket
+    FROM drones
+    WHERE created_at >= %s AND created_at < %s
+) positions
+ORDER BY drone_id, bucket, created_at DESC
+ON CONFLICT (drone_id, bucket) DO UPDATE SET
+    latitude = EXCLUDED.latitude,
+    longitude = EXCLUDED.longitude,
+    pilot_id = EXCLUDED.pilot_id,
+    samples = EXCLUDED.samples;
+"""
+
+
+# Rows outside every daily partition (from before partitioning, or with a
+# device clock far off) land in drones_default
+OLDEST_DEFAULT_QUERY = "SELECT MIN(created_at) FROM drones_default WHERE created_at < %s;"
+
+PRUNE_DEFAULT_QUERY = "DELETE FROM drones_default WHERE created_at < %s;"
+
+
+def partition_day(name):
+    return datetime.strptime(name[len(PARTITION_PREFIX):], '%Y%m%d').date()
+
+
+def list_partitions():
+    with db.transaction() as cur:
+        cur.execute(LIST_PARTITIONS_QUERY)
+        return [row[0] for row in cur.fetchall()]
+
+
+def create_partitions(ahead_days=7, start=None):
+    """Make sure daily partitions exist from `start` (default today) through `ahead_days` later."""
+    start = start or date.today()
+    created = []
+    with db.transaction() as cur:
+        for offset in range(ahead_days + 1):
+            cur.execute("SELECT ensure_drone_partition(%s);", (start + timedelta(days=offset),))
+            created.append(cur.fetchone()[0])
+    return created
+
+
+def rollup(start, end):
+    """Downsample raw positions in [start, end) into drone_positions_1m."""
+    with db.transaction() as cur:
+        cur.execute(ROLLUP_QUERY, (start, end))
+        return cur.rowcount
+
+
+def drop_expired_partitions(retention_days, keep_rollup=True):
+    """Drop whole daily partitions older than `retention_days` instead of deleting rows."""
+    cutoff = date.today() - timedelta(days=retention_days)
+    dropped = []
+    for name in list_partitions():
+        day = partition_day(name)
+        if day >= cutoff:
+            continue
+        if keep_rollup:
+            rollup(day, day + timedelta(days=1))
+        with db.transaction() as cur:
+            cur.execute(f'ALTER TABLE drones DETACH PARTITION "{name}";')
+            cur.execute(f'DROP TABLE "{name}";')
+        dropped.append(name)
+    return dropped
+
+
+def prune_default(retention_days, keep_rollup=True):
+    """Delete rows older than `retention_days` from the default partition,
+    rolling them up first like dropped partitions. Returns the row count."""
+    cutoff = date.today() - timedelta(days=retention_days)
+    with db.transaction() as cur:
+        cur.execute(OLDEST_DEFAULT_QUERY, (cutoff,))
+        oldest = cur.fetchone()[0]
+        if oldest is None:
+            return 0
+        if keep_rollup:
+            cur.execute(ROLLUP_QUERY, (oldest, cutoff))
+        cur.execute(PRUNE_DEFAULT_QUERY, (cutoff,))
+        return cur.rowcount
+
+
+def expire_requests(key_retention_days):
+    """Forget idempotency keys older than `key_retention_days`; clients
+    retry within minutes, so the keys needn't live as long as the history."""
+    with db.transaction() as cur:
+        return positions.expire_requests(cur, datetime.now() - timedelta(days=key_retention_days))
+
+
+def maintain(ahead_days=7, retention_days=None, keep_rollup=True, key_retention_days=7):
+    created = create_partitions(ahead_days)
+    dropped, pruned = [], 0
+    if retention_days is not None:
+        dropped = drop_expired_partitions(retention_days, keep_rollup)
+        pruned = prune_default(retention_days, keep_rollup)
+    expire_requests(key_retention_days)
+    return created, dropped, pruned
+
+
+if __name__ == "__main__":
+    # Meant to run from cron, e.g. once an hour
+    parser = argparse.ArgumentParser(description="Maintain daily partitions of the drones table")
+    parser.add_argument("--ahead-days", type=int, default=7, help="create partitions this many days ahead")
+    parser.add_argument("--retention-days", type=int, help="drop partitions older than this many days")
+    parser.add_argument("--no-rollup", action="store_true", help="don't keep per-minute rollups of dropped days")
+    parser.add_argument("--key-retention-days", type=int, default=7, help="forget report idempotency keys older than this")
+    args = parser.parse_args()
+
+    try:
+        created, dropped, pruned = maintain(args.ahead_days, args.retention_days, not args.no_rollup, args.key_retention_days)
+        print(f"Partitions present through {created[-1]}")
+        for name in dropped:
+            print(f"Dropped expired partition {name}")
+        if pruned:
+            print(f"Deleted {pruned} expired rows from the default partition")
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,61 @@
+import pandas as pd
+
+import columnar
+import db
+import queries
+from metrics import metrics
+
+# Pilots per page of search results
+PAGE_SIZE = 20
+
+PILOT_COLUMNS = ['id', 'first_name', 'last_name', 'phone_number']
+
+_trigram = None
+
+
+def has_trigram():
+    """Whether pg_trgm is installed; checked once per process."""
+    global _trigram
+    if _trigram is None:
+        with db.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm';")
+                _trigram = cur.fetchone() is not None
+    return _trigram
+
+
+def like_prefix(text):
+    # Escape LIKE's wildcards so they match literally
+    escaped = text.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return escaped + '%'
+
+
+def search(text, page=0, page_size=PAGE_SIZE):
+    """One page of pilots matching `text`; returns (frame, has_more).
+
+    Empty text lists every pilot in name order.
+    """
+    text = text.strip()
+    query = queries.PILOT_TRIGRAM_SEARCH_QUERY if text and has_trigram() else queries.PILOT_SEARCH_QUERY
+    with metrics.timed('db_pilot_search_seconds'):
+        # One extra row tells whether there's a next page
+        frame = columnar.fetch_frame(query, {
+            'prefix': like_prefix(text),
+            'text': text.lower(),
+            'limit': page_size + 1,
+            'offset': page * page_size,
+        })
+    return frame.head(page_size), len(frame) > page_size
+
+
+def by_id(pilot_ids):
+    """Details of the given pilots in one query."""
+    pilot_ids = sorted({int(pilot_id) for pilot_id in pilot_ids})
+    if not pilot_ids:
+        return pd.DataFrame(columns=PILOT_COLUMNS)
+    with metrics.timed('db_pilots_seconds'):
+        return columnar.fetch_frame(queries.PILOTS_BY_ID_QUERY, {'pilot_ids': pilot_ids})
+
+
+def label(pilot):
+    return f"{pilot['first_name']} {pilot['last_name']} ({pilot['phone_number']})"
@@ -0,0 +1,137 @@
+from psycopg2.extras import execute_values
+
+# Append positions to the full history
+INSERT_HISTORY_QUERY = """
+INSERT INTO drones (drone_id, latitude, longitude, created_at, pilot_id)
+VALUES %s
+ON CONFLICT (drone_id, created_at) DO NOTHING
+RETURNING drone_id;
+"""
+
+# Claim the idempotency keys of a batch; the keys returned are new, the
+# rest were accepted before and their reports are replays. A concurrent
+# writer claiming the same key waits here until this transaction ends.
+CLAIM_REQUESTS_QUERY = """
+INSERT INTO position_requests (idempotency_key, drone_id, created_at)
+VALUES %s
+ON CONFLICT (idempotency_key) DO NOTHING
+RETURNING idempotency_key;
+"""
+
+EXPIRE_REQUESTS_QUERY = "DELETE FROM position_requests WHERE received_at < %s;"
+
+# Register drones the first time they report
+REGISTER_FLEET_QUERY = """
+INSERT INTO fleet (drone_id, pilot_id)
+VALUES %s
+ON CONFLICT (drone_id) DO NOTHING;
+"""
+
+# Keep drone_latest pointing at the newest known position of each active
+# drone. Older reports arriving late never overwrite a newer one, and the
+# fleet's pilot assignment wins over the reported one. Ordered, as the join
+# may not keep the VALUES order, so concurrent writers lock rows alike.
+UPSERT_LATEST_QUERY = """
+INSERT INTO drone_latest (drone_id, latitude, longitude, created_at, pilot_id)
+SELECT v.drone_id, v.latitude, v.longitude, v.created_at, COALESCE(f.pilot_id, v.pilot_id)
+FROM (VALUES %s) AS v (drone_id, latitude, longitude, created_at, pilot_id)
+JOIN fleet f ON f.drone_id = v.drone_id
+WHERE f.active
+ORDER BY v.drone_id
+ON CONFLICT (drone_id) DO UPDATE SET
+    latitude = EXCLUDED.latitude,
+    longitude = EXCLUDED.longitude,
+    created_at = EXCLUDED.created_at,
+    pilot_id = EXCLUDED.pilot_id
+WHERE drone_latest.created_at <= EXCLUDED.created_at;
+"""
+# Types the VALUES list, which Postgres would otherwise guess per column
+# (a NULL pilot_id as text)
+LATEST_TEMPLATE = "(%s, %s::DOUBLE PRECISION, %s::DOUBLE PRECISION, %s::TIMESTAMP, %s::INTEGER)"
+
+BACKFILL_FLEET_QUERY = """
+INSERT INTO fleet (drone_id)
+SELECT DISTINCT drone_id FROM drones
+ON CONFLICT (drone_id) DO NOTHING;
+"""
+
+BACKFILL_LATEST_QUERY = """
+INSERT INTO drone_latest (drone_id, latitude, longitude, created_at, pilot_id)
+SELECT DISTINCT ON (d.drone_id)
+    d.drone_id, d.latitude, d.longitude, d.created_at, COALESCE(f.pilot_id, d.pilot_id)
+FROM drones d
+JOIN fleet f ON f.drone_id = d.drone_id
+WHERE f.active
+ORDER BY d.drone_id, d.created_at DESC
+ON CONFLICT (drone_id) DO UPDATE SET
+    latitude = EXCLUDED.latitude,
+    longitude = EXCLUDED.longitude,
+    created_at = EXCLUDED.created_at,
+    pilot_id = EXCLUDED.pilot_id
+WHERE drone_latest.created_at <= EXCLUDED.created_at;
+"""
+
+
+def latest_per_drone(positions):
+    # ON CONFLICT DO UPDATE may touch each row only once per statement,
+    # so collapse the batch to one (newest) position per drone first
+    latest = {}
+    for position in positions:
+        current = latest.get(position[0])
+        if current is None or position[3] >= current[3]:
+            latest[position[0]] = position
+    return list(latest.values())
+
+
+def claim_requests(cur, positions, keys):
+    """The positions whose idempotency key (one per position, or None) is
+    new. The first position with a key wins; positions without one are kept."""
+    claims = {}
+    for key, position in zip(keys, positions):
+        if key is not None and key not in claims:
+            claims[key] = position
+    claimed = set()
+    if claims:
+        # Sorted, so writers claiming overlapping keys lock them in the same order
+        rows = [(key, p[0], p[3]) for key, p in sorted(claims.items())]
+        claimed = {row[0] for row in execute_values(cur, CLAIM_REQUESTS_QUERY, rows, fetch=True)}
+    return [p for key, p in zip(keys, positions) if key is None or (key in claimed and claims[key] is p)]
+
+
+def record_positions(cur, positions, keys=None):
+    """Write (drone_id, latitude, longitude, created_at, pilot_id) tuples to
+    history and drone_latest. Returns the number of new history rows.
+
+    With `keys`, positions whose idempotency key was already accepted are
+    skipped. Everything is upserted, so the whole call can be retried
+    (db.retrying) without duplicating or losing a position. Rows are
+    written in (drone_id, created_at) order so that concurrent writers
+    lock them in the same order instead of deadlocking.
+    """
+    if keys is not None:
+        positions = claim_requests(cur, positions, keys)
+    if not positions:
+        return 0
+    positions = sorted(positions, key=lambda p: (p[0], p[3]))
+    latest = latest_per_drone(positions)
+    execute_values(cur, REGISTER_FLEET_QUERY, [(p[0], p[4]) for p in latest])
+    inserted = len(execute_values(cur, INSERT_HISTORY_QUERY, positions, fetch=True))
+    execute_values(cur, UPSERT_LATEST_QUERY, latest, template=LATEST_TEMPLATE)
+    return inserted
+
+
+def expire_requests(cur, before):
+    """Forget idempotency keys received before `before`; a replay older
+    than that is only deduplicated on (drone_id, created_at)."""
+    cur.execute(EXPIRE_REQUESTS_QUERY, (before,))
+    return cur.rowcount
+
+
+def backfill_latest(cur):
+    cur.execute(BACKFILL_FLEET_QUERY)
+    cur.execute(BACKFILL_LATEST_QUERY)
+    return cur.rowcount
+
+
+def drop_from_frame(frame, drone_ids):
+    return frame[~frame['drone_id'].isin(drone_ids)].reset_index(drop=True)
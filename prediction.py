@@ -0,0 +1,246 @@
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import columnar
+
+# Velocity is fitted to each drone's last SAMPLES reports within
+# HISTORY_SECONDS; drones that haven't reported in that long are skipped
+SAMPLES = 5
+HISTORY_SECONDS = 120
+# Trajectories are extrapolated HORIZON_SECONDS ahead in STEP_SECONDS steps
+HORIZON_SECONDS = 60
+STEP_SECONDS = 10
+# Predicted positions closer than this are a conflict
+PROXIMITY_METERS = 50.0
+
+M_PER_DEG_LAT = 111320.0
+
+MOTION_COLUMNS = ['drone_id', 'latitude', 'longitude', 'created_at', 'v_north', 'v_east', 'speed', 'heading']
+APPROACH_COLUMNS = ['drone_id', 'zone_id', 'zone_name', 'severity', 'seconds']
+CONFLICT_COLUMNS = ['drone_id', 'other_drone_id', 'seconds', 'distance_m']
+
+RECENT_POSITIONS_QUERY = """
+SELECT drone_id, latitude, longitude, created_at
+FROM drones
+WHERE created_at > %(since)s AND created_at <= %(until)s;
+"""
+
+# Estimated motion of every drone, predicted zone entries, and predicted
+# drone pairs closer than PROXIMITY_METERS; `seconds` counts from `at`
+Prediction = namedtuple('Prediction', ['at', 'motion', 'approaches', 'conflicts'])
+
+
+def empty_prediction(at=None):
+    return Prediction(
+        at=at,
+        motion=pd.DataFrame(columns=MOTION_COLUMNS),
+        approaches=pd.DataFrame(columns=APPROACH_COLUMNS),
+        conflicts=pd.DataFrame(columns=CONFLICT_COLUMNS),
+    )
+
+
+def load_recent(until, history_seconds=HISTORY_SECONDS):
+    """Reports of the last `history_seconds` before `until`; a range scan of
+    the newest partition through the BRIN index on created_at."""
+    since = pd.Timestamp(until) - pd.Timedelta(seconds=history_seconds)
+    return columnar.fetch_frame(RECENT_POSITIONS_QUERY, {
+        'since': since.to_pydatetime(),
+        'until': pd.Timestamp(until).to_pydatetime(),
+    })
+
+
+def estimate_motion(recent, samples=SAMPLES):
+    """Last position and velocity of each drone from its recent reports.
+
+    Velocity (m/s north and east) is the least-squares slope of position
+    over time across the drone's last `samples` reports, computed for all
+    drones at once with grouped sums. A drone with one report is hovering.
+    """
+    if recent.empty:
+        return pd.DataFrame(columns=MOTION_COLUMNS)
+    recent = recent.sort_values(['drone_id', 'created_at'], ignore_index=True)
+    recent = recent[recent.groupby('drone_id', sort=False).cumcount(ascending=False) < samples]
+
+    codes, drone_ids = pd.factorize(recent['drone_id'], sort=False)
+    last = recent.groupby(codes, sort=False).tail(1)
+
+    # Time and displacement relative to each drone's last report, in
+    # seconds and metres, keep the sums well conditioned
+    times = recent['created_at'].to_numpy()
+    t = (times - last['created_at'].to_numpy()[codes]) / np.timedelta64(1, 's')
+    lat0 = last['latitude'].to_numpy()
+    m_per_deg_lon = M_PER_DEG_LAT * np.cos(np.radians(lat0))
+    north = (recent['latitude'].to_numpy() - lat0[codes]) * M_PER_DEG_LAT
+    east = (recent['longitude'].to_numpy() - last['longitude'].to_numpy()[codes]) * m_per_deg_lon[codes]
+
+    groups = len(drone_ids)
+    n = np.bincount(codes, minlength=groups).astype(np.float64)
+    st = np.bincount(codes, t, groups)
+    stt = np.bincount(codes, t * t, groups)
+    denominator = n * stt - st * st
+    moving = denominator > 1e-9
+    safe = np.where(moving, denominator, 1.0)
+
+    def slope(values):
+        sv = np.bincount(codes, values, groups)
+        stv = np.bincount(codes, t * values, groups)
+        return np.where(moving, (n * stv - st * sv) / safe, 0.0)
+
+    v_north = slope(north)
+    v_east = slope(east)
+    return pd.DataFrame({
+        'drone_id': np.asarray(drone_ids, dtype=object),
+        'latitude': lat0,
+        'longitude': last['longitude'].to_numpy(),
+        'created_at': last['created_at'].to_numpy(),
+        'v_north': v_north,
+        'v_east': v_east,
+        'speed': np.hypot(v_north, v_east),
+        'heading': np.degrees(np.arctan2(v_east, v_north)) % 360,
+    }, columns=MOTION_COLUMNS)
+
+
+def extrapolate(motion, at, horizon=HORIZON_SECONDS, step=STEP_SECONDS):
+    """Predicted (latitudes, longitudes), shaped (steps + 1, drones), at
+    `at` + k * step for k = 0 .. horizon / step."""
+    offsets = np.arange(0, horizon + step, step, dtype=np.float64)
+    elapsed = (np.datetime64(pd.Timestamp(at)) - motion['created_at'].to_numpy()) / np.timedelta64(1, 's')
+    dt = elapsed[None, :] + offsets[:, None]
+    lat0 = motion['latitude'].to_numpy(dtype=np.float64)
+    lon0 = motion['longitude'].to_numpy(dtype=np.float64)
+    m_per_deg_lon = M_PER_DEG_LAT * np.cos(np.radians(lat0))
+    latitudes = lat0 + motion['v_north'].to_numpy(dtype=np.float64) * dt / M_PER_DEG_LAT
+    longitudes = lon0 + motion['v_east'].to_numpy(dtype=np.float64) * dt / m_per_deg_lon
+    return latitudes, longitudes
+
+
+def zone_approaches(motion, latitudes, longitudes, fence, step=STEP_SECONDS):
+    """Earliest predicted entry of each drone into each zone it isn't in now."""
+    steps, drones = latitudes.shape
+    point_idx, zone_idx = fence.locate(latitudes.ravel(), longitudes.ravel())
+    if len(point_idx) == 0:
+        return pd.DataFrame(columns=APPROACH_COLUMNS)
+    k, drone = np.divmod(point_idx, drones)
+
+    hits = pd.DataFrame({'k': k, 'drone': drone, 'zone': zone_idx})
+    earliest = hits.groupby(['drone', 'zone'], sort=False)['k'].min().reset_index()
+    earliest = earliest[earliest['k'] > 0]
+    return pd.DataFrame({
+        'drone_id': motion['drone_id'].to_numpy()[earliest['drone'].to_numpy()],
+        'zone_id': fence.zone_ids[earliest['zone'].to_numpy()],
+        'zone_name': fence.names[earliest['zone'].to_numpy()],
+        'severity': fence.severities[earliest['zone'].to_numpy()],
+        'seconds': earliest['k'].to_numpy() * step,
+    }, columns=APPROACH_COLUMNS).sort_values('seconds', kind='stable', ignore_index=True)
+
+
+# Neighbouring cells visited from each cell: itself plus half of its
+# neighbours, so every pair of adjacent cells is compared once
+HALF_NEIGHBOURHOOD = ((0, 0), (0, 1), (1, -1), (1, 0), (1, 1))
+
+
+def close_pairs(x, y, radius):
+    """Pairs (i, j, distance) of points within `radius` of each other.
+
+    Points are bucketed into a uniform grid of radius-sized cells and only
+    points in the same or adjacent cells are compared, so the cost is a
+    sort plus the number of candidate pairs rather than O(N^2).
+    """
+    n = len(x)
+    if n < 2:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0)
+    cx = np.floor(x / radius).astype(np.int64)
+    cy = np.floor(y / radius).astype(np.int64)
+    cx -= cx.min()
+    cy -= cy.min()
+    # Leaves room for the -1..+1 column offsets without keys colliding
+    width = cy.max() + 3
+    order = np.argsort(cx * width + cy + 1, kind='stable')
+    keys = (cx * width + cy + 1)[order]
+
+    # A neighbour offset is a constant shift of the key, so the targets are
+    # sorted too and the searches run in order
+    first, second = [], []
+    for dx, dy in HALF_NEIGHBOURHOOD:
+        targets = keys + (dx * width + dy)
+        lo = np.searchsorted(keys, targets, 'left')
+        counts = np.searchsorted(keys, targets, 'right') - lo
+        total = counts.sum()
+        if total == 0:
+            continue
+        a = np.repeat(np.arange(n), counts)
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        b = np.repeat(lo, counts) + offsets
+        if (dx, dy) == (0, 0):
+            # Same cell: every pair appears twice, plus each point with itself
+            keep = a < b
+            a, b = a[keep], b[keep]
+        first.append(order[a])
+        second.append(order[b])
+
+    if not first:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0)
+    i = np.concatenate(first)
+    j = np.concatenate(second)
+    distance = np.hypot(x[i] - x[j], y[i] - y[j])
+    close = distance <= radius
+    return np.minimum(i, j)[close], np.maximum(i, j)[close], distance[close]
+
+
+def conflicts(motion, latitudes, longitudes, radius=PROXIMITY_METERS, step=STEP_SECONDS):
+    """Drone pairs predicted within `radius` metres: when first, and how close at most."""
+    if latitudes.shape[1] < 2:
+        return pd.DataFrame(columns=CONFLICT_COLUMNS)
+    # Flat projection around the fleet's mean latitude; fine at city scale
+    m_per_deg_lon = M_PER_DEG_LAT * np.cos(np.radians(np.mean(latitudes[0])))
+
+    drones = latitudes.shape[1]
+    keys, steps, distances = [], [], []
+    for k in range(latitudes.shape[0]):
+        i, j, distance = close_pairs(longitudes[k] * m_per_deg_lon, latitudes[k] * M_PER_DEG_LAT, radius)
+        keys.append(i * drones + j)
+        steps.append(np.full(len(i), k))
+        distances.append(distance)
+    keys = np.concatenate(keys)
+    if len(keys) == 0:
+        return pd.DataFrame(columns=CONFLICT_COLUMNS)
+
+    # Group by pair; steps were appended in order, so a stable sort leaves
+    # each pair's earliest step first
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    first_step = np.concatenate(steps)[order][starts]
+    closest = np.minimum.reduceat(np.concatenate(distances)[order], starts)
+    i, j = np.divmod(keys[starts], drones)
+    drone_ids = motion['drone_id'].to_numpy()
+    return pd.DataFrame({
+        'drone_id': drone_ids[i],
+        'other_drone_id': drone_ids[j],
+        'seconds': first_step * step,
+        'distance_m': closest,
+    }, columns=CONFLICT_COLUMNS).sort_values(['seconds', 'distance_m'], kind='stable', ignore_index=True)
+
+
+def predict(recent, at, fence, horizon=HORIZON_SECONDS, step=STEP_SECONDS, radius=PROXIMITY_METERS):
+    """Prediction for the drones in `recent` (their latest reports) at time `at`."""
+    motion = estimate_motion(recent)
+    if motion.empty:
+        return empty_prediction(at)
+    latitudes, longitudes = extrapolate(motion, at, horizon, step)
+    return Prediction(
+        at=at,
+        motion=motion,
+        approaches=zone_approaches(motion, latitudes, longitudes, fence, step),
+        conflicts=conflicts(motion, latitudes, longitudes, radius, step),
+    )
+
+
+def predict_fleet(drone_ids, fence, at=None):
+    """Prediction for the given (active) drones from their reports in the database."""
+    at = at or datetime.now()
+    recent = load_recent(at)
+    return predict(recent[recent['drone_id'].isin(drone_ids)], at, fence)
@@ -0,0 +1,240 @@
+# SQL used by the dashboard. Kept out of main.py so it can be shared with
+# scripts (e.g. `python init_db.py --explain`) without starting Streamlit.
+
+# Current position of each drone. drone_latest holds one row per drone, so
+# this doesn't grow with history. Pilot details are looked up separately,
+# only for the drones on screen (PILOTS_BY_ID_QUERY).
+LATEST_POSITIONS_QUERY = """
+SELECT
+    l.drone_id,
+    l.latitude,
+    l.longitude,
+    l.created_at,
+    l.pilot_id
+FROM drone_latest l
+ORDER BY l.created_at DESC;
+"""
+
+# Latest positions of specific drones, for applying change notifications
+LATEST_POSITIONS_BY_ID_QUERY = """
+SELECT
+    l.drone_id,
+    l.latitude,
+    l.longitude,
+    l.created_at,
+    l.pilot_id
+FROM drone_latest l
+WHERE l.drone_id = ANY(%(drone_ids)s);
+"""
+
+# One page of pilots whose full name, last name or phone number starts
+# with %(prefix)s (a lower-cased LIKE pattern), in name order. The
+# text_pattern_ops indexes from migration 8 serve the prefix matches.
+PILOT_SEARCH_QUERY = """
+SELECT id, first_name, last_name, phone_number
+FROM pilots
+WHERE lower(first_name || ' ' || last_name) LIKE %(prefix)s
+   OR lower(last_name) LIKE %(prefix)s
+   OR phone_number LIKE %(prefix)s
+ORDER BY first_name, last_name, id
+LIMIT %(limit)s OFFSET %(offset)s;
+"""
+
+# The same plus fuzzy matches on the full name through pg_trgm (when the
+# extension is installed): prefix matches first, then by similarity
+PILOT_TRIGRAM_SEARCH_QUERY = """
+SELECT id, first_name, last_name, phone_number
+FROM pilots
+WHERE lower(first_name || ' ' || last_name) LIKE %(prefix)s
+   OR lower(last_name) LIKE %(prefix)s
+   OR phone_number LIKE %(prefix)s
+   OR lower(first_name || ' ' || last_name) %% %(text)s
+ORDER BY
+    (lower(first_name || ' ' || last_name) LIKE %(prefix)s
+     OR lower(last_name) LIKE %(prefix)s
+     OR phone_number LIKE %(prefix)s) DESC,
+    similarity(lower(first_name || ' ' || last_name), %(text)s) DESC,
+    first_name, last_name, id
+LIMIT %(limit)s OFFSET %(offset)s;
+"""
+
+# Details of the pilots of the drones on screen, fetched in one batch
+PILOTS_BY_ID_QUERY = """
+SELECT id, first_name, last_name, phone_number
+FROM pilots
+WHERE id = ANY(%(pilot_ids)s);
+"""
+
+# Fleet operations, one statement per batch of drone ids. Deactivating a
+# drone only takes it off the map; it stays in fleet and its history in
+# the partitioned drones table ages out through partition retention.
+DEACTIVATE_DRONES_QUERY = """
+WITH deactivated AS (
+    UPDATE fleet
+    SET active = FALSE, deactivated_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+    WHERE drone_id = ANY(%(drone_ids)s) AND active
+    RETURNING drone_id
+), removed AS (
+    DELETE FROM drone_latest
+    WHERE drone_id IN (SELECT drone_id FROM deactivated)
+)
+SELECT COUNT(*) FROM deactivated;
+"""
+
+# Puts reactivated drones back on the map at their last recorded position
+ACTIVATE_DRONES_QUERY = """
+WITH activated AS (
+    UPDATE fleet
+    SET active = TRUE, deactivated_at = NULL, updated_at = CURRENT_TIMESTAMP
+    WHERE drone_id = ANY(%(drone_ids)s) AND NOT active
+    RETURNING drone_id, pilot_id
+), restored AS (
+    INSERT INTO drone_latest (drone_id, latitude, longitude, created_at, pilot_id)
+    SELECT a.drone_id, d.latitude, d.longitude, d.created_at, COALESCE(a.pilot_id, d.pilot_id)
+    FROM activated a
+    CROSS JOIN LATERAL (
+        SELECT latitude, longitude, created_at, pilot_id
+        FROM drones
+        WHERE drones.drone_id = a.drone_id
+        ORDER BY created_at DESC
+        LIMIT 1
+    ) d
+    ON CONFLICT (drone_id) DO NOTHING
+)
+SELECT COUNT(*) FROM activated;
+"""
+
+REASSIGN_DRONES_QUERY = """
+WITH reassigned AS (
+    UPDATE fleet
+    SET pilot_id = %(pilot_id)s, updated_at = CURRENT_TIMESTAMP
+    WHERE drone_id = ANY(%(drone_ids)s)
+    RETURNING drone_id
+), shown AS (
+    UPDATE drone_latest
+    SET pilot_id = %(pilot_id)s
+    WHERE drone_id IN (SELECT drone_id FROM reassigned)
+)
+SELECT COUNT(*) FROM reassigned;
+"""
+
+# Register drones or update their pilots from parallel id arrays;
+# %(activate)s also reactivates ones that were deactivated
+IMPORT_DRONES_QUERY = """
+WITH imported AS (
+    INSERT INTO fleet (drone_id, pilot_id)
+    SELECT * FROM unnest(%(drone_ids)s::VARCHAR[], %(pilot_ids)s::INTEGER[])
+    ON CONFLICT (drone_id) DO UPDATE SET
+        pilot_id = EXCLUDED.pilot_id,
+        active = fleet.active OR %(activate)s,
+        deactivated_at = CASE WHEN %(activate)s THEN NULL ELSE fleet.deactivated_at END,
+        updated_at = CURRENT_TIMESTAMP
+    RETURNING drone_id, pilot_id
+), shown AS (
+    UPDATE drone_latest l
+    SET pilot_id = i.pilot_id
+    FROM imported i
+    WHERE l.drone_id = i.drone_id AND l.pilot_id IS DISTINCT FROM i.pilot_id
+)
+SELECT COUNT(*) FROM imported;
+"""
+
+FLEET_QUERY = """
+SELECT drone_id, pilot_id, active, registered_at, deactivated_at
+FROM fleet
+ORDER BY drone_id;
+"""
+
+# One page of downsampled track history: the last report of each selected
+# drone in every %(step)s-second bucket of [start, end). Days whose raw
+# partitions were dropped by retention come from the per-minute rollup,
+# timestamped at the start of their minute. Each drone's rows are an
+# index range scan on (drone_id, created_at) and (drone_id, bucket).
+TRACK_PAGE_QUERY = """
+SELECT DISTINCT ON (drone_id, bucket)
+    drone_id,
+    floor(extract(epoch FROM created_at) / %(step)s)::BIGINT AS bucket,
+    latitude,
+    longitude,
+    created_at
+FROM (
+    SELECT drone_id, latitude, longitude, created_at
+    FROM drones
+    WHERE drone_id = ANY(%(drone_ids)s)
+    AND created_at >= %(start)s AND created_at < %(end)s
+    UNION ALL
+    SELECT drone_id, latitude, longitude, bucket
+    FROM drone_positions_1m
+    WHERE drone_id = ANY(%(drone_ids)s)
+    AND bucket >= %(start)s AND bucket < %(end)s
+) positions
+ORDER BY drone_id, bucket, created_at DESC;
+"""
+
+# Analytics, served from the hourly rollups of analytics.py over
+# [start, end); hours are whole, so the range is too
+PILOT_ACTIVITY_QUERY = """
+SELECT
+    r.pilot_id,
+    p.first_name,
+    p.last_name,
+    COUNT(DISTINCT r.drone_id) AS drones,
+    COUNT(DISTINCT r.hour) AS active_hours,
+    SUM(r.reports) AS reports
+FROM pilot_drone_hourly r
+LEFT JOIN pilots p ON p.id = r.pilot_id
+WHERE r.hour >= %(start)s AND r.hour < %(end)s
+GROUP BY r.pilot_id, p.first_name, p.last_name
+ORDER BY drones DESC, reports DESC
+LIMIT %(limit)s;
+"""
+
+ZONE_DWELL_QUERY = """
+SELECT
+    d.zone_key,
+    COALESCE(a.name, d.zone_key) AS zone_name,
+    a.color AS severity,
+    COUNT(DISTINCT d.drone_id) AS drones,
+    SUM(d.seconds) / 60 AS dwell_minutes,
+    SUM(d.reports) AS reports
+FROM zone_dwell_hourly d
+LEFT JOIN restricted_areas a ON a.zone_key = d.zone_key
+WHERE d.hour >= %(start)s AND d.hour < %(end)s
+GROUP BY d.zone_key, a.name, a.color
+ORDER BY dwell_minutes DESC;
+"""
+
+ACTIVITY_HEATMAP_QUERY = """
+SELECT
+    (cell_row + 0.5) * %(cell)s AS latitude,
+    (cell_col + 0.5) * %(cell)s AS longitude,
+    SUM(reports) AS reports
+FROM activity_hourly
+WHERE hour >= %(start)s AND hour < %(end)s
+GROUP BY cell_row, cell_col;
+"""
+
+ACTIVITY_BY_HOUR_QUERY = """
+SELECT hour, SUM(reports) AS reports
+FROM activity_hourly
+WHERE hour >= %(start)s AND hour < %(end)s
+GROUP BY hour
+ORDER BY hour;
+"""
+
+# Queries whose plans `init_db.py --explain` prints, with sample parameters
+DASHBOARD_QUERIES = {
+    'load_data': (LATEST_POSITIONS_QUERY, None),
+    'load_changed': (LATEST_POSITIONS_BY_ID_QUERY, {'drone_ids': ['DRONE-001', 'DRONE-002']}),
+    'search_pilots': (PILOT_SEARCH_QUERY, {'prefix': 'ai%', 'limit': 21, 'offset': 0}),
+    'load_pilots_by_id': (PILOTS_BY_ID_QUERY, {'pilot_ids': [1, 2, 3]}),
+    'load_track_page': (TRACK_PAGE_QUERY, {
+        'drone_ids': ['DRONE-001', 'DRONE-002'], 'step': 60,
+        'start': '2024-01-01 00:00', 'end': '2024-01-01 02:00',
+    }),
+    'deactivate_drones': (DEACTIVATE_DRONES_QUERY, {'drone_ids': ['DRONE-001', 'DRONE-002']}),
+    'reassign_drones': (REASSIGN_DRONES_QUERY, {'drone_ids': ['DRONE-001', 'DRONE-002'], 'pilot_id': 1}),
+    'pilot_activity': (PILOT_ACTIVITY_QUERY, {'start': '2024-01-01 00:00', 'end': '2024-01-08 00:00', 'limit': 50}),
+    'zone_dwell': (ZONE_DWELL_QUERY, {'start': '2024-01-01 00:00', 'end': '2024-01-08 00:00'}),
+    'activity_heatmap': (ACTIVITY_HEATMAP_QUERY, {'start': '2024-01-01 00:00', 'end': '2024-01-08 00:00', 'cell': 0.005}),
+}
@@ -0,0 +1,125 @@
+# The original restricted areas. Migration 7 seeds them into the
+# restricted_areas table, which is what the dashboard reads; manage zones
+# with `python zones.py`.
+RESTRICTED_AREAS = {
+    'akorda': {
+        'name': 'Акорда',
+        'description': 'Президентский дворец Казахстана',
+        'coordinates': [
+            [51.1255, 71.4305],  # Northwest
+            [51.1255, 71.4355],  # Northeast
+            [51.1225, 71.4355],  # Southeast
+            [51.1225, 71.4305],  # Southwest
+            [51.1255, 71.4305]   # Close the polygon
+        ],
+        'color': 'red'
+    },
+    'parliament': {
+        'name': 'Парламент',
+        'description': 'Здание Парламента Республики Казахстан',
+        'coordinates': [
+            [51.1275, 71.4455],
+            [51.1275, 71.4505],
+            [51.1245, 71.4505],
+            [51.1245, 71.4455],
+            [51.1275, 71.4455]
+        ],
+        'color': 'red'
+    },
+    'khan_shater': {
+        'name': 'Хан Шатыр',
+        'description': 'Торгово-развлекательный центр',
+        'coordinates': [
+            [51.1305, 71.4055],
+            [51.1305, 71.4105],
+            [51.1275, 71.4105],
+            [51.1275, 71.4055],
+            [51.1305, 71.4055]
+        ],
+        'color': 'orange'
+    },
+    'bayterek': {
+        'name': 'Байтерек',
+        'description': 'Национальный символ Казахстана',
+        'coordinates': [
+            [51.1285, 71.4305],
+            [51.1285, 71.4355],
+            [51.1255, 71.4355],
+            [51.1255, 71.4305],
+            [51.1285, 71.4305]
+        ],
+        'color': 'orange'
+    },
+    'nazarbayev_center': {
+        'name': 'Центр Назарбаева',
+        'description': 'Музей и культурный центр',
+        'coordinates': [
+            [51.1325, 71.4255],
+            [51.1325, 71.4305],
+            [51.1295, 71.4305],
+            [51.1295, 71.4255],
+            [51.1325, 71.4255]
+        ],
+        'color': 'orange'
+    },
+    'military_base': {
+        'name': 'Военная база',
+        'description': 'Военное подразделение',
+        'coordinates': [
+            [51.1355, 71.4155],
+            [51.1355, 71.4205],
+            [51.1325, 71.4205],
+            [51.1325, 71.4155],
+            [51.1355, 71.4155]
+        ],
+        'color': 'red'
+    },
+    'airport': {
+        'name': 'Международный аэропорт',
+        'description': 'Аэропорт Нурсултан Назарбаев',
+        'coordinates': [
+            [51.0225, 71.4655],
+            [51.0225, 71.4755],
+            [51.0175, 71.4755],
+            [51.0175, 71.4655],
+            [51.0225, 71.4655]
+        ],
+        'color': 'red'
+    },
+    'train_station': {
+        'name': 'Железнодорожный вокзал',
+        'description': 'Главный железнодорожный вокзал',
+        'coordinates': [
+            [51.1825, 71.4155],
+            [51.1825, 71.4205],
+            [51.1795, 71.4205],
+            [51.1795, 71.4155],
+            [51.1825, 71.4155]
+        ],
+        'color': 'orange'
+    },
+    'power_plant': {
+        'name': 'ТЭЦ-2',
+        'description': 'Теплоэлектроцентраль',
+        'coordinates': [
+            [51.1925, 71.4255],
+            [51.1925, 71.4305],
+            [51.1895, 71.4305],
+            [51.1895, 71.4255],
+            [51.1925, 71.4255]
+        ],
+        'color': 'red'
+    },
+    'water_reservoir': {
+        'name': 'Водохранилище',
+        'description': 'Главное водохранилище города',
+        'coordinates': [
+            [51.1425, 71.3955],
+            [51.1425, 71.4005],
+            [51.1395, 71.4005],
+            [51.1395, 71.3955],
+            [51.1425, 71.3955]
+        ],
+        'color': 'orange'
+    }
+}
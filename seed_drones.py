@@ -1,34 +1,26 @@
 import os
-import psycopg2
 from datetime import datetime, timedelta
 import random
-import streamlit as st
 
-DATABASE_URL = st.secrets["db_url"]
+import db
+import ingest
+
+# Base coordinates (Astana, Kazakhstan)
+BASE_LAT = 51.1694
+BASE_LON = 71.4491
 
 def get_pilot_ids():
     try:
-        conn = psycopg2.connect(DATABASE_URL)
-        
-        cur = conn.cursor()
-        cur.execute("SELECT id FROM pilots;")
-        pilot_ids = [row[0] for row in cur.fetchall()]
+        with db.transaction() as cur:
+            cur.execute("SELECT id FROM pilots;")
+            pilot_ids = [row[0] for row in cur.fetchall()]
         
         return pilot_ids
     except Exception as e:
         print(f"Error getting pilot IDs: {e}")
         return []
-    finally:
-        if 'cur' in locals():
-            cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 def generate_drone_data(num_drones=200):
-    # Base coordinates (Astana, Kazakhstan)
-    base_lat = 51.1694
-    base_lon = 71.4491
-    
     # Get available pilot IDs
     pilot_ids = get_pilot_ids()
     if not pilot_ids:
@@ -40,8 +32,8 @@ def generate_drone_data(num_drones=200):
     
     for i in range(num_drones):
         # Generate random position within ~10km radius
-        lat = base_lat + random.uniform(-0.1, 0.1)
-        lon = base_lon + random.uniform(-0.1, 0.1)
+        lat = BASE_LAT + random.uniform(-0.1, 0.1)
+        lon = BASE_LON + random.uniform(-0.1, 0.1)
         
         # Generate random timestamp within last 5 minutes
         time_offset = random.uniform(0, 300)  # 300 seconds = 5 minutes
@@ -62,46 +54,24 @@ def generate_drone_data(num_drones=200):
 
 def seed_database():
     try:
-        # Connect to PostgreSQL
-        conn = psycopg2.connect(DATABASE_URL)
-        
-        # Create a cursor
-        cur = conn.cursor()
-        
         # Generate drone data
         drones = generate_drone_data()
         if not drones:
             return
         
-        # Prepare the insert query
-        insert_query = """
-        INSERT INTO drones (drone_id, latitude, longitude, created_at, pilot_id)
-        VALUES (%s, %s, %s, %s, %s)
-        ON CONFLICT (drone_id, created_at) DO NOTHING;
-        """
-        
-        # Insert the data
-        for drone in drones:
-            cur.execute(insert_query, (
-                drone['drone_id'],
-                drone['latitude'],
-                drone['longitude'],
-                drone['created_at'],
-                drone['pilot_id']
-            ))
-        
-        # Commit the changes
-        conn.commit()
+        # Bulk-load through the COPY ingest path, keeping drone_latest in sync
+        ingest.write_batch([(
+            drone['drone_id'],
+            drone['latitude'],
+            drone['longitude'],
+            drone['created_at'],
+            drone['pilot_id']
+        ) for drone in drones])
         
         print(f"Successfully seeded {len(drones)} drone records!")
         
     except Exception as e:
         print(f"Error: {e}")
-    finally:
-        if 'cur' in locals():
-            cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 if __name__ == "__main__":
     seed_database() 
\ No newline at end of file
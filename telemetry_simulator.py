@@ -0,0 +1,133 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError
+from tornado.websocket import websocket_connect
+
+from fleet_generator import percentile, simulate_tracks
+
+
+def reports(drone_ids, latitudes, longitudes, timestamp):
+    return [
+        {'drone_id': drone_id, 'latitude': lat, 'longitude': lon, 'timestamp': timestamp}
+        for drone_id, lat, lon in zip(drone_ids, latitudes.tolist(), longitudes.tolist())
+    ]
+
+
+class Sender:
+    """One client connection: sends JSON lists of reports and times each ack."""
+
+    def __init__(self, url):
+        self.url = url
+        self.latencies = []
+        self.sent = 0
+        self.retries = 0
+        self._socket = None
+        self._http = None
+
+    async def connect(self):
+        if self.url.startswith('ws'):
+            self._socket = await websocket_connect(self.url)
+        else:
+            self._http = AsyncHTTPClient()
+
+    async def send(self, batch):
+        body = json.dumps(batch)
+        started = time.perf_counter()
+        if self._socket is not None:
+            await self._socket.write_message(body)
+            ack = await self._socket.read_message()
+            if ack is None:
+                raise ConnectionError("ingest service closed the connection")
+        else:
+            while True:
+                try:
+                    await self._http.fetch(self.url, method='POST', body=body,
+                                           headers={'Content-Type': 'application/json'})
+                    break
+                except HTTPClientError as e:
+                    if e.code != 503:
+                        raise
+                    # Queue full: back off as the service asks, then resend
+                    self.retries += 1
+                    await asyncio.sleep(float(e.response.headers.get('Retry-After', 1)))
+        self.latencies.append(time.perf_counter() - started)
+        self.sent += len(batch)
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+
+
+async def run_connection(sender, drone_ids, rate, duration, interval, batch_size, seed):
+    # Each connection flies its own slice of the fleet
+    rng = np.random.default_rng(seed)
+    await sender.connect()
+    started = time.monotonic()
+    steps = duration * rate / len(drone_ids) + 1
+    try:
+        for _, lat, lon in simulate_tracks(len(drone_ids), steps * interval / 3600, interval, rng, chunk_steps=1):
+            if time.monotonic() - started >= duration:
+                break
+            # Devices stamp their own reports
+            step = reports(drone_ids, lat[0], lon[0], datetime.now().isoformat())
+            for offset in range(0, len(step), batch_size):
+                if time.monotonic() - started >= duration:
+                    break
+                wait = started + sender.sent / rate - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                await sender.send(step[offset:offset + batch_size])
+    finally:
+        sender.close()
+
+
+async def simulate(url, num_drones, rate, duration, connections=4, batch_size=100, interval=1, seed=42):
+    """Stream simulated reports to the ingest service at `rate` reports/sec in total."""
+    drone_ids = np.array([f'SIM-{i:06d}' for i in range(num_drones)])
+    senders = [Sender(url) for _ in range(connections)]
+    started = time.monotonic()
+    await asyncio.gather(*(
+        run_connection(sender, ids.tolist(), rate / connections, duration, interval, batch_size, seed + i)
+        for i, (sender, ids) in enumerate(zip(senders, np.array_split(drone_ids, connections)))
+    ))
+    elapsed = time.monotonic() - started
+    latencies = [latency for sender in senders for latency in sender.latencies]
+    sent = sum(sender.sent for sender in senders)
+    return {
+        'reports': sent,
+        'achieved_rate': sent / elapsed,
+        'retries': sum(sender.retries for sender in senders),
+        'ack_p50': percentile(latencies, 0.5),
+        'ack_p95': percentile(latencies, 0.95),
+        'ack_max': max(latencies, default=0.0),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream simulated drone telemetry to the ingest service")
+    parser.add_argument("--url", default="ws://localhost:8600/ws",
+                        help="ws://.../ws for WebSocket or http://.../positions for HTTP")
+    parser.add_argument("--drones", type=int, default=1000)
+    parser.add_argument("--rate", type=int, default=2000, help="reports per second across all connections")
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--connections", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=100, help="reports per message")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    try:
+        result = asyncio.run(simulate(args.url, args.drones, args.rate, args.duration, args.connections,
+                                      args.batch_size, seed=args.seed))
+        print(f"Sent {result['reports']} reports at {result['achieved_rate']:.0f}/sec "
+              f"({result['retries']} retries after 503)")
+        print(f"Ack latency: p50 {result['ack_p50'] * 1000:.1f} ms, p95 {result['ack_p95'] * 1000:.1f} ms, "
+              f"max {result['ack_max'] * 1000:.1f} ms")
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
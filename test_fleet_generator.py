@@ -0,0 +1,17 @@
+import db
+import fleet_generator
+
+# Drones written by the smoke run, kept apart from seeded SIM- drones and
+# removed afterwards
+PREFIX = 'TEST-SIM-'
+
+
+def test_load_test_smoke():
+    try:
+        result = fleet_generator.load_test(20, 100, 2, query_interval=0.2, prefix=PREFIX)
+    finally:
+        with db.transaction() as cur:
+            for table in ('drones', 'drone_latest', 'fleet'):
+                cur.execute(f"DELETE FROM {table} WHERE drone_id LIKE %s;", (PREFIX + '%',))
+    assert result['positions'] > 0
+    assert result['query_samples'] > 0
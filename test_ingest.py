@@ -0,0 +1,183 @@
+import asyncio
+import json
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+import tornado.httpserver
+from tornado.testing import bind_unused_port
+from tornado.websocket import websocket_connect
+
+import db
+import ingest
+import ingest_service
+import positions
+
+# Rows are written to the configured database under this drone id prefix
+# and removed afterwards
+PREFIX = 'TEST-'
+
+
+@pytest.fixture
+def cleanup():
+    def delete():
+        with db.transaction() as cur:
+            for table in ('drones', 'drone_latest', 'fleet'):
+                cur.execute(f"DELETE FROM {table} WHERE drone_id LIKE %s;", (PREFIX + '%',))
+            cur.execute("DELETE FROM position_requests WHERE idempotency_key LIKE %s;", (PREFIX + '%',))
+    delete()
+    yield
+    delete()
+
+
+def unknown_pilot():
+    with db.transaction() as cur:
+        cur.execute("SELECT COALESCE(MAX(id), 0) + 1000 FROM pilots;")
+        return cur.fetchone()[0]
+
+
+def history_rows(drone_id):
+    with db.transaction() as cur:
+        cur.execute("SELECT created_at FROM drones WHERE drone_id = %s;", (drone_id,))
+        return [row[0] for row in cur.fetchall()]
+
+
+def stored():
+    """drone_id -> pilot_id of the test rows in history."""
+    with db.transaction() as cur:
+        cur.execute("SELECT drone_id, pilot_id FROM drones WHERE drone_id LIKE %s;", (PREFIX + '%',))
+        return dict(cur.fetchall())
+
+
+def reports():
+    now = datetime.now()
+    return [
+        (f'{PREFIX}A', 51.17, 71.45, now, None, f'{PREFIX}k1'),
+        # Unknown pilot: written without one
+        (f'{PREFIX}B', 51.18, 71.46, now, unknown_pilot(), f'{PREFIX}k2'),
+        # Longer than drones.drone_id allows: refused by the database
+        (f'{PREFIX}' + 'X' * 50, 51.19, 71.47, now, None, f'{PREFIX}k3'),
+        (f'{PREFIX}C', 51.20, 71.48, now - timedelta(seconds=1), None, f'{PREFIX}k4'),
+    ]
+
+
+def test_parse_report_rejects_boolean_pilot():
+    with pytest.raises(ingest_service.ReportError):
+        ingest_service.parse_report({'drone_id': 'A-1', 'latitude': 51, 'longitude': 71, 'timestamp': 0, 'pilot_id': True})
+
+
+def test_bad_report_does_not_discard_batch(cleanup):
+    inserted, rejected = ingest.write_batch_isolated(reports())
+    assert inserted == 3
+    assert [index for index, _ in rejected] == [2]
+    assert stored() == {f'{PREFIX}A': None, f'{PREFIX}B': None, f'{PREFIX}C': None}
+
+
+def test_batch_writer_keeps_good_reports(cleanup):
+    async def run():
+        writer = ingest_service.BatchWriter(flush_interval=0.05)
+        writer.start()
+        assert await writer.put(reports(), timeout=5)
+        await writer.stop()
+        return writer
+
+    writer = asyncio.run(run())
+    assert writer.failed == 1
+    assert writer.errors == 0
+    assert set(stored()) == {f'{PREFIX}A', f'{PREFIX}B', f'{PREFIX}C'}
+
+
+def test_batch_writer_reports_refused_positions(cleanup):
+    async def run():
+        writer = ingest_service.BatchWriter(flush_interval=0.05)
+        writer.start()
+        results = await writer.write(reports(), timeout=5)
+        await writer.stop()
+        return results
+
+    results = asyncio.run(run())
+    assert [result is None for result in results] == [True, True, False, True]
+
+
+def test_concurrent_writers_same_key_write_once(cleanup):
+    # Every writer sends the same report, some re-stamped as a client
+    # retry would, half through positions and half through ingest
+    drone_id = f'{PREFIX}SAME'
+    now = datetime.now()
+    writers = 8
+    start = threading.Barrier(writers)
+    errors = []
+
+    def write(i):
+        report = (drone_id, 51.17, 71.45, now + timedelta(milliseconds=i), None)
+        try:
+            start.wait()
+            if i % 2:
+                ingest.write_batch([report + (f'{PREFIX}same-key',)])
+            else:
+                db.retrying(lambda cur: positions.record_positions(cur, [report], keys=[f'{PREFIX}same-key']))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    rows = history_rows(drone_id)
+    assert len(rows) == 1
+    with db.transaction() as cur:
+        cur.execute("SELECT created_at FROM position_requests WHERE idempotency_key = %s;", (f'{PREFIX}same-key',))
+        assert cur.fetchall() == [(rows[0],)]
+
+
+def test_retry_after_dropped_connection_writes_once(cleanup):
+    drone_id = f'{PREFIX}RETRY'
+    report = (drone_id, 51.17, 71.45, datetime.now(), None)
+    attempts = []
+
+    def work(cur):
+        attempts.append(len(attempts))
+        inserted = positions.record_positions(cur, [report], keys=[f'{PREFIX}retry-key'])
+        if len(attempts) == 1:
+            # The server drops the connection before the commit
+            cur.execute("SELECT pg_terminate_backend(pg_backend_pid());")
+        return inserted
+
+    assert db.retrying(work, base_delay=0.01) == 1
+    assert len(attempts) == 2
+    # Sent again later, e.g. by a client that never saw the answer
+    assert db.retrying(lambda cur: positions.record_positions(cur, [report], keys=[f'{PREFIX}retry-key'])) == 0
+    assert len(history_rows(drone_id)) == 1
+
+
+def test_socket_ack_lists_refused_reports(cleanup):
+    now = datetime.now().timestamp()
+    messages = [
+        {'drone_id': f'{PREFIX}WS', 'latitude': 51.17, 'longitude': 71.45, 'timestamp': now},
+        # Out of range for pilots.id: refused by the database
+        {'drone_id': f'{PREFIX}WS-BAD', 'latitude': 51.18, 'longitude': 71.46, 'timestamp': now, 'pilot_id': 2 ** 40},
+    ]
+
+    async def run():
+        writer = ingest_service.BatchWriter(flush_interval=0.05)
+        writer.start()
+        sock, port = bind_unused_port()
+        server = tornado.httpserver.HTTPServer(ingest_service.make_app(writer))
+        server.add_sockets([sock])
+        try:
+            socket = await websocket_connect(f'ws://127.0.0.1:{port}/ws?wait=1')
+            await socket.write_message(json.dumps(messages))
+            ack = json.loads(await socket.read_message())
+            socket.close()
+        finally:
+            server.stop()
+            await writer.stop()
+        return ack
+
+    ack = asyncio.run(run())
+    assert ack['written'] == 1
+    assert [failure['index'] for failure in ack['failed']] == [1]
+    assert set(stored()) == {f'{PREFIX}WS'}
@@ -0,0 +1,80 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+# Astana at the map's initial zoom, used before the browser reports bounds
+DEFAULT_BOUNDS = {'south': 51.09, 'west': 71.27, 'north': 51.25, 'east': 71.63}
+DEFAULT_ZOOM = 12
+
+# Below this zoom the map shows per-cell drone counts instead of markers
+MARKER_MIN_ZOOM = 11
+# Grid cells are this fraction of a map tile wide (a tile is 256px)
+CELLS_PER_TILE = 8
+# Hard cap on markers sent for one viewport
+MAX_MARKERS = 5000
+
+
+def from_map_state(state):
+    """Extract (bounds, zoom) from the value st_folium returned on the last rerun."""
+    state = state or {}
+    raw = state.get('bounds') or {}
+    south_west = raw.get('_southWest') or {}
+    north_east = raw.get('_northEast') or {}
+    if None in (south_west.get('lat'), south_west.get('lng'), north_east.get('lat'), north_east.get('lng')):
+        return DEFAULT_BOUNDS, DEFAULT_ZOOM
+    bounds = {
+        'south': south_west['lat'],
+        'west': south_west['lng'],
+        'north': north_east['lat'],
+        'east': north_east['lng'],
+    }
+    return bounds, state.get('zoom') or DEFAULT_ZOOM
+
+
+def cell_size(zoom):
+    """Grid cell size in degrees for a zoom level."""
+    return 360.0 / (2 ** zoom) / CELLS_PER_TILE
+
+
+def snap(bounds, zoom):
+    """Pad the bounds by half a screen and snap them outward to the zoom's grid.
+
+    Small pans then land on the same snapped box, so nearby viewports
+    share cached results, and markers just off-screen are already loaded.
+    """
+    step = cell_size(zoom) * CELLS_PER_TILE
+    pad_lat = (bounds['north'] - bounds['south']) / 2
+    pad_lon = (bounds['east'] - bounds['west']) / 2
+    return {
+        'south': math.floor((bounds['south'] - pad_lat) / step) * step,
+        'west': math.floor((bounds['west'] - pad_lon) / step) * step,
+        'north': math.ceil((bounds['north'] + pad_lat) / step) * step,
+        'east': math.ceil((bounds['east'] + pad_lon) / step) * step,
+    }
+
+
+def select(frame, bounds, limit=MAX_MARKERS):
+    """Rows of a latest-positions frame inside the bounds, newest `limit` first."""
+    lat = frame['latitude'].to_numpy()
+    lon = frame['longitude'].to_numpy()
+    inside = ((lat >= bounds['south']) & (lat <= bounds['north'])
+              & (lon >= bounds['west']) & (lon <= bounds['east']))
+    return frame[inside].head(limit).reset_index(drop=True)
+
+
+def grid(frame, bounds, zoom):
+    """Drone counts per grid cell of a latest-positions frame inside the bounds."""
+    visible = select(frame, bounds, limit=None)
+    cell = cell_size(zoom)
+    cells = pd.DataFrame({
+        'cell_row': np.floor(visible['latitude'].to_numpy() / cell).astype(np.int64),
+        'cell_col': np.floor(visible['longitude'].to_numpy() / cell).astype(np.int64),
+        'latitude': visible['latitude'].to_numpy(),
+        'longitude': visible['longitude'].to_numpy(),
+    })
+    return cells.groupby(['cell_row', 'cell_col'], as_index=False).agg(
+        drones=('latitude', 'size'),
+        latitude=('latitude', 'mean'),
+        longitude=('longitude', 'mean'),
+    )
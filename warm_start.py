@@ -0,0 +1,141 @@
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+
+from metrics import metrics
+
+# Arrow IPC file the dashboard renders from right after a restart, before
+# the snapshot and zones are loaded from Postgres
+SNAPSHOT_FILE = os.getenv("SNAPSHOT_FILE", os.path.join(".cache", "fleet_snapshot.arrow"))
+# Seconds between saves; nothing is written while the snapshot is unchanged
+PERSIST_SECONDS = float(os.getenv("SNAPSHOT_PERSIST_SECONDS", "30"))
+
+# When this process first loaded the dashboard's modules, i.e. its first
+# script run; time_to_first_map_seconds is measured from here
+STARTED = time.monotonic()
+_first_map = None
+
+
+def _zone_to_json(zone):
+    return {**zone, **{
+        field: zone[field].isoformat() if zone[field] is not None else None
+        for field in ('valid_from', 'valid_until')
+    }}
+
+
+def _zone_from_json(zone):
+    return {**zone, **{
+        field: datetime.fromisoformat(zone[field]) if zone[field] is not None else None
+        for field in ('valid_from', 'valid_until')
+    }}
+
+
+def save(frame, zones_version, compiled_zones, path=SNAPSHOT_FILE):
+    """Write the snapshot frame (with its pre-rendered markers) and the
+    compiled restricted areas to `path`, replacing it atomically."""
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    table = table.replace_schema_metadata({
+        'saved_at': str(time.time()),
+        'zones_version': json.dumps(zones_version),
+        'zones': json.dumps([_zone_to_json(zone) for zone in compiled_zones], ensure_ascii=False),
+    })
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with pa.OSFile(temporary, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(temporary, path)
+
+
+def load(path=SNAPSHOT_FILE):
+    """(frame, saved_at, zones_version, compiled zones) from `path`, or None
+    if there is no usable file. The columns are memory-mapped."""
+    try:
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_file(source).read_all()
+        metadata = table.schema.metadata
+        frame = table.to_pandas(coerce_temporal_nanoseconds=True, types_mapper={pa.int32(): pd.Int32Dtype()}.get)
+        zones = [_zone_from_json(zone) for zone in json.loads(metadata[b'zones'])]
+        return frame, float(metadata[b'saved_at']), json.loads(metadata[b'zones_version']), zones
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Error reading {path}: {e}", file=sys.stderr)
+        return None
+
+
+def restore(snapshot, registry, path=SNAPSHOT_FILE):
+    """Seed the snapshot and zone registry from the saved file. Both are
+    reconciled with Postgres afterwards: the snapshot by its listener's
+    first reload, the zones by a background refresh. True if restored."""
+    with metrics.timed('warm_start_load_seconds'):
+        saved = load(path)
+    if saved is None:
+        return False
+    frame, saved_at, zones_version, compiled_zones = saved
+    snapshot.restore(frame, saved_at)
+    if registry.seed(zones_version, compiled_zones):
+        threading.Thread(target=_refresh_zones, args=(registry,), daemon=True, name='zones-refresh').start()
+    metrics.count('warm_starts')
+    return True
+
+
+def _refresh_zones(registry):
+    try:
+        registry.refresh(force=True)
+    except Exception as e:
+        print(f"Error refreshing restricted areas: {e}", file=sys.stderr)
+
+
+def first_map_rendered():
+    """Record, once per process, the seconds from STARTED to the first map."""
+    global _first_map
+    if _first_map is None:
+        _first_map = time.monotonic() - STARTED
+        metrics.observe('time_to_first_map_seconds', _first_map)
+    return _first_map
+
+
+class SnapshotWriter(threading.Thread):
+    """Saves the snapshot and active zones every `interval` seconds once
+    the snapshot has changed since the last save."""
+
+    def __init__(self, snapshot, registry, path=SNAPSHOT_FILE, interval=PERSIST_SECONDS):
+        super().__init__(daemon=True, name='snapshot-writer')
+        self.snapshot = snapshot
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self.saved_version = None
+        self.errors = 0
+        self._stopping = threading.Event()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self.join(timeout)
+
+    def save_now(self):
+        version, frame = self.snapshot.current()
+        # A restored frame is already what the file holds
+        if version == self.saved_version or self.snapshot.restored_at is not None:
+            return False
+        zones_version, compiled_zones = self.registry.compiled()
+        if zones_version is None:
+            return False
+        with metrics.timed('warm_start_save_seconds'):
+            save(frame, zones_version, compiled_zones, self.path)
+        self.saved_version = version
+        return True
+
+    def run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.save_now()
+            except Exception as e:
+                self.errors += 1
+                print(f"Error saving {self.path}: {e}", file=sys.stderr)
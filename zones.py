@@ -0,0 +1,364 @@
+import argparse
+import html
+import json
+import sys
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from psycopg2.extras import Json
+
+import db
+from geofence import Geofence
+from metrics import metrics
+
+# Seconds between checks of restricted_areas_version; edits show up on the
+# dashboard within this long
+VERSION_CHECK_SECONDS = 5
+
+COLORS = ('red', 'orange')
+# Columns update_zone() may change
+ZONE_FIELDS = ('name', 'description', 'color', 'coordinates', 'valid_from', 'valid_until')
+
+# Every zone with the table version it belongs to, read in one statement so
+# the two are consistent. The LEFT JOIN keeps the version row when the
+# table is empty.
+LOAD_ZONES_QUERY = """
+SELECT v.version, a.zone_key, a.name, a.description, a.color, a.coordinates, a.valid_from, a.valid_until
+FROM restricted_areas_version v
+LEFT JOIN restricted_areas a ON TRUE
+ORDER BY a.zone_key;
+"""
+
+ZONES_VERSION_QUERY = "SELECT version FROM restricted_areas_version;"
+
+INSERT_ZONE_QUERY = """
+INSERT INTO restricted_areas (zone_key, name, description, color, coordinates, valid_from, valid_until)
+VALUES (%(zone_key)s, %(name)s, %(description)s, %(color)s, %(coordinates)s, %(valid_from)s, %(valid_until)s);
+"""
+
+# Bulk import: zones keyed like RESTRICTED_AREAS, passed as one JSON document
+UPSERT_ZONES_QUERY = """
+INSERT INTO restricted_areas (zone_key, name, description, color, coordinates, valid_from, valid_until)
+SELECT
+    key,
+    value->>'name',
+    COALESCE(value->>'description', ''),
+    value->>'color',
+    value->'coordinates',
+    (value->>'valid_from')::TIMESTAMP,
+    (value->>'valid_until')::TIMESTAMP
+FROM jsonb_each(%s::jsonb)
+ON CONFLICT (zone_key) DO UPDATE SET
+    name = EXCLUDED.name,
+    description = EXCLUDED.description,
+    color = EXCLUDED.color,
+    coordinates = EXCLUDED.coordinates,
+    valid_from = EXCLUDED.valid_from,
+    valid_until = EXCLUDED.valid_until,
+    updated_at = CURRENT_TIMESTAMP;
+"""
+
+DELETE_ZONE_QUERY = "DELETE FROM restricted_areas WHERE zone_key = %s;"
+
+# The active zones at one moment, ready to use. `key` changes whenever the
+# table or the set of active zones does, so it can key derived caches.
+ZoneSet = namedtuple('ZoneSet', ['key', 'areas', 'geofence', 'geojson'])
+
+# Fallback for when the table can't be read
+NO_ZONES = ZoneSet(key=(None, ()), areas={}, geofence=Geofence({}),
+                   geojson={'type': 'FeatureCollection', 'features': []})
+
+
+def validate_zone(zone):
+    """Raise ValueError if a zone dict can't be stored or drawn."""
+    if zone.get('color') not in COLORS:
+        raise ValueError(f"color must be one of {', '.join(COLORS)}")
+    coordinates = zone.get('coordinates') or []
+    if len(coordinates) < 3:
+        raise ValueError("a zone needs at least 3 vertices")
+    for point in coordinates:
+        if len(point) != 2 or not (-90 <= point[0] <= 90 and -180 <= point[1] <= 180):
+            raise ValueError(f"invalid vertex {point!r}; expected [latitude, longitude]")
+    valid_from, valid_until = zone.get('valid_from'), zone.get('valid_until')
+    if valid_from is not None and valid_until is not None and valid_from >= valid_until:
+        raise ValueError("valid_from must be before valid_until")
+
+
+def list_zones():
+    """All zones, active or not, as dicts sorted by zone_key."""
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(LOAD_ZONES_QUERY)
+            return [_row_to_zone(row) for row in cur.fetchall() if row[1] is not None]
+
+
+def create_zone(zone_key, name, coordinates, color='red', description='', valid_from=None, valid_until=None):
+    zone = {
+        'zone_key': zone_key,
+        'name': name,
+        'description': description,
+        'color': color,
+        'coordinates': [list(map(float, point)) for point in coordinates],
+        'valid_from': valid_from,
+        'valid_until': valid_until,
+    }
+    validate_zone(zone)
+    with db.transaction() as cur:
+        cur.execute(INSERT_ZONE_QUERY, dict(zone, coordinates=Json(zone['coordinates'])))
+
+
+def update_zone(zone_key, **fields):
+    """Change some of a zone's ZONE_FIELDS; returns False if there's no such zone."""
+    unknown = set(fields) - set(ZONE_FIELDS)
+    if unknown:
+        raise ValueError(f"unknown zone fields: {', '.join(sorted(unknown))}")
+    if not fields:
+        return True
+
+    with db.transaction() as cur:
+        cur.execute(
+            "SELECT name, description, color, coordinates, valid_from, valid_until "
+            "FROM restricted_areas WHERE zone_key = %s FOR UPDATE;",
+            (zone_key,)
+        )
+        row = cur.fetchone()
+        if row is None:
+            return False
+        zone = dict(zip(ZONE_FIELDS, row), **fields)
+        validate_zone(zone)
+        assignments = ", ".join(f"{field} = %({field})s" for field in fields)
+        params = dict(fields, zone_key=zone_key)
+        if 'coordinates' in params:
+            params['coordinates'] = Json(params['coordinates'])
+        cur.execute(
+            f"UPDATE restricted_areas SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE zone_key = %(zone_key)s;",
+            params
+        )
+        return True
+
+
+def delete_zone(zone_key):
+    with db.transaction() as cur:
+        cur.execute(DELETE_ZONE_QUERY, (zone_key,))
+        return cur.rowcount > 0
+
+
+def import_zones(areas):
+    """Insert or replace zones given as {zone_key: zone} in one statement."""
+    for zone in areas.values():
+        validate_zone({
+            **zone,
+            'valid_from': _parse_time(zone.get('valid_from')),
+            'valid_until': _parse_time(zone.get('valid_until')),
+        })
+    with db.transaction() as cur:
+        cur.execute(UPSERT_ZONES_QUERY, (json.dumps(areas, default=str),))
+    return len(areas)
+
+
+def _parse_time(value):
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _row_to_zone(row):
+    return dict(zip(('zone_key',) + ZONE_FIELDS, row[1:]))
+
+
+def _compile(zone):
+    # Everything derived from a zone that doesn't depend on the time of day
+    ring = [list(point) for point in zone['coordinates']]
+    if ring[0] != ring[-1]:
+        ring.append(ring[0])
+    name = html.escape(zone['name'])
+    popup = (
+        f"<div style='width: 200px'><h4>{name}</h4><p>{html.escape(zone['description'])}</p>"
+        f"<p style='color: {zone['color']}; font-weight: bold;'>Ограниченная зона</p></div>"
+    )
+    return {
+        'zone_key': zone['zone_key'],
+        'valid_from': zone['valid_from'],
+        'valid_until': zone['valid_until'],
+        'area': {
+            'name': zone['name'],
+            'description': zone['description'],
+            'coordinates': ring,
+            'color': zone['color'],
+        },
+        # GeoJSON wants [longitude, latitude]. The feature id spares folium
+        # from writing ids into this shared dict.
+        'feature': {
+            'type': 'Feature',
+            'id': zone['zone_key'],
+            'geometry': {'type': 'Polygon', 'coordinates': [[[lon, lat] for lat, lon in ring]]},
+            'properties': {
+                'color': zone['color'],
+                'popup': popup,
+                'tooltip': f"Ограниченная зона: {name}",
+            },
+        },
+    }
+
+
+def is_active(zone, at):
+    return ((zone['valid_from'] is None or zone['valid_from'] <= at)
+            and (zone['valid_until'] is None or at < zone['valid_until']))
+
+
+class ZoneRegistry:
+    """Process-wide cache of the restricted_areas table.
+
+    Rows are compiled once per table version. The active subset at a given
+    time, with its Geofence and GeoJSON, is built once per distinct set of
+    active zones, so validity periods starting or ending don't need a reload.
+    """
+
+    def __init__(self, check_seconds=VERSION_CHECK_SECONDS):
+        self.check_seconds = check_seconds
+        self._state = (None, [], {})  # (version, compiled zones, active keys -> ZoneSet)
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self._state[0]
+
+    def refresh(self, force=False):
+        """Reload if the table's version changed; checked at most every check_seconds."""
+        if not force and time.monotonic() - self._checked_at < self.check_seconds:
+            return
+        with self._lock:
+            if not force and time.monotonic() - self._checked_at < self.check_seconds:
+                return
+            with db.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(ZONES_VERSION_QUERY)
+                    version = cur.fetchone()[0]
+                    if version != self._state[0]:
+                        with metrics.timed('zones_reload_seconds'):
+                            cur.execute(LOAD_ZONES_QUERY)
+                            rows = cur.fetchall()
+                            zones = [_compile(_row_to_zone(row)) for row in rows if row[1] is not None]
+                            self._state = (rows[0][0], zones, {})
+                        metrics.count('zones_reloads')
+            self._checked_at = time.monotonic()
+
+    def seed(self, version, zones):
+        """Start from zones compiled by an earlier process (warm_start) until
+        the table is first read; the next version check is due in
+        check_seconds. False if the table was already read."""
+        with self._lock:
+            if self._state[0] is not None:
+                return False
+            self._state = (version, zones, {})
+            self._checked_at = time.monotonic()
+            return True
+
+    def compiled(self):
+        """(version, compiled zones) as last read from the table."""
+        version, zones, _ = self._state
+        return version, zones
+
+    def active(self, at=None):
+        """ZoneSet of the zones active at `at` (default: now)."""
+        self.refresh()
+        at = at or datetime.now()
+        version, zones, built = self._state
+        active = [zone for zone in zones if is_active(zone, at)]
+        keys = tuple(zone['zone_key'] for zone in active)
+        zone_set = built.get(keys)
+        if zone_set is None:
+            areas = {zone['zone_key']: zone['area'] for zone in active}
+            zone_set = ZoneSet(
+                key=(version, keys),
+                areas=areas,
+                geofence=Geofence(areas),
+                geojson={'type': 'FeatureCollection', 'features': [zone['feature'] for zone in active]},
+            )
+            built[keys] = zone_set
+        return zone_set
+
+
+_registry = ZoneRegistry()
+
+
+def get_registry():
+    return _registry
+
+
+def active_zones(at=None):
+    return _registry.active(at)
+
+
+def _parse_coordinates(text):
+    # "lat,lon;lat,lon;..."
+    return [[float(value) for value in point.split(',')] for point in text.split(';') if point.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage restricted areas")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("list", help="print all zones as JSON")
+
+    add_parser = subparsers.add_parser("add", help="create a zone")
+    add_parser.add_argument("zone_key")
+    add_parser.add_argument("--name", required=True)
+    add_parser.add_argument("--coordinates", required=True, help='vertices as "lat,lon;lat,lon;..."')
+    add_parser.add_argument("--color", choices=COLORS, default="red")
+    add_parser.add_argument("--description", default="")
+    add_parser.add_argument("--valid-from", type=datetime.fromisoformat)
+    add_parser.add_argument("--valid-until", type=datetime.fromisoformat)
+
+    update_parser = subparsers.add_parser("update", help="change a zone")
+    update_parser.add_argument("zone_key")
+    update_parser.add_argument("--name")
+    update_parser.add_argument("--coordinates", help='vertices as "lat,lon;lat,lon;..."')
+    update_parser.add_argument("--color", choices=COLORS)
+    update_parser.add_argument("--description")
+    update_parser.add_argument("--valid-from", type=datetime.fromisoformat)
+    update_parser.add_argument("--valid-until", type=datetime.fromisoformat)
+    update_parser.add_argument("--permanent", action="store_true", help="clear the validity period")
+
+    remove_parser = subparsers.add_parser("remove", help="delete a zone")
+    remove_parser.add_argument("zone_key")
+
+    import_parser = subparsers.add_parser("import", help="insert or replace zones from a JSON file")
+    import_parser.add_argument("path", help="JSON object of zones keyed like RESTRICTED_AREAS")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "list":
+            json.dump(list_zones(), sys.stdout, ensure_ascii=False, indent=2, default=str)
+            print()
+        elif args.command == "add":
+            create_zone(args.zone_key, args.name, _parse_coordinates(args.coordinates), args.color,
+                        args.description, args.valid_from, args.valid_until)
+            print(f"Created zone {args.zone_key}")
+        elif args.command == "update":
+            fields = {
+                field: getattr(args, field)
+                for field in ('name', 'description', 'color', 'valid_from', 'valid_until')
+                if getattr(args, field) is not None
+            }
+            if args.coordinates:
+                fields['coordinates'] = _parse_coordinates(args.coordinates)
+            if args.permanent:
+                fields.update(valid_from=None, valid_until=None)
+            if not update_zone(args.zone_key, **fields):
+                print(f"Error: no zone {args.zone_key}")
+                sys.exit(1)
+            print(f"Updated zone {args.zone_key}")
+        elif args.command == "remove":
+            if not delete_zone(args.zone_key):
+                print(f"Error: no zone {args.zone_key}")
+                sys.exit(1)
+            print(f"Removed zone {args.zone_key}")
+        else:
+            with open(args.path) as f:
+                count = import_zones(json.load(f))
+            print(f"Imported {count} zones")
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)